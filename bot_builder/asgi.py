@@ -1,6 +1,31 @@
 import os
-from django.core.asgi import get_asgi_application
+import time
+
+_boot_started = time.perf_counter()
+
+from django.core.asgi import get_asgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bot_builder.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+django_application = get_asgi_application()
+
+# Импорт после get_asgi_application(): приложения Django должны быть загружены
+from bots.consumers import websocket_application  # noqa: E402
+from bots.deadlines import cancel_on_disconnect  # noqa: E402
+from bots import warmup  # noqa: E402
+
+# Отключение клиента отменяет вызов модели, а не ждет его до конца
+django_application = cancel_on_disconnect(django_application)
+
+# Кеши заполняются до того, как воркер начнет принимать запросы
+warmup.start(boot_started=_boot_started)
+
+
+async def application(scope, receive, send):
+    """
+    HTTP обслуживает Django, WebSocket — чат-консьюмер из приложения bots
+    """
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -1,4 +1,5 @@
 # bot_builder/settings.py
+import ipaddress
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -74,6 +75,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'bot_builder.wsgi.application'
+ASGI_APPLICATION = 'bot_builder.asgi.application'
 
 # ===== ПАРОЛИ =====
 AUTH_PASSWORD_VALIDATORS = [
@@ -116,19 +118,138 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
+    # JSON через orjson, если он установлен (иначе — стандартный JSON DRF)
+    'DEFAULT_RENDERER_CLASSES': [
+        'bots.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'bots.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
 
+# Условные GET ботов, сценариев и шагов: сколько секунд nginx может отдавать
+# ответ из своего кеша, прежде чем сверить его с Django по ETag (0 — не кешировать)
+API_CONDITIONAL_PROXY_TTL = int(os.getenv('API_CONDITIONAL_PROXY_TTL', 5))
+
+# Выгрузка выполнений (/api/executions/export/, export_executions):
+# строк на одно чтение курсора и одну отправляемую часть ответа
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
 # ===== CORS НАСТРОЙКИ =====
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
 
+# ===== КЕШ =====
+# Redis общий для всех воркеров; без него — локальная память процесса
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# ===== ФОНОВЫЕ ЗАДАЧИ =====
+# Потоки процесса для работы вне запроса (сжатие истории, индексация)
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 2))
+# Статистика ботов (BotUsageRollup): как часто счетчики процесса записываются в базу, сек
+USAGE_FLUSH_INTERVAL = float(os.getenv('USAGE_FLUSH_INTERVAL', 5))
+
+# ===== ПРОГРЕВ ВОРКЕРА =====
+# Перед первыми запросами воркер загружает сценарии и индексы активных ботов,
+# но не дольше WARMUP_BUDGET секунд (должно быть меньше таймаута gunicorn)
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'True').lower() == 'true'
+WARMUP_BUDGET = float(os.getenv('WARMUP_BUDGET', 10))
+
+# ===== БАЗА ЗНАНИЙ =====
+# Файлы поисковых индексов ботов; по умолчанию рядом с БД, на том же томе
+KNOWLEDGE_INDEX_DIR = os.getenv('KNOWLEDGE_INDEX_DIR', str(BASE_DIR / 'db' / 'knowledge'))
+
+# ===== ШАГИ API_CALL =====
+# Общий пул соединений к внешним API и не больше N параллельных запросов к хосту
+API_CALL_MAX_CONNECTIONS = int(os.getenv('API_CALL_MAX_CONNECTIONS', 100))
+API_CALL_HOST_CONCURRENCY = int(os.getenv('API_CALL_HOST_CONCURRENCY', 10))
+# Таймаут запроса по умолчанию и наибольший допустимый в шаге (сек)
+API_CALL_TIMEOUT = float(os.getenv('API_CALL_TIMEOUT', 5))
+API_CALL_MAX_TIMEOUT = float(os.getenv('API_CALL_MAX_TIMEOUT', 15))
+# Кеш ответов GET с cache_ttl шага
+API_CALL_CACHE_MAX_ENTRIES = int(os.getenv('API_CALL_CACHE_MAX_ENTRIES', 1000))
+# Автомат хоста: столько ошибок подряд отключают хост на API_CALL_BREAKER_RESET сек
+API_CALL_BREAKER_FAILURES = int(os.getenv('API_CALL_BREAKER_FAILURES', 5))
+API_CALL_BREAKER_RESET = float(os.getenv('API_CALL_BREAKER_RESET', 30))
+API_CALL_MAX_RESPONSE_BYTES = int(os.getenv('API_CALL_MAX_RESPONSE_BYTES', 64 * 1024))
+# Хосты, к которым могут обращаться шаги (как ALLOWED_HOSTS: '.example.com' —
+# домен с поддоменами, '*' — любой)
+API_CALL_ALLOWED_HOSTS = [
+    host.strip().lower() for host in os.getenv('API_CALL_ALLOWED_HOSTS', '*').split(',') if host.strip()
+]
+# Адреса внутренней сети (loopback, частные, link-local) запрещены, кроме сетей
+# из этого списка через запятую: '172.16.0.0/12' — сервисы в сети docker,
+# '127.0.0.1/32' — локальная заглушка в тестах. По умолчанию пусто
+API_CALL_ALLOWED_PRIVATE_NETWORKS = [
+    ipaddress.ip_network(network.strip(), strict=False) for network in os.getenv('API_CALL_ALLOWED_PRIVATE_NETWORKS', '').split(',') if network.strip()
+]
+
+# ===== ЗАГЛУШКА GPT: НАМЕРЕНИЯ =====
+# Корпус примеров и ответов по персонам для классификатора намерений
+CHAT_INTENT_CORPUS = os.getenv('CHAT_INTENT_CORPUS', str(BASE_DIR / 'bots' / 'data' / 'intents.json'))
+
+# ===== ЧАТ =====
+# Сколько секунд хранится ответ на запрос с заголовком Idempotency-Key
+CHAT_IDEMPOTENCY_TTL = int(os.getenv('CHAT_IDEMPOTENCY_TTL', 24 * 60 * 60))
+# Сколько секунд повтор ждет завершения исходного запроса с тем же ключом
+CHAT_IDEMPOTENCY_WAIT = float(os.getenv('CHAT_IDEMPOTENCY_WAIT', 30))
+# Кеш ответов ботов с cache_responses: 'local' (LRU в памяти процесса) или 'redis'
+CHAT_RESPONSE_CACHE_BACKEND = os.getenv(
+    'CHAT_RESPONSE_CACHE_BACKEND', 'redis' if REDIS_URL else 'local'
+)
+CHAT_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('CHAT_RESPONSE_CACHE_MAX_ENTRIES', 10000))
+# Планировщик вызовов модели: параллельных вызовов на одну gpt_model,
+# длина очереди одного бота и максимальное ожидание слота (сек)
+CHAT_SCHEDULER_MODEL_CONCURRENCY = int(os.getenv('CHAT_SCHEDULER_MODEL_CONCURRENCY', 8))
+CHAT_SCHEDULER_QUEUE_SIZE = int(os.getenv('CHAT_SCHEDULER_QUEUE_SIZE', 20))
+CHAT_SCHEDULER_MAX_WAIT = float(os.getenv('CHAT_SCHEDULER_MAX_WAIT', 20))
+# Дедлайн ответа модели (сек): меньше proxy_read_timeout nginx (60 с)
+CHAT_DEADLINE_SECONDS = float(os.getenv('CHAT_DEADLINE_SECONDS', 55))
+# Хеджирование: второй запрос к модели, если первый дольше наблюдаемого p95
+CHAT_HEDGE_REQUESTS = os.getenv('CHAT_HEDGE_REQUESTS', 'False').lower() == 'true'
+CHAT_HEDGE_MIN_SAMPLES = int(os.getenv('CHAT_HEDGE_MIN_SAMPLES', 20))
+CHAT_HEDGE_WORKERS = int(os.getenv('CHAT_HEDGE_WORKERS', 16))
+# Ограничение частоты сообщений: хранилище корзин ('local' или 'redis')
+# и лимит одного пользователя в минуту по всем ботам (0 — без ограничения)
+CHAT_RATE_LIMIT_BACKEND = os.getenv('CHAT_RATE_LIMIT_BACKEND', 'redis' if REDIS_URL else 'local')
+CHAT_RATE_LIMIT_USER = int(os.getenv('CHAT_RATE_LIMIT_USER', 60))
+# Пакетный чат: элементов в одном запросе и параллельных генераций на процесс
+CHAT_BATCH_MAX_ITEMS = int(os.getenv('CHAT_BATCH_MAX_ITEMS', 100))
+CHAT_BATCH_WORKERS = int(os.getenv('CHAT_BATCH_WORKERS', 16))
+# Фоновое сжатие длинных разговоров: после CHAT_SUMMARY_THRESHOLD несжатых
+# сообщений ранние ходы сворачиваются в краткое содержание, последние
+# CHAT_SUMMARY_KEEP сообщений остаются как есть
+CHAT_SUMMARY_THRESHOLD = int(os.getenv('CHAT_SUMMARY_THRESHOLD', 40))
+CHAT_SUMMARY_KEEP = int(os.getenv('CHAT_SUMMARY_KEEP', 20))
+
 # ===== OPENAI (заглушка) =====
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', 'demo-mode-no-key-required')
+# Задержка заглушки (сек) и редкие медленные ответы для проверки дедлайнов
+GPT_STUB_DELAY_MIN = float(os.getenv('GPT_STUB_DELAY_MIN', 1.0))
+GPT_STUB_DELAY_MAX = float(os.getenv('GPT_STUB_DELAY_MAX', 2.0))
+GPT_STUB_TAIL_PROBABILITY = float(os.getenv('GPT_STUB_TAIL_PROBABILITY', 0))
+GPT_STUB_TAIL_DELAY = float(os.getenv('GPT_STUB_TAIL_DELAY', 10))
 
 # ===== БЕЗОПАСНОСТЬ ДЛЯ ПРОДАКШЕНА (опционально для учебного) =====
 if not DEBUG:
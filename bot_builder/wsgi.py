@@ -1,6 +1,14 @@
 import os
-from django.core.wsgi import get_wsgi_application
+import time
+
+_boot_started = time.perf_counter()
+
+from django.core.wsgi import get_wsgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bot_builder.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+from bots import warmup  # noqa: E402
+
+warmup.start(boot_started=_boot_started)
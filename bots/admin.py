@@ -1,17 +1,162 @@
+from datetime import datetime, timedelta
+
 from django.contrib import admin
-from .models import Bot, Scenario, Step, BotExecution
+from django.core.paginator import Paginator
+from django.db.models import Max, Min, Q, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from .models import Bot, Scenario, ScenarioSnapshot, Step, BotExecution, KnowledgeDocument
+from . import search
+
+# Сколько найденных полнотекстовым поиском объектов показывает админка
+ADMIN_SEARCH_LIMIT = 1000
+# Больше этого числа строк отфильтрованного списка админка не пересчитывает
+ADMIN_COUNT_LIMIT = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Постраничный вывод больших таблиц без COUNT(*) по всей таблице: без
+    фильтров число строк оценивается по диапазону id (два чтения индекса
+    первичного ключа), с фильтрами считается не больше ADMIN_COUNT_LIMIT строк
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        if not queryset.query.where:
+            bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+            if bounds['last'] is None:
+                return 0
+            return bounds['last'] - bounds['first'] + 1
+        return queryset[:ADMIN_COUNT_LIMIT].count()
+
+
+class IndexedDatesQuerySet(QuerySet):
+    """
+    Даты для date_hierarchy админки без SELECT DISTINCT по всей таблице:
+    каждый год, месяц или день между первой и последней датой проверяется
+    запросом EXISTS по диапазону, который обслуживает индекс поля
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None, is_dst=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo, is_dst)
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        tzinfo = tzinfo or timezone.get_current_timezone()
+        first, last = bounds['first'].astimezone(tzinfo), bounds['last'].astimezone(tzinfo)
+        found = []
+        start = _truncate(first, kind)
+        while start <= last:
+            end = _next_period(start, kind)
+            if self.filter(**{f'{field_name}__gte': start, f'{field_name}__lt': end}).exists():
+                found.append(start)
+            start = end
+        return found if order == 'ASC' else found[::-1]
+
+
+def _truncate(moment, kind):
+    return timezone.make_aware(datetime(
+        moment.year,
+        moment.month if kind != 'year' else 1,
+        moment.day if kind == 'day' else 1,
+    ), moment.tzinfo)
 
 
-class StepInline(admin.TabularInline):
+def _next_period(start, kind):
+    if kind == 'year':
+        naive = datetime(start.year + 1, 1, 1)
+    elif kind == 'month':
+        naive = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    else:
+        naive = datetime(start.year, start.month, start.day) + timedelta(days=1)
+    return timezone.make_aware(naive, start.tzinfo)
+
+
+class SelectedObjectFilter(admin.SimpleListFilter):
+    """
+    Фильтр по связанному объекту без списка всех объектов в боковой панели:
+    значение выбирается ссылкой в колонке списка, в панели — только
+    выбранный объект и "Все"
+    """
+    model = None
+    field = None
+
+    def _selected_id(self):
+        value = self.value()
+        return int(value) if value and value.isdigit() else None
+
+    def lookups(self, request, model_admin):
+        selected_id = self._selected_id()
+        if selected_id is None:
+            return []
+        obj = self.model.objects.filter(pk=selected_id).only('name').first()
+        return [(str(selected_id), obj.name if obj is not None else selected_id)]
+
+    def queryset(self, request, queryset):
+        selected_id = self._selected_id()
+        if selected_id is not None:
+            return queryset.filter(**{f'{self.field}_id': selected_id})
+        return queryset
+
+
+class BotFilter(SelectedObjectFilter):
+    title = 'бот'
+    parameter_name = 'bot'
+    model = Bot
+    field = 'bot'
+
+
+class ScenarioFilter(SelectedObjectFilter):
+    title = 'сценарий'
+    parameter_name = 'scenario'
+    model = Scenario
+    field = 'scenario'
+
+
+class StepChoicesMixin:
+    """
+    Выбранные шаги в полях автодополнения подписываются вместе со
+    сценарием одним запросом на поле
+    """
+    step_fields = ('next_step', 'initial_step', 'current_step')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.step_fields:
+            kwargs['queryset'] = Step.objects.select_related('scenario')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class StepInline(StepChoicesMixin, admin.TabularInline):
     model = Step
     extra = 1
     fields = ['name', 'step_type', 'order', 'next_step']
+    autocomplete_fields = ['next_step']
 
+    def get_queryset(self, request):
+        # Подпись шага содержит название сценария
+        return super().get_queryset(request).select_related('scenario')
 
-class ScenarioInline(admin.TabularInline):
+
+class ScenarioSnapshotInline(admin.TabularInline):
+    model = ScenarioSnapshot
+    extra = 0
+    fields = ['version', 'revision', 'step_count', 'published_by', 'created_at']
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class ScenarioInline(StepChoicesMixin, admin.TabularInline):
     model = Scenario
     extra = 1
     fields = ['name', 'is_active', 'initial_step']
+    autocomplete_fields = ['initial_step']
 
 
 @admin.register(Bot)
@@ -27,6 +172,11 @@ class BotAdmin(admin.ModelAdmin):
         ('Настройки GPT', {
             'fields': ('bot_type', 'gpt_model', 'temperature', 'max_tokens', 'system_prompt')
         }),
+        ('Производительность', {
+            'fields': ('coalesce_requests', 'cache_responses', 'cache_ttl',
+                       'max_concurrency', 'schedule_weight',
+                       'rate_limit_session', 'rate_limit_bot', 'knowledge_top_k')
+        }),
         ('Статус', {
             'fields': ('is_active',)
         }),
@@ -34,26 +184,82 @@ class BotAdmin(admin.ModelAdmin):
 
 
 @admin.register(Scenario)
-class ScenarioAdmin(admin.ModelAdmin):
-    list_display = ['name', 'bot', 'is_active', 'created_at']
+class ScenarioAdmin(StepChoicesMixin, admin.ModelAdmin):
+    list_display = ['name', 'bot', 'is_active', 'published_version', 'created_at']
     list_filter = ['is_active', 'bot', 'created_at']
+    list_select_related = ['bot']
     search_fields = ['name', 'description']
-    inlines = [StepInline]
+    inlines = [StepInline, ScenarioSnapshotInline]
     filter_horizontal = []
-    readonly_fields = ['created_at', 'updated_at']
+    autocomplete_fields = ['bot', 'initial_step']
+    readonly_fields = ['revision', 'published_version', 'created_at', 'updated_at']
+
+    def get_queryset(self, request):
+        # Название сценария в автодополнении содержит название бота
+        return super().get_queryset(request).select_related('bot')
 
 
 @admin.register(Step)
-class StepAdmin(admin.ModelAdmin):
-    list_display = ['name', 'step_type', 'scenario', 'order', 'created_at']
-    list_filter = ['step_type', 'scenario', 'created_at']
+class StepAdmin(StepChoicesMixin, admin.ModelAdmin):
+    list_display = ['name', 'step_type', 'scenario_link', 'order', 'created_at']
+    list_filter = ['step_type', ScenarioFilter, 'created_at']
     search_fields = ['name', 'content']
+    search_help_text = 'Полнотекстовый поиск по названию и тексту шага'
+    autocomplete_fields = ['scenario', 'next_step']
     readonly_fields = ['created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Название шага в списке и автодополнении содержит название сценария
+        return super().get_queryset(request).select_related('scenario')
+
+    @admin.display(description='Сценарий', ordering='scenario')
+    def scenario_link(self, obj):
+        return format_html('<a href="?scenario={}">{}</a>', obj.scenario_id, obj.scenario.name)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Индекс FTS5 вместо LIKE '%...%' по JSON всех шагов
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(pk__in=search.matching_step_ids(search_term, ADMIN_SEARCH_LIMIT)), False
 
 
 @admin.register(BotExecution)
-class BotExecutionAdmin(admin.ModelAdmin):
-    list_display = ['bot', 'user_session', 'current_step', 'is_completed', 'created_at']
-    list_filter = ['is_completed', 'bot', 'created_at']
-    search_fields = ['user_session', 'bot__name']
-    readonly_fields = ['created_at', 'updated_at']
\ No newline at end of file
+class BotExecutionAdmin(StepChoicesMixin, admin.ModelAdmin):
+    list_display = ['bot_link', 'user_session', 'current_step', 'is_completed', 'created_at']
+    list_filter = ['is_completed', BotFilter]
+    list_select_related = ['bot', 'current_step__scenario']
+    date_hierarchy = 'created_at'
+    search_fields = ['user_session', 'bot__name', 'conversation_history']
+    search_help_text = 'Сессия, название бота или слова из разговора (полнотекстовый поиск)'
+    autocomplete_fields = ['bot', 'user', 'scenario', 'current_step']
+    readonly_fields = ['version', 'created_at', 'updated_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(model=queryset.model, query=queryset.query, using=queryset.db)
+
+    @admin.display(description='Бот', ordering='bot')
+    def bot_link(self, obj):
+        return format_html('<a href="?bot={}">{}</a>', obj.bot_id, obj.bot.name)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Точные совпадения сессии и бота — по индексам, слова разговора — по FTS5
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        ids = search.matching_execution_ids(term, ADMIN_SEARCH_LIMIT)
+        return queryset.filter(Q(user_session=term) | Q(bot__name=term) | Q(pk__in=ids)), False
+
+
+@admin.register(KnowledgeDocument)
+class KnowledgeDocumentAdmin(admin.ModelAdmin):
+    list_display = ['title', 'bot', 'indexed_at', 'updated_at']
+    list_filter = ['bot', 'created_at']
+    list_select_related = ['bot']
+    autocomplete_fields = ['bot']
+    search_fields = ['title', 'text']
+    readonly_fields = ['indexed_at', 'created_at', 'updated_at']
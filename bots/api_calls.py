@@ -0,0 +1,340 @@
+# bots/api_calls.py
+import asyncio
+import ipaddress
+import json
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+
+from . import metrics
+from .deadlines import POLL_INTERVAL
+
+
+class ApiCallError(Exception):
+    """Внешний вызов шага api_call не удался"""
+
+
+class CircuitOpen(ApiCallError):
+    """Хост недавно отвечал ошибками — вызов отклонен без запроса"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f'{host} недоступен, повтор через {retry_after} с')
+        self.retry_after = retry_after
+
+
+def is_ip_literal(host):
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def _ip(address):
+    ip = ipaddress.ip_address(address)
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        return ip.ipv4_mapped
+    return ip
+
+
+def is_public_address(address):
+    """
+    Адрес в интернете, а не loopback, частная сеть, link-local (в том числе
+    метаданные облака 169.254.169.254) или служебный диапазон
+    """
+    try:
+        ip = _ip(address)
+    except ValueError:
+        return False
+    return ip.is_global and not ip.is_multicast
+
+
+def is_allowed_address(address):
+    """
+    Публичный адрес или адрес из API_CALL_ALLOWED_PRIVATE_NETWORKS —
+    внутренних сетей, куда шагам разрешено ходить явно (сервисы в той же
+    сети docker, тестовая заглушка на localhost)
+    """
+    if is_public_address(address):
+        return True
+    try:
+        ip = _ip(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in settings.API_CALL_ALLOWED_PRIVATE_NETWORKS)
+
+
+class CircuitBreaker:
+    """
+    Автомат хоста: после failure_threshold ошибок подряд вызовы сразу
+    отклоняются reset_timeout секунд, затем пропускается один пробный
+    вызов — успех закрывает автомат, ошибка открывает снова. Пробный вызов,
+    который так и не завершился, через reset_timeout уступает место новому.
+    Используется только из потока событийного цикла, без блокировок.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.probe_started = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def retry_after(self):
+        return max(1, int(self.opened_at + self.reset_timeout - time.monotonic()) + 1)
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_timeout:
+            return False
+        if self.probing and now - self.probe_started < self.reset_timeout:
+            return False
+        self.probing = True
+        self.probe_started = now
+        return True
+
+    def release_probe(self, started):
+        """
+        Пробный вызов, начатый в started, отменен без ответа: следующий
+        вызов станет новым пробным
+        """
+        if self.probing and self.probe_started == started:
+            self.probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                metrics.increment('api_calls.breaker_opened')
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+
+class ApiCallExecutor:
+    """
+    Внешние HTTP-вызовы шагов сценария через общий асинхронный пул соединений
+
+    Пул httpx.AsyncClient живет в отдельном потоке со своим событийным
+    циклом: синхронный код чата ставит туда запрос и ждет результата.
+    Не больше host_concurrency одновременных запросов к одному хосту,
+    у каждого запроса таймаут. Ответы GET кешируются на cache_ttl шага,
+    а хост, который подряд отвечает ошибками, отключается автоматом.
+    Соединение идет на адрес, проверенный после разрешения DNS: запросы
+    во внутреннюю сеть (loopback, частные и link-local адреса) отклоняются,
+    если сеть не разрешена в API_CALL_ALLOWED_PRIVATE_NETWORKS.
+    """
+
+    def __init__(self, max_connections, host_concurrency, cache_max_entries,
+                 breaker_failures, breaker_reset):
+        self.max_connections = max_connections
+        self.host_concurrency = host_concurrency
+        self.cache_max_entries = cache_max_entries
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._semaphores = {}
+        self._breakers = {}
+        self._cache = OrderedDict()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='api-calls', daemon=True).start()
+                self._client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                    follow_redirects=False,
+                )
+                self._loop = loop
+        return self._loop
+
+    def request(self, method, url, timeout, params=None, headers=None, body=None, cache_ttl=0,
+                deadline=None):
+        """
+        Выполняет запрос и возвращает разобранный JSON или текст ответа;
+        ApiCallError при ошибке, таймауте или открытом автомате хоста.
+        С дедлайном хода ожидание не дольше оставшегося времени: по его
+        истечении или отмене — DeadlineExceeded или RequestCancelled
+        """
+        if deadline is not None:
+            deadline.check()
+            timeout = min(timeout, deadline.remaining())
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(
+            self._request(method, url, timeout, params, headers, body, cache_ttl), loop
+        )
+        # Запас на ожидание в очереди хоста: сам запрос ограничен внутри цикла
+        wait_until = time.monotonic() + timeout * 2 + 1
+        try:
+            if deadline is None:
+                return future.result(wait_until - time.monotonic())
+            wait_until = min(wait_until, deadline.expires_at)
+            while True:
+                try:
+                    return future.result(max(min(POLL_INTERVAL, wait_until - time.monotonic()), 0))
+                except TimeoutError:
+                    if deadline.cancelled or time.monotonic() >= wait_until:
+                        raise
+        except TimeoutError:
+            future.cancel()
+            if deadline is not None:
+                deadline.check()
+            raise ApiCallError(f'Нет ответа от {urlsplit(url).hostname} за {timeout:g} с')
+
+    async def _request(self, method, url, timeout, params, headers, body, cache_ttl):
+        host = urlsplit(url).netloc
+        cache_key = None
+        if method == 'GET' and cache_ttl:
+            cache_key = json.dumps([url, params, headers], sort_keys=True, ensure_ascii=False)
+            cached = self._cache.get(cache_key)
+            if cached is not None and cached[0] > time.monotonic():
+                self._cache.move_to_end(cache_key)
+                metrics.increment('api_calls.cache_hits')
+                return cached[1]
+
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.breaker_failures, self.breaker_reset)
+        if not breaker.allow():
+            metrics.increment('api_calls.rejected')
+            raise CircuitOpen(host, breaker.retry_after())
+        probe_started = breaker.probe_started if breaker.probing else None
+
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.host_concurrency)
+
+        metrics.increment('api_calls.requests')
+        try:
+            async with semaphore:
+                response, content = await asyncio.wait_for(
+                    self._fetch(method, url, params, headers, body),
+                    timeout,
+                )
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            metrics.increment('api_calls.failures')
+            raise ApiCallError(f'Нет ответа от {host} за {timeout} с')
+        except httpx.HTTPError as e:
+            breaker.record_failure()
+            metrics.increment('api_calls.failures')
+            raise ApiCallError(f'Ошибка запроса к {host}: {e.__class__.__name__}')
+        except ApiCallError:
+            # Хост не найден или во внутренней сети
+            breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            # Дедлайн хода истек или клиент ушел: ответа нет ни в какую сторону
+            if probe_started is not None:
+                breaker.release_probe(probe_started)
+            raise
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+            metrics.increment('api_calls.failures')
+            raise ApiCallError(f'{host} ответил {response.status_code}')
+        breaker.record_success()
+        if response.status_code >= 400:
+            raise ApiCallError(f'{host} ответил {response.status_code}')
+        if content is None:
+            raise ApiCallError('Ответ слишком большой')
+
+        result = self._parse(response, content)
+        if cache_key is not None:
+            self._cache[cache_key] = (time.monotonic() + cache_ttl, result)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    async def _resolve(self, hostname, port):
+        """
+        Адрес хоста для соединения: все адреса из DNS должны быть публичными
+        (или из API_CALL_ALLOWED_PRIVATE_NETWORKS), иначе имя, указывающее
+        во внутреннюю сеть, открыло бы к ней доступ
+        """
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(hostname, port, type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError):
+            raise ApiCallError(f'Хост {hostname} не найден')
+        addresses = [info[4][0] for info in infos]
+        if not addresses or not all(is_allowed_address(address) for address in addresses):
+            metrics.increment('api_calls.blocked')
+            raise ApiCallError(f'Запросы к {hostname} запрещены: адрес во внутренней сети')
+        return addresses[0]
+
+    async def _fetch(self, method, url, params, headers, body):
+        """
+        Запрос на проверенный адрес хоста (Host и SNI — исходное имя) и чтение
+        тела частями: больше API_CALL_MAX_RESPONSE_BYTES не читается.
+        (ответ, тело или None, если оно слишком большое)
+        """
+        request = self._client.build_request(method, url, params=params, headers=headers, json=body)
+        hostname = request.url.host
+        address = await self._resolve(hostname, request.url.port or (443 if request.url.scheme == 'https' else 80))
+        if address != hostname:
+            request.url = request.url.copy_with(host=address)
+            if request.url.scheme == 'https':
+                request.extensions['sni_hostname'] = hostname
+
+        limit = settings.API_CALL_MAX_RESPONSE_BYTES
+        response = await self._client.send(request, stream=True)
+        try:
+            if response.status_code >= 400:
+                return response, b''
+            length = response.headers.get('content-length', '')
+            if length.isdigit() and int(length) > limit:
+                return response, None
+            content = bytearray()
+            async for chunk in response.aiter_bytes():
+                content += chunk
+                if len(content) > limit:
+                    return response, None
+            return response, bytes(content)
+        finally:
+            await response.aclose()
+
+    @staticmethod
+    def _parse(response, content):
+        if 'json' in response.headers.get('content-type', ''):
+            try:
+                return json.loads(content)
+            except ValueError:
+                raise ApiCallError('Некорректный JSON в ответе')
+        return content.decode(response.encoding or 'utf-8', errors='replace')
+
+    def open_circuits(self):
+        return sorted(host for host, breaker in list(self._breakers.items()) if breaker.is_open)
+
+
+executor = ApiCallExecutor(
+    max_connections=settings.API_CALL_MAX_CONNECTIONS,
+    host_concurrency=settings.API_CALL_HOST_CONCURRENCY,
+    cache_max_entries=settings.API_CALL_CACHE_MAX_ENTRIES,
+    breaker_failures=settings.API_CALL_BREAKER_FAILURES,
+    breaker_reset=settings.API_CALL_BREAKER_RESET,
+)
+
+metrics.register_gauge('api_calls.open_circuits', executor.open_circuits)
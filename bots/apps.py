@@ -3,4 +3,15 @@ from django.apps import AppConfig
 class BotsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bots'
-    verbose_name = 'Боты'
\ No newline at end of file
+    verbose_name = 'Боты'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import warmup
+        from .intents import get_classifier
+
+        # Матрицы классификатора намерений считаются при старте, а не на первом сообщении
+        get_classifier()
+        # Сценарии и индексы из базы прогревает warmup.start() из asgi.py/wsgi.py:
+        # ready() выполняется и для manage.py migrate, когда таблиц еще может не быть
+        warmup.mark('apps_ready')
@@ -0,0 +1,190 @@
+# bots/batch.py
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import metrics, tasks, usage
+from .chat import TURN_COLUMNS, TurnConflict, append_turn, get_bot_config, generate_reply, is_resumable
+from .context import build_context
+from .deadlines import DeadlineExceeded, RequestCancelled
+from .knowledge import retrieve
+from .models import Bot, BotExecution, Scenario
+from .ratelimit import check_chat_limits
+from .runtime import advance_scenario
+from .scheduler import SchedulerBusy
+
+logger = logging.getLogger(__name__)
+
+# Общий на процесс пул: сколько бы пакетов ни пришло, одновременно
+# генерируется не больше CHAT_BATCH_WORKERS ответов
+_executor = ThreadPoolExecutor(max_workers=settings.CHAT_BATCH_WORKERS, thread_name_prefix='chat-batch')
+
+
+def _error(status, message, **extra):
+    return dict(success=False, status=status, error=message, **extra)
+
+
+def run_batch(items, user, deadline):
+    """
+    Сообщения многих сессий одним запросом. items — проверенные элементы
+    {bot, user_session, message, scenario_id}; результат — список той же
+    длины, у каждого элемента свой status, ошибка одного не мешает другим.
+
+    Боты, сценарии и выполнения загружаются тремя запросами на весь пакет,
+    ответы генерируются параллельно (сообщения одной сессии — по порядку),
+    а выполнения сохраняются одной транзакцией в конце. Если сессию за это
+    время продолжил другой запрос, ее элементы получают 409.
+    """
+    results = [None] * len(items)
+    bots = Bot.objects.in_bulk({item['bot'] for item in items})
+    scenario_ids = {item['scenario_id'] for item in items if item.get('scenario_id')}
+    scenarios = Scenario.objects.in_bulk(scenario_ids) if scenario_ids else {}
+
+    groups = {}
+    for index, item in enumerate(items):
+        bot = bots.get(item['bot'])
+        if bot is None:
+            results[index] = _error(404, 'Бот не найден')
+            continue
+        retry_after = check_chat_limits(bot.pk, user.pk, item['user_session'])
+        if retry_after:
+            results[index] = _error(429, 'Слишком много сообщений', retry_after=retry_after)
+            continue
+        groups.setdefault((bot.pk, item['user_session']), []).append(index)
+    if not groups:
+        return results
+
+    executions = {}
+    existing = (
+        BotExecution.objects
+        .filter(bot_id__in={key[0] for key in groups},
+                user=user,
+                user_session__in={key[1] for key in groups},
+                is_completed=False)
+        .order_by('created_at')
+    )
+    for execution in existing:
+        # Как в resume_execution: последнее незавершенное выполнение сессии
+        if is_resumable(execution):
+            executions[(execution.bot_id, execution.user_session)] = execution
+
+    futures = []
+    for key, indices in groups.items():
+        bot = bots[key[0]]
+        execution = executions.get(key)
+        if execution is None:
+            first = items[indices[0]]
+            scenario = scenarios.get(first.get('scenario_id'))
+            if scenario is not None and scenario.bot_id != bot.pk:
+                scenario = None
+            execution = executions[key] = BotExecution(
+                bot=bot,
+                user=user,
+                scenario=scenario,
+                scenario_version=scenario.published_version if scenario is not None else None,
+                user_session=key[1],
+                conversation_history=[],
+            )
+        execution.bot = bot
+        futures.append(_executor.submit(_run_session, bot, execution, items, indices, deadline))
+
+    changed = []
+    for future in futures:
+        execution, session_results, turns = future.result()
+        for index, result in session_results:
+            results[index] = result
+        if turns:
+            changed.append((execution, turns))
+
+    conflicts = _save(changed)
+    for index, result in enumerate(results):
+        if result.get('success'):
+            execution = result.pop('execution')
+            if execution.pk in conflicts:
+                results[index] = _error(409, str(TurnConflict()))
+            else:
+                result['execution_id'] = execution.pk
+
+    metrics.increment('chat_batch.requests')
+    metrics.increment('chat_batch.items', len(items))
+    return results
+
+
+def _run_session(bot, execution, items, indices, deadline):
+    """
+    Сообщения одной сессии по порядку в потоке пула; выполнение меняется
+    только в памяти, сохраняет его run_batch. turns — учет ходов для
+    usage.record_turn
+    """
+    bot_config = get_bot_config(bot)
+    session_results, turns = [], []
+    try:
+        for index in indices:
+            message = items[index]['message']
+            # Неудачный ход не должен сдвинуть сессию по сценарию
+            saved = execution.current_step_id, dict(execution.variables), execution.context_start
+            try:
+                bot_response = advance_scenario(execution, message, deadline)
+                if bot_response is None:
+                    messages = build_context(execution, bot_config, message, retrieve(bot, message))
+                    bot_response = generate_reply(bot, messages, bot_config, deadline)
+            except Exception as e:
+                execution.current_step_id, execution.variables, execution.context_start = saved
+                session_results.append((index, _failure(e)))
+                continue
+            turns.append(append_turn(execution, message, bot_response))
+            session_results.append((index, {
+                'success': True,
+                'status': 200,
+                'response': bot_response,
+                'execution': execution,
+                'bot_name': bot.name,
+            }))
+    finally:
+        connection.close()
+    return execution, session_results, turns
+
+
+def _failure(e):
+    if isinstance(e, RequestCancelled):
+        return _error(499, str(e))
+    if isinstance(e, DeadlineExceeded):
+        return _error(504, str(e))
+    if isinstance(e, SchedulerBusy):
+        return _error(429, str(e), retry_after=e.retry_after)
+    logger.exception('Ошибка элемента пакета чата')
+    return _error(500, f'Ошибка при генерации ответа: {e}')
+
+
+def _save(changed):
+    """
+    Новые выполнения — одним bulk_create, продолженные — UPDATE с проверкой
+    версии, как в chat.save_turn. Возвращает выполнения, которые успел
+    изменить другой запрос (их id): ходы этих выполнений не сохранены
+    """
+    now = timezone.now()
+    created = [execution for execution, _ in changed if execution.pk is None]
+    conflicts = set()
+    with transaction.atomic():
+        for execution, _ in changed:
+            if execution.pk is None:
+                continue
+            execution.updated_at = now
+            version = execution.version
+            changes = {column: getattr(execution, column) for column in TURN_COLUMNS}
+            if BotExecution.objects.filter(pk=execution.pk, version=version).update(version=version + 1, **changes):
+                execution.version = version + 1
+            else:
+                conflicts.add(execution.pk)
+        if created:
+            BotExecution.objects.bulk_create(created)
+    for execution, turns in changed:
+        if execution.pk in conflicts:
+            continue
+        for tokens, last_activity in turns:
+            usage.record_turn(execution.bot_id, tokens, last_activity)
+        tasks.schedule_summary(execution)
+    return conflicts
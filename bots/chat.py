@@ -0,0 +1,260 @@
+# bots/chat.py
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Scenario, BotExecution
+from . import hedging, response_cache, tasks, usage
+from .context import estimate_tokens
+from .deadlines import DeadlineExceeded
+from .coalescing import SingleFlight
+from .scheduler import scheduler
+from .services import generate_gpt_response
+
+provider_calls = SingleFlight('coalescing')
+
+
+def get_bot_config(bot):
+    """
+    Конфигурация бота в том виде, в котором её принимает generate_gpt_response
+    """
+    return {
+        "gpt_model": bot.gpt_model,
+        "temperature": bot.temperature,
+        "max_tokens": bot.max_tokens,
+        "system_prompt": bot.system_prompt,
+        "bot_type": bot.bot_type
+    }
+
+
+def config_fingerprint(bot_config):
+    """
+    Версия конфигурации бота: меняется при любой правке параметров генерации
+    """
+    encoded = json.dumps(bot_config, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def normalize_messages(messages):
+    """
+    Контекст разговора без различий в регистре и пробелах
+    """
+    return [
+        (m.get("role", "user"), " ".join(str(m.get("content", "")).split()).casefold())
+        for m in messages
+    ]
+
+
+def request_key(bot, bot_config, messages):
+    """
+    Ключ запроса к модели: бот, версия его конфигурации и нормализованный контекст
+    """
+    encoded = json.dumps(
+        [bot.pk, config_fingerprint(bot_config), normalize_messages(messages)],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def call_provider(bot, messages, bot_config, deadline=None):
+    """
+    Вызов модели через планировщик: с лимитами бота и модели и честной очередью.
+    С дедлайном вызов прерывается по сроку или отмене, а при включенном
+    CHAT_HEDGE_REQUESTS медленный вызов дублируется после наблюдаемого p95,
+    если у бота есть свободный слот
+    """
+    model = bot_config["gpt_model"]
+    timeout = deadline.remaining() if deadline is not None else None
+    with scheduler.slot(bot.pk, model, bot.schedule_weight, bot.max_concurrency, timeout):
+        started = time.monotonic()
+        try:
+            if deadline is None:
+                bot_response = generate_gpt_response(messages, bot_config)
+            else:
+                hedge_after = hedging.latency.percentile(model) if settings.CHAT_HEDGE_REQUESTS else None
+                if hedge_after is None:
+                    bot_response = generate_gpt_response(messages, bot_config, deadline)
+                else:
+                    # Дубль занимает свой слот бота: вместе с основным вызовом
+                    # они не превышают max_concurrency
+                    bot_response = hedging.hedged_call(
+                        lambda attempt: generate_gpt_response(messages, bot_config, attempt),
+                        deadline, hedge_after,
+                        hedge_slot=lambda: scheduler.try_slot(bot.pk, model, bot.max_concurrency)
+                    )
+        except DeadlineExceeded:
+            # Вызов не уложился в срок: его длительность — нижняя оценка,
+            # но без нее медленные вызовы не попадали бы в p95
+            hedging.latency.observe(model, time.monotonic() - started)
+            raise
+        elapsed = time.monotonic() - started
+        hedging.latency.observe(model, elapsed)
+        usage.record_provider_call(bot.pk, elapsed)
+        return bot_response
+
+
+def generate_reply(bot, messages, bot_config=None, deadline=None):
+    """
+    Ответ модели с учетом настроек бота: для cache_responses ответ берется
+    из кеша, а одинаковые одновременные запросы к боту с coalesce_requests
+    выполняются одним вызовом
+    """
+    if bot_config is None:
+        bot_config = get_bot_config(bot)
+    if not (bot.cache_responses or bot.coalesce_requests):
+        return call_provider(bot, messages, bot_config, deadline)
+
+    key = request_key(bot, bot_config, messages)
+    if bot.cache_responses:
+        cache_key = response_cache.entry_key(bot.pk, key)
+        cached = response_cache.get_response(cache_key)
+        if cached is not None:
+            return cached
+
+    if bot.coalesce_requests:
+        # Общий вызов не отменяется, если отключился один из клиентов
+        shared = deadline.detached() if deadline is not None else None
+        try:
+            bot_response = provider_calls.do(
+                key, call_provider, bot, messages, bot_config, shared,
+                timeout=deadline.remaining() if deadline is not None else None
+            )
+        except TimeoutError:
+            raise DeadlineExceeded()
+    else:
+        bot_response = call_provider(bot, messages, bot_config, deadline)
+
+    if bot.cache_responses:
+        response_cache.store_response(cache_key, bot_response, bot.cache_ttl)
+    return bot_response
+
+
+def make_turn(message, bot_response):
+    """
+    Пара сообщений (пользователь + бот) для conversation_history;
+    число токенов считается один раз при записи
+    """
+    return [
+        {"role": "user", "content": message, "tokens": estimate_tokens(message)},
+        {"role": "assistant", "content": bot_response, "tokens": estimate_tokens(bot_response)},
+    ]
+
+
+def get_scenario(bot, scenario_id):
+    """
+    Сценарий бота по id или None, если он не указан или не найден
+    """
+    if not scenario_id:
+        return None
+    return Scenario.objects.filter(id=scenario_id, bot=bot).first()
+
+
+class TurnConflict(Exception):
+    """
+    Выполнение изменил параллельный ход: оно перечитано из БД, ход нужно повторить
+    """
+
+    def __str__(self):
+        return 'Разговор изменен параллельным запросом, повторите сообщение'
+
+
+# Сколько раз ход повторяется на свежей версии выполнения
+TURN_ATTEMPTS = 3
+
+
+def is_resumable(execution):
+    return isinstance(execution.conversation_history, list)
+
+
+def resume_execution(bot, user, user_session, scenario=None):
+    """
+    Последнее незавершенное выполнение сессии пользователя или новое.
+    Новое не сохраняется: строка появляется только с первым успешным ходом
+    """
+    execution = (
+        BotExecution.objects
+        .filter(bot=bot, user=user, user_session=user_session, is_completed=False)
+        .order_by('-created_at')
+        .first()
+    )
+    if execution is None or not is_resumable(execution):
+        execution = BotExecution(
+            bot=bot,
+            user=user,
+            scenario=scenario,
+            scenario_version=scenario.published_version if scenario is not None else None,
+            user_session=user_session,
+            conversation_history=[],
+        )
+    return execution
+
+
+# Поля выполнения, которые меняет один ход разговора
+TURN_FIELDS = [
+    'conversation_history', 'context_start', 'context_tokens',
+    'current_step', 'variables', 'updated_at'
+]
+TURN_COLUMNS = [BotExecution._meta.get_field(field).attname for field in TURN_FIELDS]
+
+
+def append_turn(execution, message, bot_response):
+    """
+    Дописывает ход разговора в историю выполнения без сохранения.
+    Возвращает (токены хода, время прошлой активности или None для новой
+    сессии) — для usage.record_turn после сохранения
+    """
+    turn = make_turn(message, bot_response)
+    tokens = sum(entry["tokens"] for entry in turn)
+    last_activity = execution.updated_at if execution.conversation_history else None
+    execution.conversation_history.extend(turn)
+    execution.context_tokens += tokens
+    # Следующий ход той же сессии в пакете видит время этого хода
+    execution.updated_at = timezone.now()
+    return tokens, last_activity
+
+
+def save_turn(execution):
+    """
+    Сохраняет ход: новое выполнение — INSERT, продолженное — UPDATE при
+    условии, что версия не изменилась с момента чтения. Иначе выполнение
+    перечитывается и поднимается TurnConflict
+    """
+    if execution.pk is None:
+        execution.save()
+        return
+    version = execution.version
+    changes = {column: getattr(execution, column) for column in TURN_COLUMNS}
+    if not BotExecution.objects.filter(pk=execution.pk, version=version).update(version=version + 1, **changes):
+        execution.refresh_from_db()
+        raise TurnConflict()
+    execution.version = version + 1
+
+
+def record_turn(execution, message, bot_response):
+    """
+    Дописывает ход разговора (и положение в сценарии) в выполнение одним
+    UPDATE; TurnConflict, если выполнение успел изменить другой ход
+    """
+    tokens, last_activity = append_turn(execution, message, bot_response)
+    save_turn(execution)
+    usage.record_turn(execution.bot_id, tokens, last_activity)
+    tasks.schedule_summary(execution)
+
+
+def take_turn(execution, message, respond):
+    """
+    Ход разговора синхронно: respond(execution) дает ответ (шаги сценария
+    или модель), ход сохраняется; при конфликте версий ход повторяется
+    на перечитанном выполнении
+    """
+    for attempt in range(TURN_ATTEMPTS):
+        bot_response = respond(execution)
+        try:
+            record_turn(execution, message, bot_response)
+            return bot_response
+        except TurnConflict:
+            if attempt == TURN_ATTEMPTS - 1:
+                raise
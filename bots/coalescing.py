@@ -0,0 +1,55 @@
+# bots/coalescing.py
+import threading
+
+from . import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом в один
+
+    Первый вызов (лидер) выполняет функцию, остальные ждут и получают
+    тот же результат или то же исключение. Работает в пределах процесса.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, timeout=None, **kwargs):
+        """
+        timeout ограничивает ожидание чужого вызова (TimeoutError по истечении)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.increment(f'{self.name}.coalesced_calls')
+            if not call.done.wait(timeout):
+                raise TimeoutError()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.increment(f'{self.name}.leader_calls')
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -0,0 +1,79 @@
+# bots/conditional.py
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """
+    Сильный ETag из частей версии ответа
+    """
+    digest = hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def queryset_version(queryset):
+    """
+    (число строк, последнее изменение) одним агрегирующим запросом:
+    меняется при любом добавлении, правке и удалении
+    """
+    result = queryset.order_by().aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+    return result['count'], result['last_modified']
+
+
+def conditional_response(request, version, last_modified, render):
+    """
+    304, если клиент прислал совпадающий If-None-Match (или не изменившийся
+    If-Modified-Since), иначе render(). Версия не зависит от содержимого
+    ответа, поэтому для 304 данные не выбираются и не сериализуются.
+    """
+    # Одни и те же данные в JSON и в браузерном API — разные ответы
+    renderer = getattr(request, 'accepted_renderer', None)
+    etag = make_etag(request.get_full_path(), getattr(renderer, 'format', ''), *version)
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = render()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # Клиенты каждый раз сверяются по ETag, nginx держит ответ
+    # API_CONDITIONAL_PROXY_TTL секунд и затем тоже сверяется условным запросом
+    patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ('Authorization', 'Cookie'))
+    if settings.API_CONDITIONAL_PROXY_TTL:
+        response['X-Accel-Expires'] = str(settings.API_CONDITIONAL_PROXY_TTL)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET для list и retrieve ViewSet по полю updated_at модели
+    """
+
+    def list(self, request, *args, **kwargs):
+        count, last_modified = queryset_version(self.filter_queryset(self.get_queryset()))
+        return conditional_response(
+            request, (count, last_modified), last_modified,
+            partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        render = partial(super().retrieve, request, *args, **kwargs)
+        try:
+            last_modified = self.get_queryset().filter(
+                pk=kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+            ).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError):
+            last_modified = None
+        if last_modified is None:
+            # Нет такого объекта — 404 отдаст обычный retrieve
+            return render()
+        return conditional_response(request, (last_modified,), last_modified, render)
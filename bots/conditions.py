@@ -0,0 +1,250 @@
+# bots/conditions.py
+#
+# Язык условий для шагов типа "condition":
+#
+#     input == 'да'
+#     number(age) >= 18 and city in ['Москва', 'Казань']
+#     not (lower(input) matches '^нет') or attempts > 3
+#
+# input — сообщение пользователя на этом ходу, остальные имена — переменные
+# сессии (ответы на вопросы сценария), отсутствующая переменная равна null.
+# Операторы: or, and, not, ==, !=, <, <=, >, >=, in, not in, matches
+# (поиск регулярного выражения в строке). Функции: len, lower, number.
+#
+# Выражение разбирается один раз и компилируется в дерево замыканий Python:
+# вычисление не использует eval и не разбирает строку заново.
+import re
+from functools import lru_cache
+
+MAX_EXPRESSION_LENGTH = 500
+# Скобки, списки, вызовы функций и not друг в друге: глубже — ошибка
+# условия, а не RecursionError при разборе или вычислении
+MAX_NESTING_DEPTH = 32
+
+
+class ConditionError(ValueError):
+    """Ошибка в выражении условия"""
+
+    def __init__(self, message, position=None):
+        if position is not None:
+            message = f'{message} (позиция {position + 1})'
+        super().__init__(message)
+
+
+TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<name>[^\W\d]\w*)
+  | (?P<op>==|!=|<=|>=|<|>|\(|\)|\[|\]|,)
+""", re.VERBOSE)
+
+KEYWORDS = {'and', 'or', 'not', 'in', 'matches', 'true', 'false', 'null'}
+
+
+def _number(value):
+    try:
+        return float(str(value).replace(',', '.').strip())
+    except (TypeError, ValueError):
+        return None
+
+
+FUNCTIONS = {
+    'len': lambda value: len(value) if isinstance(value, (str, list, dict)) else 0,
+    'lower': lambda value: str(value).lower() if value is not None else '',
+    'number': _number,
+}
+
+
+def _safe(compare):
+    """
+    Сравнение несравнимых значений (строки с числом, null) — ложь, а не ошибка
+    """
+    def wrapper(left, right):
+        try:
+            return compare(left, right)
+        except TypeError:
+            return False
+    return wrapper
+
+
+COMPARISONS = {
+    '==': lambda left, right: left == right,
+    '!=': lambda left, right: left != right,
+    '<': _safe(lambda left, right: left < right),
+    '<=': _safe(lambda left, right: left <= right),
+    '>': _safe(lambda left, right: left > right),
+    '>=': _safe(lambda left, right: left >= right),
+    'in': _safe(lambda left, right: left in right if right is not None else False),
+    'not in': _safe(lambda left, right: left not in right if right is not None else True),
+}
+
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    while position < len(expression):
+        match = TOKEN_RE.match(expression, position)
+        if match is None:
+            raise ConditionError(f'Недопустимый символ {expression[position]!r}', position)
+        kind = match.lastgroup
+        text = match.group()
+        if kind == 'name' and text in KEYWORDS:
+            kind = text
+        elif kind == 'op':
+            kind = text
+        if kind != 'space':
+            tokens.append((kind, text, position))
+        position = match.end()
+    tokens.append(('end', '', position))
+    return tokens
+
+
+class _Parser:
+    """
+    Рекурсивный спуск; каждое правило сразу возвращает замыкание
+    вида f(input, variables) -> значение
+    """
+
+    def __init__(self, expression):
+        self.tokens = tokenize(expression)
+        self.index = 0
+        self.depth = 0
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)]
+
+    def take(self, kind=None):
+        token = self.peek()
+        if kind is not None and token[0] != kind:
+            expected = 'конец выражения' if kind == 'end' else repr(kind)
+            found = 'конец выражения' if token[0] == 'end' else repr(token[1])
+            raise ConditionError(f'Ожидалось {expected}, найдено {found}', token[2])
+        self.index += 1
+        return token
+
+    def nested(self, parse):
+        position = self.peek()[2]
+        self.depth += 1
+        if self.depth > MAX_NESTING_DEPTH:
+            raise ConditionError(f'Вложенность глубже {MAX_NESTING_DEPTH} уровней', position)
+        try:
+            return parse()
+        finally:
+            self.depth -= 1
+
+    def parse(self):
+        node = self.parse_or()
+        self.take('end')
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek()[0] == 'or':
+            self.take()
+            left, right = node, self.parse_and()
+            node = lambda i, v, left=left, right=right: bool(left(i, v)) or bool(right(i, v))
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek()[0] == 'and':
+            self.take()
+            left, right = node, self.parse_not()
+            node = lambda i, v, left=left, right=right: bool(left(i, v)) and bool(right(i, v))
+        return node
+
+    def parse_not(self):
+        if self.peek()[0] == 'not':
+            self.take()
+            operand = self.nested(self.parse_not)
+            return lambda i, v: not operand(i, v)
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_primary()
+        kind, _, position = self.peek()
+        if kind == 'not' and self.peek(1)[0] == 'in':
+            self.take()
+            kind = 'not in'
+        if kind == 'matches':
+            self.take()
+            pattern_token = self.take('string')
+            try:
+                pattern = re.compile(self._unquote(pattern_token[1]), re.IGNORECASE)
+            except re.error as e:
+                raise ConditionError(f'Некорректное регулярное выражение: {e}', pattern_token[2])
+
+            def matches(i, v):
+                value = left(i, v)
+                return value is not None and pattern.search(str(value)) is not None
+            return matches
+        if kind in COMPARISONS:
+            self.take()
+            compare = COMPARISONS[kind]
+            right = self.parse_primary()
+            return lambda i, v: compare(left(i, v), right(i, v))
+        return left
+
+    def parse_primary(self):
+        return self.nested(self._parse_primary)
+
+    def _parse_primary(self):
+        kind, text, position = self.take()
+        if kind == 'number':
+            value = float(text) if '.' in text else int(text)
+            return lambda i, v: value
+        if kind == 'string':
+            value = self._unquote(text)
+            return lambda i, v: value
+        if kind in ('true', 'false', 'null'):
+            value = {'true': True, 'false': False, 'null': None}[kind]
+            return lambda i, v: value
+        if kind == '(':
+            node = self.parse_or()
+            self.take(')')
+            return node
+        if kind == '[':
+            items = []
+            if self.peek()[0] != ']':
+                items.append(self.parse_primary())
+                while self.peek()[0] == ',':
+                    self.take()
+                    items.append(self.parse_primary())
+            self.take(']')
+            return lambda i, v: [item(i, v) for item in items]
+        if kind == 'name':
+            if self.peek()[0] == '(':
+                return self.parse_call(text, position)
+            if text == 'input':
+                return lambda i, v: i
+            return lambda i, v: v.get(text)
+        found = 'конец выражения' if kind == 'end' else repr(text)
+        raise ConditionError(f'Ожидалось значение, найдено {found}', position)
+
+    def parse_call(self, name, position):
+        function = FUNCTIONS.get(name)
+        if function is None:
+            raise ConditionError(f'Неизвестная функция {name}', position)
+        self.take('(')
+        argument = self.parse_or()
+        self.take(')')
+        return lambda i, v: function(argument(i, v))
+
+    @staticmethod
+    def _unquote(text):
+        return re.sub(r'\\(.)', r'\1', text[1:-1])
+
+
+@lru_cache(maxsize=1024)
+def compile_condition(expression):
+    """
+    Компилирует выражение в функцию f(input, variables) -> bool.
+    Одинаковые выражения компилируются один раз на процесс.
+    """
+    if not isinstance(expression, str) or not expression.strip():
+        raise ConditionError('Пустое условие')
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ConditionError(f'Условие длиннее {MAX_EXPRESSION_LENGTH} символов')
+    node = _Parser(expression).parse()
+    return lambda user_input, variables: bool(node(user_input, variables))
@@ -0,0 +1,277 @@
+# bots/consumers.py
+import asyncio
+import base64
+import binascii
+import json
+import re
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user
+from django.http.cookie import parse_cookie
+from django.http.request import validate_host
+
+from .models import Bot
+from .chat import (
+    TURN_ATTEMPTS, TurnConflict, get_bot_config, get_scenario, resume_execution, record_turn, generate_reply
+)
+from .context import build_context
+from .knowledge import retrieve
+from .runtime import advance_scenario
+from .deadlines import Deadline, DeadlineExceeded, RequestCancelled
+from .ratelimit import check_chat_limits
+from .scheduler import SchedulerBusy
+from .tasks import needs_summary
+from .serializers import CHAT_MESSAGE_MAX_LENGTH
+
+CHAT_PATH = re.compile(r'^/ws/bots/(?P<bot_id>\d+)/chat/$')
+
+# Коды закрытия соединения (диапазон 4000-4999 отведен под приложение)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+# Сколько сообщений клиента может ждать обработки в одном соединении
+MAX_PENDING_TURNS = 10
+
+
+def assemble_context(bot, bot_config, execution, message):
+    """
+    Сообщения для модели: контекст разговора и фрагменты базы знаний бота
+    """
+    return build_context(execution, bot_config, message, retrieve(bot, message))
+
+
+async def websocket_application(scope, receive, send):
+    """
+    ASGI-приложение для WebSocket соединений
+    """
+    match = CHAT_PATH.match(scope['path'])
+    if match is None:
+        await receive()
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    await ChatConsumer(scope, receive, send, int(match['bot_id'])).run()
+
+
+def _origin_allowed(origin):
+    """
+    Защита от cross-site WebSocket hijacking при cookie-аутентификации
+    """
+    if origin in settings.CORS_ALLOWED_ORIGINS:
+        return True
+    host = urlsplit(origin).netloc
+    return validate_host(host, settings.ALLOWED_HOSTS)
+
+
+def _authenticate(headers):
+    """
+    Аутентификация по сессионной cookie или Basic Auth, как в REST API
+    """
+    authorization = headers.get('authorization', '')
+    if authorization.lower().startswith('basic '):
+        try:
+            decoded = base64.b64decode(authorization[6:]).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+        username, _, password = decoded.partition(':')
+        user = authenticate(username=username, password=password)
+        return user if user is not None and user.is_active else None
+
+    session_key = parse_cookie(headers.get('cookie', '')).get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    origin = headers.get('origin')
+    if origin and not _origin_allowed(origin):
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    user = get_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+    return user if user.is_authenticated else None
+
+
+class ChatConsumer:
+    """
+    Постоянный чат с ботом: аутентификация и загрузка бота выполняются
+    один раз при подключении, дальше каждый ход — только генерация ответа
+    """
+
+    def __init__(self, scope, receive, send, bot_id):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.bot_id = bot_id
+        self.user = None
+        self.user_session = None
+        self.bot = None
+        self.bot_config = None
+        self.execution = None
+        self.deadline = None
+        self.turns = asyncio.Queue(maxsize=MAX_PENDING_TURNS)
+
+    async def run(self):
+        event = await self.receive()
+        if event['type'] != 'websocket.connect':
+            return
+
+        close_code = await sync_to_async(self.connect)()
+        if close_code:
+            await self.send({'type': 'websocket.close', 'code': close_code})
+            return
+
+        await self.send({'type': 'websocket.accept'})
+        await self.send_json({
+            'type': 'ready',
+            'execution_id': self.execution.id,
+            'bot_name': self.bot.name,
+            'demo_mode': True
+        })
+
+        # Ходы обрабатываются по очереди в отдельной задаче, а этот цикл
+        # продолжает слушать сокет, чтобы сразу заметить отключение клиента
+        worker = asyncio.ensure_future(self.process_turns())
+        try:
+            while True:
+                event = await self.receive()
+                if event['type'] == 'websocket.disconnect':
+                    break
+                if event['type'] == 'websocket.receive':
+                    text = event.get('text')
+                    if text is None:
+                        text = (event.get('bytes') or b'').decode('utf-8', 'replace')
+                    try:
+                        self.turns.put_nowait(text)
+                    except asyncio.QueueFull:
+                        await self.send_error('Слишком много сообщений ожидают ответа')
+        finally:
+            if self.deadline is not None:
+                self.deadline.cancel()
+            worker.cancel()
+
+    async def process_turns(self):
+        while True:
+            text = await self.turns.get()
+            await self.handle_message(text)
+
+    def connect(self):
+        """
+        Проверяет пользователя и загружает бота; возвращает код закрытия при ошибке
+        """
+        headers = {
+            name.decode('latin1').lower(): value.decode('latin1')
+            for name, value in self.scope.get('headers', [])
+        }
+        self.user = _authenticate(headers)
+        if self.user is None:
+            return CLOSE_UNAUTHORIZED
+
+        self.bot = Bot.objects.filter(pk=self.bot_id).first()
+        if self.bot is None:
+            return CLOSE_NOT_FOUND
+        self.bot_config = get_bot_config(self.bot)
+
+        query = parse_qs(self.scope.get('query_string', b'').decode('latin1'))
+        user_session = query.get('user_session', ['default_session'])[0][:100]
+        scenario_id = query.get('scenario_id', [''])[0]
+        scenario = get_scenario(self.bot, int(scenario_id)) if scenario_id.isdigit() else None
+        self.user_session = user_session
+        self.execution = resume_execution(self.bot, self.user, user_session, scenario)
+        return None
+
+    async def handle_message(self, text):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        message = data.get('message') if isinstance(data, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            await self.send_error('Поле message обязательно')
+            return
+        if len(message) > CHAT_MESSAGE_MAX_LENGTH:
+            await self.send_error(
+                f'Сообщение длиннее {CHAT_MESSAGE_MAX_LENGTH} символов'
+            )
+            return
+
+        retry_after = await sync_to_async(check_chat_limits)(
+            self.bot_id, self.user.pk, self.user_session
+        )
+        if retry_after:
+            await self.send_json({
+                'success': False,
+                'error': f'Слишком много сообщений, повторите через {retry_after} с',
+                'retry_after': retry_after,
+                'demo_mode': True
+            })
+            return
+
+        if needs_summary(self.execution):
+            # Краткое содержание обновляет фоновая задача — подхватываем его
+            await sync_to_async(self.execution.refresh_from_db)(
+                fields=['summary', 'summarized_until']
+            )
+        self.deadline = Deadline(settings.CHAT_DEADLINE_SECONDS)
+        execution = self.execution
+        try:
+            for attempt in range(TURN_ATTEMPTS):
+                # Неудачный ход не должен сдвинуть сессию по сценарию
+                saved = execution.current_step_id, dict(execution.variables), execution.context_start
+                # Не в общем потоке thread_sensitive: медленный шаг api_call
+                # не должен задерживать ходы других соединений воркера
+                bot_response = await sync_to_async(
+                    advance_scenario, thread_sensitive=False
+                )(execution, message, self.deadline)
+                if bot_response is None:
+                    # Поиск по индексу базы знаний читает файл и считает BM25 —
+                    # тоже вне событийного цикла
+                    messages = await sync_to_async(
+                        assemble_context, thread_sensitive=False
+                    )(self.bot, self.bot_config, execution, message)
+                    bot_response = await sync_to_async(
+                        generate_reply, thread_sensitive=False
+                    )(self.bot, messages, self.bot_config, self.deadline)
+                try:
+                    await sync_to_async(record_turn)(execution, message, bot_response)
+                    break
+                except TurnConflict:
+                    # Сессию продолжил другой запрос: ход повторяется на ее свежей версии
+                    if attempt == TURN_ATTEMPTS - 1:
+                        raise
+        except TurnConflict as e:
+            await self.send_error(str(e))
+            return
+        except Exception as e:
+            execution.current_step_id, execution.variables, execution.context_start = saved
+            if isinstance(e, RequestCancelled):
+                return
+            if isinstance(e, DeadlineExceeded):
+                await self.send_error(str(e))
+            elif isinstance(e, SchedulerBusy):
+                await self.send_json({
+                    'success': False,
+                    'error': str(e),
+                    'retry_after': e.retry_after,
+                    'demo_mode': True
+                })
+            else:
+                await self.send_error(f'Ошибка при генерации ответа: {str(e)}')
+            return
+
+        await self.send_json({
+            'success': True,
+            'response': bot_response,
+            'execution_id': self.execution.id,
+            'bot_name': self.bot.name,
+            'demo_mode': True
+        })
+
+    async def send_error(self, error):
+        await self.send_json({'success': False, 'error': error, 'demo_mode': True})
+
+    async def send_json(self, payload):
+        await self.send({
+            'type': 'websocket.send',
+            'text': json.dumps(payload, ensure_ascii=False)
+        })
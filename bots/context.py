@@ -0,0 +1,112 @@
+# bots/context.py
+import math
+from functools import lru_cache
+
+# Размер контекстного окна моделей (в токенах)
+MODEL_CONTEXT_SIZES = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4': 8192,
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000,
+}
+DEFAULT_CONTEXT_SIZE = 4096
+
+# Служебные токены, которые модель добавляет к каждому сообщению
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_PREFIX = 'Краткое содержание предыдущей части разговора:'
+KNOWLEDGE_PREFIX = 'Материалы из базы знаний, используй их в ответе:'
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text):
+    """
+    Быстрая оценка числа токенов без токенизатора: ~4 байта UTF-8 на токен
+    (для кириллицы это ~2 символа на токен)
+    """
+    return math.ceil(len(text.encode('utf-8')) / 4) + MESSAGE_OVERHEAD
+
+
+def context_size(model):
+    return MODEL_CONTEXT_SIZES.get(model, DEFAULT_CONTEXT_SIZE)
+
+
+def message_tokens(entry):
+    """
+    Токены сообщения истории: сохраненные при записи или оценка для старых записей
+    """
+    tokens = entry.get("tokens")
+    return tokens if tokens is not None else estimate_tokens(str(entry.get("content", "")))
+
+
+def _fit_window(execution, budget):
+    """
+    Сдвигает начало окна истории так, чтобы оно укладывалось в бюджет.
+    Счетчик токенов окна ведется инкрементально: за ход граница сдвигается
+    только на добавленные сообщения, а не пересчитывается по всей истории.
+    Сообщения, уже вошедшие в краткое содержание, в окно не попадают.
+    """
+    history = execution.conversation_history
+    floor = min(execution.summarized_until, len(history))
+    start = min(execution.context_start, len(history))
+    tokens = execution.context_tokens
+    if tokens == 0 and start < len(history):
+        # Выполнение создано до появления счетчика — считаем один раз
+        tokens = sum(message_tokens(entry) for entry in history[start:])
+
+    while start < len(history) and (tokens > budget or start < floor):
+        tokens -= message_tokens(history[start])
+        start += 1
+    # Бюджет мог вырасти (например, уменьшили max_tokens) — расширяем окно назад
+    while start > floor and tokens + message_tokens(history[start - 1]) <= budget:
+        start -= 1
+        tokens += message_tokens(history[start])
+    # Окно начинается с реплики пользователя, а не с ответа без вопроса
+    while start < len(history) and history[start].get("role") != "user":
+        tokens -= message_tokens(history[start])
+        start += 1
+
+    execution.context_start = start
+    execution.context_tokens = tokens
+
+
+def format_knowledge(fragments):
+    return KNOWLEDGE_PREFIX + "".join(
+        f"\n\n[{number}] {text}" for number, text in enumerate(fragments, 1)
+    )
+
+
+def build_context(execution, bot_config, message, knowledge=None):
+    """
+    Сообщения для модели: системный промпт, краткое содержание ранних
+    ходов, найденные фрагменты базы знаний, последние ходы разговора,
+    которые помещаются в бюджет, и новое сообщение пользователя.
+    Бюджет — контекст модели минус max_tokens, оставленные на ответ.
+    """
+    system_prompt = bot_config.get("system_prompt", "")
+    summary = f"{SUMMARY_PREFIX}\n{execution.summary}" if execution.summary else ""
+    knowledge = format_knowledge(knowledge) if knowledge else ""
+    budget = (
+        context_size(bot_config["gpt_model"])
+        - bot_config["max_tokens"]
+        - (estimate_tokens(system_prompt) if system_prompt else 0)
+        - (estimate_tokens(summary) if summary else 0)
+        - (estimate_tokens(knowledge) if knowledge else 0)
+        - estimate_tokens(message)
+    )
+    _fit_window(execution, max(budget, 0))
+
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    if summary:
+        messages.append({"role": "system", "content": summary})
+    if knowledge:
+        messages.append({"role": "system", "content": knowledge})
+    messages.extend(
+        {"role": entry["role"], "content": entry["content"]}
+        for entry in execution.conversation_history[execution.context_start:]
+    )
+    messages.append({"role": "user", "content": message})
+    return messages
@@ -0,0 +1,142 @@
+# bots/deadlines.py
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+
+DISCONNECT_SCOPE_KEY = 'bots.disconnected'
+TIMEOUT_HEADER = 'X-Request-Timeout'
+
+# Как часто дочерний дедлайн проверяет отмену родителя
+POLL_INTERVAL = 0.05
+
+
+class DeadlineExceeded(Exception):
+    """Время на обработку запроса истекло"""
+
+    def __init__(self):
+        super().__init__('Превышено время ожидания ответа модели')
+
+
+class RequestCancelled(Exception):
+    """Клиент отключился, результат больше никому не нужен"""
+
+    def __init__(self):
+        super().__init__('Запрос отменен клиентом')
+
+
+class Deadline:
+    """
+    Крайний срок запроса и признак его отмены
+
+    Передается в вызов модели: заглушка ждет не дольше оставшегося времени
+    и прерывается сразу после отмены (например, при отключении клиента).
+    """
+
+    def __init__(self, timeout, cancelled=None, parent=None):
+        self.expires_at = time.monotonic() + timeout
+        self._cancelled = cancelled or threading.Event()
+        self._parent = parent
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        Дедлайн HTTP-запроса: не больше CHAT_DEADLINE_SECONDS и заголовка
+        X-Request-Timeout; на ASGI отменяется при отключении клиента
+        """
+        timeout = settings.CHAT_DEADLINE_SECONDS
+        header = request.headers.get(TIMEOUT_HEADER)
+        if header:
+            try:
+                timeout = min(timeout, max(float(header), 0.0))
+            except ValueError:
+                pass
+        scope = getattr(request, 'scope', None) or {}
+        return cls(timeout, cancelled=scope.get(DISCONNECT_SCOPE_KEY))
+
+    def child(self):
+        """
+        Дедлайн с тем же сроком, который можно отменить отдельно от родителя
+        """
+        child = Deadline(0, parent=self)
+        child.expires_at = self.expires_at
+        return child
+
+    def detached(self):
+        """
+        Тот же срок без связи с отменой: для общей работы нескольких клиентов
+        """
+        detached = Deadline(0)
+        detached.expires_at = self.expires_at
+        return detached
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set() or (self._parent is not None and self._parent.cancelled)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        if self.cancelled:
+            raise RequestCancelled()
+        if self.remaining() <= 0:
+            raise DeadlineExceeded()
+
+    def wait(self, seconds):
+        """
+        Ждет seconds секунд, прерываясь при отмене или истечении дедлайна
+        """
+        end = time.monotonic() + seconds
+        while True:
+            self.check()
+            left = min(end, self.expires_at) - time.monotonic()
+            if left <= 0:
+                self.check()
+                return
+            if self._parent is not None:
+                left = min(left, POLL_INTERVAL)
+            self._cancelled.wait(left)
+
+
+def cancel_on_disconnect(app):
+    """
+    ASGI-обертка: после чтения тела запроса продолжает слушать соединение
+    и выставляет scope['bots.disconnected'], когда клиент отключился
+    """
+    async def wrapper(scope, receive, send):
+        if scope['type'] != 'http':
+            await app(scope, receive, send)
+            return
+
+        disconnected = threading.Event()
+        scope = dict(scope, **{DISCONNECT_SCOPE_KEY: disconnected})
+        watcher = None
+
+        async def watch():
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    disconnected.set()
+                    return
+
+        async def receive_body():
+            nonlocal watcher
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+            elif not message.get('more_body', False) and watcher is None:
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        try:
+            await app(scope, receive_body, send)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    return wrapper
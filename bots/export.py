@@ -0,0 +1,172 @@
+# bots/export.py
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.negotiation import BaseContentNegotiation
+
+from .lean import get_lean_serializer
+from .models import BotExecution
+from .renderers import orjson
+from .serializers import BotExecutionSerializer
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+class ExportError(ValueError):
+    """Некорректные параметры выгрузки"""
+
+
+def _moment(value, name, end_of_day=False):
+    """
+    Дата или дата со временем из параметра фильтра; дата без времени —
+    начало (или конец) дня в текущем часовом поясе
+    """
+    error = ExportError(f'{name}: ожидается дата YYYY-MM-DD или дата со временем ISO 8601')
+    try:
+        # Значение в верном формате, но с несуществующей датой (2024-02-30) — ValueError
+        moment = parse_datetime(value)
+        day = parse_date(value) if moment is None else None
+    except ValueError:
+        raise error
+    if moment is None:
+        if day is None:
+            raise error
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_executions(bot_id=None, user_session=None, created_after=None, created_before=None):
+    """
+    Выполнения для выгрузки по порядку id: по первичному ключу база
+    отдает строки без сортировки всей выборки
+    """
+    queryset = BotExecution.objects.order_by('pk')
+    if bot_id:
+        try:
+            queryset = queryset.filter(bot_id=int(bot_id))
+        except (TypeError, ValueError):
+            raise ExportError('bot_id: ожидается целое число')
+    if user_session:
+        queryset = queryset.filter(user_session=user_session)
+    if created_after:
+        queryset = queryset.filter(created_at__gte=_moment(created_after, 'created_after'))
+    if created_before:
+        queryset = queryset.filter(created_at__lte=_moment(created_before, 'created_before', end_of_day=True))
+    return queryset
+
+
+def _ndjson(rows):
+    if orjson is not None:
+        return b''.join(orjson.dumps(row) + b'\n' for row in rows)
+    return ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows).encode()
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return '' if value is None else value
+
+
+def export_chunks(queryset, output='ndjson', fields=None, compress=False, chunk_size=None):
+    """
+    Выгрузка частями по chunk_size строк: каждая часть — отдельный запрос
+    по ключу (pk > последнего выгруженного), поэтому память не зависит от
+    размера выгрузки, а между частями в базе не остается открытого курсора
+    и блокировки чтения, которая на SQLite не дала бы писать чатам.
+    Вложенные JSON-поля в CSV записываются строкой JSON.
+    """
+    if output not in FORMATS:
+        raise ExportError(f'Формат должен быть одним из: {", ".join(FORMATS)}')
+    lean = get_lean_serializer(BotExecutionSerializer)
+    names = lean.parse_fields(fields)
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+
+    encode = _ndjson if output == 'ndjson' else _csv_encoder(names)
+
+    def encoded():
+        last_pk = None
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(lean.values(page, names, 'pk')[:chunk_size])
+            if rows or last_pk is None and output == 'csv':
+                # Для CSV — хотя бы заголовок, даже если строк нет
+                yield encode(lean.serialize(rows, names))
+            if len(rows) < chunk_size:
+                break
+            last_pk = rows[-1]['pk']
+
+    return _gzip(encoded()) if compress else encoded()
+
+
+def _csv_encoder(names):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+
+    def encode(data):
+        for item in data:
+            writer.writerow([_csv_value(item[name]) for name in names])
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text.encode()
+    return encode
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def content_type(output, compress):
+    """
+    (Content-Type, имя файла) выгрузки
+    """
+    media_type, extension = FORMATS[output]
+    if compress:
+        return 'application/gzip', f'executions.{extension}.gz'
+    return f'{media_type}; charset=utf-8', f'executions.{extension}'
+
+
+def for_asgi(chunks):
+    """
+    Асинхронный итератор поверх синхронного: Django под ASGI иначе читает
+    синхронный поток целиком в память перед отправкой. Части читаются
+    в потоке запроса (thread_sensitive), где открыто соединение с БД.
+    """
+    async def iterate():
+        read = sync_to_async(next)
+        while True:
+            chunk = await read(chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    return iterate()
+
+
+class IgnoreAcceptNegotiation(BaseContentNegotiation):
+    """
+    Выгрузка отдает свой формат, какой бы Accept ни прислал клиент
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
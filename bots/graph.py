@@ -0,0 +1,101 @@
+# bots/graph.py
+#
+# Проверка графа шагов сценария. Строки шагов — (id, тип, содержание,
+# id следующего шага), как их возвращает Step.load_graph одним запросом.
+from .steps import StepConfigError, compile_step
+
+
+def _problem(level, code, step, message, **extra):
+    return dict(level=level, code=code, step=step, message=message, **extra)
+
+
+def validate_graph(initial_step_id, rows):
+    """
+    Проверка графа шагов за O(шагов + переходов). Список проблем:
+      invalid_step       — содержание шага не компилируется
+      outside_target     — переход на шаг вне сценария (next_step, ветка, on_error)
+      invalid_initial    — начальный шаг не из этого сценария
+      cycle              — цикл без вопроса: за один ход сценарий не остановится
+      orphan             — шаг недостижим из начального (предупреждение)
+    """
+    problems = []
+    ids = {row[0] for row in rows}
+    edges = {}
+    waits = set()
+    for step_id, step_type, content, next_step_id in rows:
+        try:
+            targets = compile_step(step_id, step_type, content, next_step_id).targets()
+        except StepConfigError as e:
+            problems.append(_problem('error', 'invalid_step', step_id, str(e)))
+            targets = [next_step_id] if next_step_id is not None else []
+        outside = sorted(set(target for target in targets if target not in ids))
+        if outside:
+            problems.append(_problem(
+                'error', 'outside_target', step_id,
+                f'Шаг {step_id}: шаги {outside} не найдены в сценарии', targets=outside
+            ))
+        edges[step_id] = [target for target in targets if target in ids]
+        if step_type == 'question':
+            # На вопросе ход заканчивается: цикл через вопрос — это повтор, а не зацикливание
+            waits.add(step_id)
+
+    start = initial_step_id
+    if start is not None and start not in ids:
+        problems.append(_problem(
+            'error', 'invalid_initial', start, f'Начальный шаг {start} не из этого сценария'
+        ))
+        start = None
+    if start is None and rows:
+        start = rows[0][0]
+
+    problems.extend(_cycles(edges, waits))
+
+    reachable = set()
+    if start is not None:
+        reachable.add(start)
+        pending = [start]
+        while pending:
+            for target in edges[pending.pop()]:
+                if target not in reachable:
+                    reachable.add(target)
+                    pending.append(target)
+    for step_id, *_ in rows:
+        if step_id not in reachable:
+            problems.append(_problem(
+                'warning', 'orphan', step_id, f'Шаг {step_id} недостижим из начального шага'
+            ))
+    return problems
+
+
+def _cycles(edges, waits):
+    """
+    Циклы без вопросов: обход в глубину без рекурсии, каждый цикл —
+    по обратному ребру, найденному один раз
+    """
+    problems = []
+    done = set()
+    for root in edges:
+        if root in done:
+            continue
+        path = [root]
+        on_path = {root}
+        iterators = [iter(edges[root] if root not in waits else ())]
+        while iterators:
+            target = next(iterators[-1], None)
+            if target is None:
+                finished = path.pop()
+                on_path.discard(finished)
+                done.add(finished)
+                iterators.pop()
+                continue
+            if target in on_path:
+                cycle = path[path.index(target):]
+                problems.append(_problem(
+                    'error', 'cycle', target,
+                    f'Цикл без вопроса: {" → ".join(map(str, cycle + [target]))}', steps=cycle
+                ))
+            elif target not in done:
+                path.append(target)
+                on_path.add(target)
+                iterators.append(iter(edges[target] if target not in waits else ()))
+    return problems
@@ -0,0 +1,95 @@
+# bots/hedging.py
+import math
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+
+from django.conf import settings
+
+from . import metrics
+from .deadlines import DeadlineExceeded
+
+
+class LatencyTracker:
+    """
+    Скользящее окно длительностей вызовов модели для оценки p95
+    """
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+
+    def observe(self, model, seconds):
+        with self._lock:
+            self._samples[model].append(seconds)
+
+    def percentile(self, model, q=0.95):
+        """
+        None, пока наблюдений меньше min_samples
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(q * len(samples)) - 1)]
+
+    def stats(self):
+        with self._lock:
+            models = list(self._samples)
+        return {model: self.percentile(model) for model in models}
+
+
+latency = LatencyTracker(min_samples=settings.CHAT_HEDGE_MIN_SAMPLES)
+_executor = ThreadPoolExecutor(max_workers=settings.CHAT_HEDGE_WORKERS, thread_name_prefix='hedge')
+
+
+def _run_in_slot(slot, fn, deadline):
+    with slot:
+        return fn(deadline)
+
+
+def hedged_call(fn, deadline, hedge_after, hedge_slot=None):
+    """
+    Вызывает fn(deadline); если ответа нет дольше hedge_after секунд,
+    отправляет второй такой же запрос и берет первый успешный ответ.
+    Проигравший вызов отменяется через свой дочерний дедлайн.
+    hedge_slot() дает слот планировщика для второго запроса или None,
+    если бот на пределе параллельных вызовов — тогда дубля нет.
+    """
+    child = deadline.child()
+    primary = _executor.submit(fn, child)
+    attempts = {primary: child}
+
+    done, _ = wait([primary], timeout=min(hedge_after, deadline.remaining()))
+    if not done and not deadline.cancelled and deadline.remaining() > 0:
+        slot = hedge_slot() if hedge_slot is not None else nullcontext()
+        if slot is None:
+            metrics.increment('hedging.skipped_busy')
+        else:
+            child = deadline.child()
+            attempts[_executor.submit(_run_in_slot, slot, fn, child)] = child
+            metrics.increment('hedging.hedged_calls')
+
+    pending = set(attempts)
+    error = None
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                deadline.check()
+                raise DeadlineExceeded()
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        metrics.increment('hedging.hedge_wins')
+                    return future.result()
+                error = future.exception()
+        raise error
+    finally:
+        for child in attempts.values():
+            child.cancel()
+
+
+metrics.register_gauge('hedging.p95_seconds', latency.stats)
@@ -0,0 +1,123 @@
+# bots/idempotency.py
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Метка "запрос выполняется" живет дольше таймаута nginx, но не вечно:
+# если воркер упал, повтор через это время выполнится заново
+PENDING_TTL = 120
+POLL_INTERVAL = 0.1
+MAX_POLL_INTERVAL = 0.5
+
+
+class IdempotencyError(Exception):
+    """Базовая ошибка ключа идемпотентности"""
+
+
+class IdempotencyKeyMismatch(IdempotencyError):
+    """Ключ уже использован с другим телом запроса"""
+
+
+class IdempotencyInProgress(IdempotencyError):
+    """Исходный запрос с этим ключом еще выполняется"""
+
+
+_local_cache_warned = False
+
+
+def _warn_if_local_cache():
+    """
+    Ключи в памяти процесса видит только свой воркер: повтор, попавший
+    на другой воркер, снова вызовет модель. Предупреждение — один раз
+    """
+    global _local_cache_warned
+    if not _local_cache_warned and isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache):
+        _local_cache_warned = True
+        logger.warning(
+            '%s хранится в памяти процесса: при нескольких воркерах повторы не '
+            'дедуплицируются, задайте REDIS_URL', IDEMPOTENCY_HEADER
+        )
+
+
+class IdempotentRequest:
+    """
+    Запрос с заголовком Idempotency-Key
+
+    Первый запрос с ключом ставит метку "pending" и выполняется, повторы
+    ждут его завершения и получают сохраненный ответ без вызова модели.
+    """
+
+    def __init__(self, scope, key, payload):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        self.cache_key = f'idempotency:{scope}:{digest}'
+        self.fingerprint = hashlib.sha256(
+            json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+        ).hexdigest()
+
+    @classmethod
+    def from_request(cls, request, scope, payload):
+        """
+        None, если клиент не прислал заголовок; ValueError для некорректного ключа
+        """
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return None
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValueError(
+                f'{IDEMPOTENCY_HEADER} должен содержать от 1 до {MAX_KEY_LENGTH} символов'
+            )
+        _warn_if_local_cache()
+        return cls(f'{request.user.pk}:{scope}', key, payload)
+
+    def begin(self, wait=None):
+        """
+        Захватывает ключ; возвращает сохраненный ответ, если запрос уже выполнен
+        """
+        wait = settings.CHAT_IDEMPOTENCY_WAIT if wait is None else wait
+        deadline = time.monotonic() + wait
+        interval = POLL_INTERVAL
+        pending = {'state': 'pending', 'fingerprint': self.fingerprint}
+
+        while True:
+            if cache.add(self.cache_key, pending, PENDING_TTL):
+                return None
+
+            record = cache.get(self.cache_key)
+            if record is None:
+                # Метка истекла между add и get — пробуем захватить еще раз
+                continue
+            if record['fingerprint'] != self.fingerprint:
+                raise IdempotencyKeyMismatch()
+            if record['state'] == 'done':
+                return record
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IdempotencyInProgress()
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    def complete(self, status_code, data):
+        cache.set(self.cache_key, {
+            'state': 'done',
+            'fingerprint': self.fingerprint,
+            'status': status_code,
+            'data': data,
+        }, settings.CHAT_IDEMPOTENCY_TTL)
+
+    def release(self):
+        """
+        Снимает метку после ошибки, чтобы повтор выполнился заново
+        """
+        cache.delete(self.cache_key)
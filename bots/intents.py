@@ -0,0 +1,173 @@
+# bots/intents.py
+import json
+import re
+import threading
+
+import numpy as np
+from django.conf import settings
+
+# Символьные n-граммы слов: устойчивы к падежным окончаниям и опечаткам
+NGRAM_SIZES = (2, 3, 4)
+
+# Ниже этого косинусного сходства с ближайшим намерением — ответ по умолчанию
+MIN_SIMILARITY = 0.25
+
+# Сколько сообщений векторизуется за один шаг пакетной классификации
+BATCH_SIZE = 1024
+
+WORD_RE = re.compile(r'\w+')
+
+
+def ngrams(text):
+    """
+    N-граммы слов текста с границами слова: "как" -> " к", "ка", "ак", "к ", " ка", ...
+    """
+    grams = []
+    for word in WORD_RE.findall(text.lower().replace('ё', 'е')):
+        padded = f' {word} '
+        for size in NGRAM_SIZES:
+            grams.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return grams
+
+
+class Persona:
+    """
+    Намерения и ответы одной персоны бота. centroids — матрица центроидов
+    намерений, строка на намерение: классификация сообщения — одно
+    умножение этой матрицы на вектор.
+    """
+
+    def __init__(self, name, prompt_keywords, intents, fallback, centroids):
+        self.name = name
+        self.prompt_keywords = prompt_keywords
+        self.intent_names = [intent['name'] for intent in intents]
+        self.examples = {intent['name']: intent['examples'] for intent in intents}
+        self.responses = {intent['name']: intent['responses'] for intent in intents}
+        self.fallback = fallback
+        self.centroids = centroids
+
+
+class IntentClassifier:
+    """
+    TF-IDF по символьным n-граммам с косинусным сходством к центроидам намерений
+
+    Словарь, IDF и матрицы центроидов всех персон считаются один раз из
+    корпуса примеров (bots/data/intents.json или CHAT_INTENT_CORPUS).
+    """
+
+    def __init__(self, corpus):
+        by_name = {persona['name']: persona for persona in corpus['personas']}
+        examples = [
+            text
+            for persona in corpus['personas']
+            for intent in persona.get('intents', [])
+            for text in intent['examples']
+        ]
+
+        self.vocabulary = {}
+        for text in examples:
+            for gram in ngrams(text):
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+
+        # Сглаженный IDF по примерам всех персон
+        document_frequency = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for text in examples:
+            document_frequency[self._indices(text, unique=True)] += 1
+        self.idf = (np.log((1 + len(examples)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        self.personas = []
+        for persona in corpus['personas']:
+            # Персона может взять намерения и ответы у другой ("inherits")
+            source = by_name[persona.get('inherits', persona['name'])]
+            rows = []
+            for intent in source['intents']:
+                centroid = self.vectorize(intent['examples']).mean(axis=0)
+                rows.append(centroid / (np.linalg.norm(centroid) or 1.0))
+            self.personas.append(Persona(
+                persona['name'],
+                persona.get('prompt_keywords', []),
+                source['intents'],
+                source['fallback'],
+                np.vstack(rows),
+            ))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _indices(self, text, unique=False):
+        indices = [self.vocabulary[gram] for gram in ngrams(text) if gram in self.vocabulary]
+        return np.unique(indices) if unique else np.array(indices, dtype=np.intp)
+
+    def vectorize(self, texts):
+        """
+        Матрица L2-нормированных векторов TF-IDF, строка на текст
+        """
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = np.bincount(self._indices(text), minlength=len(self.vocabulary))
+            present = counts > 0
+            matrix[row, present] = 1 + np.log(counts[present])
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def persona(self, system_prompt):
+        """
+        Персона бота по ключевым словам системного промпта; последняя — общая
+        """
+        prompt = system_prompt.lower()
+        for persona in self.personas:
+            if any(keyword in prompt for keyword in persona.prompt_keywords):
+                return persona
+        return self.personas[-1]
+
+    def classify(self, message, persona):
+        """
+        (намерение, сходство); намерение None, если ни одно не подходит
+        """
+        return self.classify_batch([message], persona)[0]
+
+    def classify_batch(self, messages, persona):
+        """
+        Классификация многих сообщений: блоками по BATCH_SIZE, одно
+        умножение матриц на блок
+        """
+        results = []
+        for start in range(0, len(messages), BATCH_SIZE):
+            scores = self.vectorize(messages[start:start + BATCH_SIZE]) @ persona.centroids.T
+            best = scores.argmax(axis=1)
+            for row, column in enumerate(best):
+                score = float(scores[row, column])
+                intent = persona.intent_names[column] if score >= MIN_SIMILARITY else None
+                results.append((intent, score))
+        return results
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """
+    Классификатор процесса; строится при первом обращении (при старте воркера)
+    """
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = IntentClassifier.from_file(settings.CHAT_INTENT_CORPUS)
+    return _classifier
+
+
+def reload_classifier():
+    """
+    Перечитывает корпус после его редактирования
+    """
+    global _classifier
+    classifier = IntentClassifier.from_file(settings.CHAT_INTENT_CORPUS)
+    with _classifier_lock:
+        _classifier = classifier
+    return classifier
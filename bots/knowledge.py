@@ -0,0 +1,331 @@
+# bots/knowledge.py
+import heapq
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import metrics, tasks
+from .models import KnowledgeChunk, KnowledgeDocument
+
+logger = logging.getLogger(__name__)
+
+# Размер фрагмента в словах; длинные абзацы режутся с перекрытием
+CHUNK_WORDS = 150
+CHUNK_OVERLAP = 30
+
+# Параметры BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Термин — первые буквы слова: грубая замена стеммингу, которая сводит
+# формы одного слова ("управление", "управления") к одной основе
+STEM_LENGTH = 6
+
+STOP_WORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы
+по только ее мне было вот от меня еще нет о из ему теперь когда даже ну ли
+если уже или ни быть был него до вас нибудь опять уж вам ведь там потом себя
+ничего ей может они тут где есть надо ней для мы тебя их чем была сам чтоб
+без будто чего раз тоже себе под будет ж тогда кто этот того потому этого
+какой совсем ним здесь этом один почти мой тем чтобы нее были куда зачем всех
+никогда можно при наконец два об другой хоть после над больше тот через эти
+нас про всего них какая много разве три эту моя впрочем хорошо свою этой
+перед иногда лучше чуть том нельзя такой им более всегда конечно всю между
+the a an and or of to in on for is are be with as by at this that it from
+""".split())
+
+TOKEN_RE = re.compile(r'\w+')
+PARAGRAPH_RE = re.compile(r'\n\s*\n')
+
+# Формат файла индекса (порядок байт платформы), все массивы читаются из mmap без копирования:
+# заголовок | id фрагментов (q) | длины фрагментов (I) | смещения терминов (I)
+# | смещения списков вхождений (I) | номера фрагментов во вхождениях (I)
+# | частоты во вхождениях (H) | смещения текстов (I) | термины | тексты
+INDEX_MAGIC = b'KBM1'
+HEADER = struct.Struct('=4sIIIf')
+
+
+def tokenize(text):
+    """
+    Термины текста: слова в нижнем регистре без стоп-слов, обрезанные до основы
+    """
+    return [
+        word[:STEM_LENGTH]
+        for word in TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+        if len(word) > 1 and word not in STOP_WORDS
+    ]
+
+
+def chunk_text(text):
+    """
+    Делит документ на фрагменты по абзацам, не длиннее CHUNK_WORDS слов
+    """
+    chunks = []
+    current, size = [], 0
+    for paragraph in PARAGRAPH_RE.split(text):
+        words = paragraph.split()
+        if not words:
+            continue
+        if current and size + len(words) > CHUNK_WORDS:
+            chunks.append(' '.join(current))
+            current, size = [], 0
+        while len(words) > CHUNK_WORDS:
+            chunks.append(' '.join(words[:CHUNK_WORDS]))
+            words = words[CHUNK_WORDS - CHUNK_OVERLAP:]
+        current.extend(words)
+        size += len(words)
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+
+def index_document(document):
+    """
+    Заново делит документ на фрагменты и считает частоты терминов.
+    Остальные документы бота при этом не трогаются.
+    """
+    chunks = []
+    for position, text in enumerate(chunk_text(document.text)):
+        terms = Counter(tokenize(f"{document.title}\n{text}" if position == 0 else text))
+        chunks.append(KnowledgeChunk(
+            document=document,
+            position=position,
+            text=text,
+            terms=dict(terms),
+            length=sum(terms.values()),
+        ))
+    with transaction.atomic():
+        KnowledgeChunk.objects.filter(document=document).delete()
+        KnowledgeChunk.objects.bulk_create(chunks)
+        KnowledgeDocument.objects.filter(pk=document.pk).update(indexed_at=document.updated_at)
+    return len(chunks)
+
+
+def index_path(bot_id):
+    return os.path.join(settings.KNOWLEDGE_INDEX_DIR, f'bot_{bot_id}.idx')
+
+
+def build_index(bot_id):
+    """
+    Собирает файл индекса бота из сохраненных частот терминов фрагментов,
+    без повторной токенизации текстов. Файл заменяется атомарно: воркеры,
+    уже открывшие старую версию, дочитывают ее, новые запросы видят новую.
+    """
+    chunk_ids = array('q')
+    lengths = array('I')
+    text_offsets = array('I', [0])
+    texts = bytearray()
+    postings = defaultdict(list)
+
+    rows = KnowledgeChunk.objects.filter(document__bot_id=bot_id).order_by('pk').values_list(
+        'pk', 'text', 'terms', 'length'
+    )
+    for index, (chunk_id, text, terms, length) in enumerate(rows.iterator(chunk_size=500)):
+        chunk_ids.append(chunk_id)
+        lengths.append(length)
+        texts += text.encode('utf-8')
+        text_offsets.append(len(texts))
+        for term, frequency in terms.items():
+            postings[term.encode('utf-8')].append((index, min(frequency, 0xFFFF)))
+
+    path = index_path(bot_id)
+    if not chunk_ids:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+
+    term_offsets = array('I', [0])
+    posting_offsets = array('I', [0])
+    posting_chunks = array('I')
+    posting_frequencies = array('H')
+    terms_blob = bytearray()
+    for term in sorted(postings):
+        terms_blob += term
+        term_offsets.append(len(terms_blob))
+        for index, frequency in postings[term]:
+            posting_chunks.append(index)
+            posting_frequencies.append(frequency)
+        posting_offsets.append(len(posting_chunks))
+
+    average_length = sum(lengths) / len(lengths)
+    os.makedirs(settings.KNOWLEDGE_INDEX_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=settings.KNOWLEDGE_INDEX_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(INDEX_MAGIC, len(chunk_ids), len(postings),
+                                len(posting_chunks), average_length))
+            for part in (chunk_ids, lengths, term_offsets, posting_offsets,
+                         posting_chunks, posting_frequencies, text_offsets):
+                f.write(part.tobytes())
+            f.write(terms_blob)
+            f.write(texts)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(chunk_ids)
+
+
+_refresh_locks = defaultdict(threading.Lock)
+
+
+def refresh_index(bot_id, full=False):
+    """
+    Индексирует новые и измененные документы бота и пересобирает его индекс.
+    С full=True заново делит на фрагменты все документы.
+    """
+    with _refresh_locks[bot_id]:
+        documents = KnowledgeDocument.objects.filter(bot_id=bot_id)
+        if not full:
+            documents = documents.filter(
+                Q(indexed_at__isnull=True) | Q(indexed_at__lt=F('updated_at'))
+            )
+        for document in documents:
+            index_document(document)
+        count = build_index(bot_id)
+    metrics.increment('knowledge.rebuilds')
+    return count
+
+
+def _refresh_in_background(bot_id):
+    try:
+        refresh_index(bot_id)
+    except Exception:
+        logger.exception('Не удалось обновить базу знаний бота %s', bot_id)
+
+
+def schedule_refresh(bot_id):
+    """
+    Обновление индекса после изменения документов — в фоне, вне запроса
+    """
+    return tasks.submit_once(('knowledge', bot_id), _refresh_in_background, bot_id)
+
+
+class KnowledgeIndex:
+    """
+    Инвертированный индекс BM25 одного бота, открытый через mmap
+
+    Файл не разворачивается в словари Python: термин ищется бинарным
+    поиском по отсортированному списку, списки вхождений и тексты
+    читаются прямо из отображенной памяти, общей для всех воркеров.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        magic, self.chunk_count, self.term_count, posting_count, self.average_length = (
+            HEADER.unpack_from(buffer)
+        )
+        if magic != INDEX_MAGIC:
+            raise ValueError(f'{path}: неизвестный формат индекса')
+
+        offset = HEADER.size
+
+        def section(fmt, count):
+            nonlocal offset
+            size = count * struct.calcsize(fmt)
+            view = buffer[offset:offset + size].cast(fmt)
+            offset += size
+            return view
+
+        self.chunk_ids = section('q', self.chunk_count)
+        self.lengths = section('I', self.chunk_count)
+        self.term_offsets = section('I', self.term_count + 1)
+        self.posting_offsets = section('I', self.term_count + 1)
+        self.posting_chunks = section('I', posting_count)
+        self.posting_frequencies = section('H', posting_count)
+        self.text_offsets = section('I', self.chunk_count + 1)
+        self.terms = buffer[offset:offset + self.term_offsets[-1]]
+        self.texts = buffer[offset + self.term_offsets[-1]:]
+
+    def _find_term(self, term):
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            current = bytes(self.terms[self.term_offsets[middle]:self.term_offsets[middle + 1]])
+            if current < term:
+                low = middle + 1
+            elif current > term:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def text(self, index):
+        return bytes(self.texts[self.text_offsets[index]:self.text_offsets[index + 1]]).decode('utf-8')
+
+    def search(self, query, k=3):
+        """
+        k фрагментов с наибольшей оценкой BM25: [{'chunk_id', 'score', 'text'}]
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            term_index = self._find_term(term.encode('utf-8'))
+            if term_index is None:
+                continue
+            start = self.posting_offsets[term_index]
+            end = self.posting_offsets[term_index + 1]
+            frequency_in_docs = end - start
+            idf = math.log(1 + (self.chunk_count - frequency_in_docs + 0.5) / (frequency_in_docs + 0.5))
+            for position in range(start, end):
+                index = self.posting_chunks[position]
+                frequency = self.posting_frequencies[position]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[index] / self.average_length)
+                scores[index] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [
+            {'chunk_id': self.chunk_ids[index], 'score': round(score, 4), 'text': self.text(index)}
+            for index, score in best
+        ]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(bot_id):
+    """
+    Индекс бота из файла; открывается заново, только когда файл заменили
+    """
+    path = index_path(bot_id)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _indexes.pop(bot_id, None)
+        return None
+    version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _indexes.get(bot_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _indexes_lock:
+        cached = _indexes.get(bot_id)
+        if cached is None or cached[0] != version:
+            cached = (version, KnowledgeIndex(path))
+            _indexes[bot_id] = cached
+    return cached[1]
+
+
+def retrieve(bot, query):
+    """
+    Тексты фрагментов базы знаний бота, подходящие к сообщению
+    """
+    if not bot.knowledge_top_k:
+        return []
+    index = get_index(bot.pk)
+    if index is None:
+        return []
+    metrics.increment('knowledge.searches')
+    return [result['text'] for result in index.search(query, bot.knowledge_top_k)]
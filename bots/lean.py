@@ -0,0 +1,127 @@
+# bots/lean.py
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+# Значения этих полей из .values() уже в том виде, в каком их вернул бы DRF
+PASSTHROUGH_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.FloatField,
+    serializers.BooleanField,
+    serializers.JSONField,
+    serializers.ChoiceField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+FIELDS_PARAM = 'fields'
+
+
+class LeanSerializer:
+    """
+    Сериализация списков только для чтения: строки выбираются через
+    .values() нужных колонок, без экземпляров моделей и полей DRF на
+    каждую строку. Поля, источники и преобразования берутся один раз из
+    обычного ModelSerializer, поэтому вывод совпадает с ним.
+    """
+
+    def __init__(self, serializer_class):
+        self.columns = {}
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+                raise TypeError(f'{serializer_class.__name__}.{name}: поле не выбирается через values()')
+            if isinstance(field, PASSTHROUGH_FIELDS):
+                convert = None
+            elif self._is_iso_datetime(field):
+                # Дата в текущем часовом поясе запроса: пояс берется один раз на страницу
+                convert = ISO_8601
+            else:
+                convert = field.to_representation
+            self.columns[name] = (field.source.replace('.', '__'), convert)
+
+    @staticmethod
+    def _is_iso_datetime(field):
+        return (
+            isinstance(field, serializers.DateTimeField)
+            and settings.USE_TZ
+            and not hasattr(field, 'timezone')
+            and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == ISO_8601
+        )
+
+    def select(self, request):
+        """
+        Имена полей из ?fields=a,b (все, если параметра нет)
+        """
+        return self.parse_fields(request.query_params.get(FIELDS_PARAM))
+
+    def parse_fields(self, requested):
+        if not requested:
+            return list(self.columns)
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.columns]
+        if unknown:
+            raise serializers.ValidationError({
+                FIELDS_PARAM: [f'Неизвестные поля: {", ".join(unknown)}. Доступны: {", ".join(self.columns)}']
+            })
+        return names
+
+    def values(self, queryset, names, *extra):
+        return queryset.values(*{self.columns[name][0] for name in names}, *extra)
+
+    def serialize(self, rows, names):
+        current_timezone = timezone.get_current_timezone()
+
+        def iso_datetime(value):
+            text = value.astimezone(current_timezone).isoformat()
+            return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+        columns = [
+            (name, source, iso_datetime if convert == ISO_8601 else convert)
+            for name, (source, convert) in ((name, self.columns[name]) for name in names)
+        ]
+        plain = [(name, source) for name, source, convert in columns if convert is None]
+        converted = [(name, source, convert) for name, source, convert in columns if convert is not None]
+        data = []
+        for row in rows:
+            item = {name: row[source] for name, source in plain}
+            for name, source, convert in converted:
+                value = row[source]
+                item[name] = convert(value) if value is not None else None
+            # Порядок полей — как в запросе и в обычном сериализаторе
+            data.append({name: item[name] for name in names} if converted else item)
+        return data
+
+
+_lean_serializers = {}
+
+
+def get_lean_serializer(serializer_class):
+    """
+    LeanSerializer строится один раз на класс сериализатора
+    """
+    lean = _lean_serializers.get(serializer_class)
+    if lean is None:
+        lean = _lean_serializers[serializer_class] = LeanSerializer(serializer_class)
+    return lean
+
+
+class LeanListMixin:
+    """
+    list ViewSet через LeanSerializer его serializer_class, с ?fields=
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.lean_response(self.filter_queryset(self.get_queryset()), self.serializer_class)
+
+    def lean_response(self, queryset, serializer_class, paginate=True):
+        lean = get_lean_serializer(serializer_class)
+        names = lean.select(self.request)
+        rows = lean.values(queryset, names)
+        page = self.paginate_queryset(rows) if paginate else None
+        if page is not None:
+            return self.get_paginated_response(lean.serialize(page, names))
+        return Response(lean.serialize(rows, names))
@@ -0,0 +1,93 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from bots.lean import get_lean_serializer
+from bots.models import Bot, BotExecution, Scenario, Step
+from bots.renderers import FastJSONRenderer, orjson
+from bots.serializers import BotExecutionSerializer, StepSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнение времени сериализации страницы списка: ModelSerializer и LeanSerializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help='Сколько строк создать для замера')
+        parser.add_argument('--page', type=int, default=settings.REST_FRAMEWORK['PAGE_SIZE'],
+                            help='Размер страницы')
+        parser.add_argument('--history', type=int, default=40, help='Сообщений в истории выполнения')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов на вариант')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write('ℹ️  orjson не установлен — FastJSONRenderer использует стандартный JSON DRF')
+        # Данные для замера создаются в транзакции и откатываются в конце
+        with transaction.atomic():
+            self.create_rows(options['rows'], options['history'])
+            self.compare('Выполнения', BotExecution.objects.order_by('-created_at'),
+                         BotExecutionSerializer, options, light=('id', 'bot_name', 'user_session', 'updated_at'))
+            self.compare('Шаги', Step.objects.order_by('scenario', 'order'),
+                         StepSerializer, options, light=('id', 'name', 'step_type', 'next_step'))
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS('✅ Замер завершен, тестовые данные удалены'))
+
+    def create_rows(self, rows, history):
+        user = User.objects.create(username='benchmark-serializers')
+        bot = Bot.objects.create(name='Benchmark', created_by=user)
+        scenario = Scenario.objects.create(name='Benchmark', bot=bot)
+        turn = [
+            {'role': 'user', 'content': 'Как выстроить работу отдела продаж?', 'tokens': 9},
+            {'role': 'assistant', 'content': 'Начните с воронки и регулярных встреч команды. ' * 4, 'tokens': 60},
+        ]
+        BotExecution.objects.bulk_create([
+            BotExecution(bot=bot, scenario=scenario, user_session=f'session-{i}',
+                         conversation_history=turn * (history // 2), variables={'topic': 'продажи'})
+            for i in range(rows)
+        ])
+        Step.objects.bulk_create([
+            Step(name=f'Шаг {i}', scenario=scenario, step_type='message', order=i,
+                 content={'message': 'Добро пожаловать! ' * 20})
+            for i in range(rows)
+        ])
+
+    def measure(self, render, repeat):
+        render()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            size = len(render())
+        return (time.perf_counter() - started) / repeat * 1000, size
+
+    def compare(self, title, queryset, serializer_class, options, light):
+        page, repeat = options['page'], options['repeat']
+        lean = get_lean_serializer(serializer_class)
+        names = list(lean.columns)
+        slow_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+
+        # (название, запрос страницы, сериализация и рендеринг уже выбранных строк)
+        variants = [
+            ('ModelSerializer + JSONRenderer',
+             lambda: list(queryset[:page]),
+             lambda rows: slow_renderer.render(serializer_class(rows, many=True).data)),
+            ('LeanSerializer + FastJSONRenderer',
+             lambda: list(lean.values(queryset, names)[:page]),
+             lambda rows: fast_renderer.render(lean.serialize(rows, names))),
+            (f'LeanSerializer ?fields={",".join(light)}',
+             lambda: list(lean.values(queryset, light)[:page]),
+             lambda rows: fast_renderer.render(lean.serialize(rows, light))),
+        ]
+        self.stdout.write(f'\n{title}: страница {page} строк')
+        self.stdout.write(f'  {"":<60} {"всего":>9}  {"сериализация":>13}  {"размер":>9}')
+        baseline = None
+        for name, fetch, render in variants:
+            total, size = self.measure(lambda: render(fetch()), repeat)
+            rows = fetch()
+            serialization, _ = self.measure(lambda: render(rows), repeat)
+            baseline = baseline or serialization
+            self.stdout.write(
+                f'  {name:<60} {total:6.2f} мс  {serialization:7.2f} мс x{baseline / serialization:<4.1f}'
+                f' {size / 1024:6.1f} КБ'
+            )
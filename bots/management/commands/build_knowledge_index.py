@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from bots.knowledge import refresh_index
+from bots.models import Bot
+
+
+class Command(BaseCommand):
+    help = 'Индексация документов базы знаний и сборка файлов индекса ботов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bot', type=int, help='Только для бота с этим id')
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Заново разбить на фрагменты все документы, а не только измененные'
+        )
+
+    def handle(self, *args, **options):
+        bots = Bot.objects.all()
+        if options['bot']:
+            bots = bots.filter(pk=options['bot'])
+
+        for bot in bots.filter(documents__isnull=False).distinct():
+            count = refresh_index(bot.pk, full=options['full'])
+            self.stdout.write(f'{bot.name}: фрагментов в индексе — {count}')
+
+        self.stdout.write(self.style.SUCCESS('✅ Индексы базы знаний обновлены'))
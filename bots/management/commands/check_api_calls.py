@@ -0,0 +1,180 @@
+import ipaddress
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from bots.api_calls import ApiCallError, ApiCallExecutor, CircuitBreaker, CircuitOpen
+from bots.deadlines import Deadline, RequestCancelled
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Заглушка внешнего API на localhost:
+    /ok — JSON, /slow — JSON через 0.3 с, /hang — ответ через 2 с,
+    /big — тело больше API_CALL_MAX_RESPONSE_BYTES, /fail — 500, пока failing
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.active = 0
+        self.peak = 0
+        self.failing = True
+
+    @property
+    def base(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits += 1
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            if self.path.startswith('/slow'):
+                time.sleep(0.3)
+            elif self.path.startswith('/hang'):
+                time.sleep(2)
+            if self.path.startswith('/fail') and server.failing:
+                body, status = b'{}', 500
+            elif self.path.startswith('/big'):
+                body, status = b'x' * (settings.API_CALL_MAX_RESPONSE_BYTES + 1), 200
+            else:
+                body, status = json.dumps({'path': self.path}).encode(), 200
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # вызов отменен клиентом
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+class Command(BaseCommand):
+    help = ('Проверка исполнителя api_call на локальной заглушке: запрет внутренней сети, '
+            'кеш, лимит на хост, предел ответа, автомат хоста и отмена пробного вызова')
+
+    def handle(self, *args, **options):
+        server = StubServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.failed = 0
+        try:
+            self.check_blocked(server)
+            local = [ipaddress.ip_network('127.0.0.1/32')]
+            with override_settings(API_CALL_ALLOWED_PRIVATE_NETWORKS=local):
+                self.check_calls(server)
+        finally:
+            server.shutdown()
+        if self.failed:
+            raise CommandError(f'Не прошло проверок: {self.failed}')
+        self.stdout.write(self.style.SUCCESS('✅ Все проверки прошли'))
+
+    def expect(self, name, ok, detail=''):
+        if not ok:
+            self.failed += 1
+        mark = '✓' if ok else '✗'
+        self.stdout.write(f'{mark} {name}' + (f': {detail}' if detail else ''))
+
+    @staticmethod
+    def executor(host_concurrency=2, breaker_reset=0.5):
+        return ApiCallExecutor(
+            max_connections=10, host_concurrency=host_concurrency, cache_max_entries=10,
+            breaker_failures=2, breaker_reset=breaker_reset,
+        )
+
+    def check_blocked(self, server):
+        try:
+            self.executor().request('GET', server.base + '/ok', 1)
+        except ApiCallError as e:
+            self.expect('localhost запрещен по умолчанию', server.hits == 0, str(e))
+        else:
+            self.expect('localhost запрещен по умолчанию', False, 'запрос прошел')
+
+    def check_calls(self, server):
+        executor = self.executor()
+
+        result = executor.request('GET', server.base + '/ok', 1)
+        self.expect('разрешенная сеть доступна', result == {'path': '/ok'}, repr(result))
+
+        hits = server.hits
+        first = executor.request('GET', server.base + '/ok?cached', 1, cache_ttl=60)
+        second = executor.request('GET', server.base + '/ok?cached', 1, cache_ttl=60)
+        self.expect('GET с cache_ttl кешируется', first == second and server.hits == hits + 1)
+
+        server.peak = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(6) as pool:
+            list(pool.map(lambda i: executor.request('GET', f'{server.base}/slow?{i}', 5), range(6)))
+        self.expect(
+            'не больше host_concurrency запросов к хосту', server.peak == executor.host_concurrency,
+            f'одновременно {server.peak}, {time.monotonic() - started:.1f} с',
+        )
+
+        try:
+            executor.request('GET', server.base + '/big', 1)
+        except ApiCallError as e:
+            self.expect('ответ больше предела отклоняется', 'большой' in str(e), str(e))
+        else:
+            self.expect('ответ больше предела отклоняется', False, 'ответ принят')
+
+        self.check_breaker(server)
+
+    def check_breaker(self, server):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+        breaker.record_failure()
+        time.sleep(0.2)
+        breaker.allow()  # пробный вызов, который так и не завершится
+        stuck = breaker.allow()
+        time.sleep(0.2)
+        self.expect('зависший пробный вызов уступает место через reset_timeout', not stuck and breaker.allow())
+
+        executor = self.executor()
+        url = server.base + '/fail'
+        server.failing = True
+        for _ in range(executor.breaker_failures):
+            try:
+                executor.request('GET', url, 1)
+            except ApiCallError:
+                pass
+        try:
+            executor.request('GET', url, 1)
+        except CircuitOpen:
+            self.expect('автомат открывается после ошибок подряд', True)
+        except ApiCallError as e:
+            self.expect('автомат открывается после ошибок подряд', False, str(e))
+
+        # Пробный вызов отменяется, не дождавшись ответа, — автомат не должен застрять
+        time.sleep(executor.breaker_reset)
+        server.failing = False
+        deadline = Deadline(5)
+        threading.Timer(0.2, deadline.cancel).start()
+        try:
+            executor.request('GET', server.base + '/hang', 5, deadline=deadline)
+        except RequestCancelled:
+            pass
+        time.sleep(0.1)
+        try:
+            result = executor.request('GET', url, 1)
+        except ApiCallError as e:
+            self.expect('после отмены пробного вызова хост снова доступен', False, str(e))
+        else:
+            self.expect('после отмены пробного вызова хост снова доступен', result == {'path': '/fail'})
+            self.expect('успешный пробный вызов закрывает автомат', not executor.open_circuits())
@@ -0,0 +1,54 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bots.intents import get_classifier
+
+
+class Command(BaseCommand):
+    help = 'Оценка классификатора намерений на размеченных сообщениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('persona', help='Имя персоны из корпуса (support, education, ...)')
+        parser.add_argument(
+            '--file',
+            help='TSV-файл "сообщение<TAB>намерение"; пустое намерение — ответ по умолчанию. '
+                 'Без файла проверяются примеры самого корпуса'
+        )
+
+    def handle(self, *args, **options):
+        classifier = get_classifier()
+        persona = next((p for p in classifier.personas if p.name == options['persona']), None)
+        if persona is None:
+            names = ', '.join(p.name for p in classifier.personas)
+            raise CommandError(f'Персона не найдена. Доступны: {names}')
+
+        if options['file']:
+            with open(options['file'], encoding='utf-8', newline='') as f:
+                rows = [row for row in csv.reader(f, delimiter='\t') if row]
+            messages = [row[0] for row in rows]
+            expected = [(row[1] if len(row) > 1 else '') or None for row in rows]
+        else:
+            messages, expected = [], []
+            for intent, examples in persona.examples.items():
+                messages.extend(examples)
+                expected.extend([intent] * len(examples))
+
+        started = time.perf_counter()
+        predicted = classifier.classify_batch(messages, persona)
+        elapsed = time.perf_counter() - started
+
+        errors = 0
+        for message, want, (got, score) in zip(messages, expected, predicted):
+            if want != got:
+                errors += 1
+                self.stdout.write(f'✗ {message!r}: ожидалось {want}, получено {got} ({score:.2f})')
+
+        total = len(messages)
+        accuracy = (total - errors) / total if total else 0.0
+        self.stdout.write(
+            f'Сообщений: {total}, точность: {accuracy:.1%}, '
+            f'время: {elapsed * 1000:.1f} мс ({total / elapsed if elapsed else 0:.0f} сообщ./с)'
+        )
+        self.stdout.write(self.style.SUCCESS('✅ Оценка завершена'))
@@ -0,0 +1,53 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from bots.export import FORMATS, ExportError, export_chunks, filter_executions
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка выполнений в NDJSON или CSV для аналитики'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bot', type=int, help='Только выполнения бота с этим id')
+        parser.add_argument('--session', help='Только выполнения этой сессии пользователя')
+        parser.add_argument('--since', help='Созданные не раньше (YYYY-MM-DD или ISO 8601)')
+        parser.add_argument('--until', help='Созданные не позже (YYYY-MM-DD или ISO 8601)')
+        parser.add_argument('--format', choices=list(FORMATS), default='ndjson', help='Формат выгрузки')
+        parser.add_argument('--fields', help='Только эти поля через запятую')
+        parser.add_argument('--gzip', action='store_true', help='Сжать выгрузку gzip')
+        parser.add_argument('--output', help='Файл выгрузки (по умолчанию stdout)')
+        parser.add_argument('--chunk-size', type=int, help='Строк в одной части (по умолчанию EXPORT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        try:
+            queryset = filter_executions(
+                bot_id=options['bot'],
+                user_session=options['session'],
+                created_after=options['since'],
+                created_before=options['until'],
+            )
+            chunks = export_chunks(
+                queryset, options['format'], options['fields'], options['gzip'], options['chunk_size']
+            )
+        except ExportError as e:
+            raise CommandError(str(e))
+        except ValidationError as e:  # неизвестные поля в --fields
+            raise CommandError(' '.join(e.detail['fields']))
+
+        path = options['output']
+        stream = open(path, 'wb') if path else sys.stdout.buffer
+        size = 0
+        try:
+            for chunk in chunks:
+                stream.write(chunk)
+                size += len(chunk)
+        finally:
+            if path:
+                stream.close()
+            else:
+                stream.flush()
+
+        if path:
+            self.stdout.write(self.style.SUCCESS(f'✅ Выгрузка записана в {path} ({size} байт)'))
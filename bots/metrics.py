@@ -0,0 +1,37 @@
+# bots/metrics.py
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+
+
+def increment(name, value=1):
+    """
+    Увеличивает счетчик текущего процесса
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def get(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def register_gauge(name, func):
+    """
+    Показатель, который вычисляется в момент запроса метрик
+    """
+    _gauges[name] = func
+
+
+def snapshot():
+    """
+    Копия всех счетчиков и показателей для отдачи через API
+    """
+    with _lock:
+        counters = dict(sorted(_counters.items()))
+    gauges = {name: func() for name, func in sorted(_gauges.items())}
+    return {'counters': counters, 'gauges': gauges}
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='botexecution',
+            name='scenario',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='bots.scenario', verbose_name='Сценарий'),
+        ),
+    ]
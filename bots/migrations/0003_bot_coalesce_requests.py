@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0002_botexecution_optional_scenario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bot',
+            name='coalesce_requests',
+            field=models.BooleanField(default=False, help_text='Одновременные одинаковые сообщения получают ответ одного вызова модели. Подходит для детерминированных ботов (температура 0)', verbose_name='Объединять одинаковые запросы'),
+        ),
+    ]
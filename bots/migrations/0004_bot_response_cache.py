@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0003_bot_coalesce_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bot',
+            name='cache_responses',
+            field=models.BooleanField(default=False, help_text='Одинаковые сообщения получают сохраненный ответ без вызова модели. Подходит для FAQ-ботов с температурой 0', verbose_name='Кешировать ответы'),
+        ),
+        migrations.AddField(
+            model_name='bot',
+            name='cache_ttl',
+            field=models.PositiveIntegerField(default=3600, verbose_name='Время жизни кеша ответов (сек)'),
+        ),
+    ]
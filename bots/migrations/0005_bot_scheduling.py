@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0004_bot_response_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bot',
+            name='max_concurrency',
+            field=models.PositiveIntegerField(default=4, help_text='Сколько запросов бота к модели выполняется одновременно в одном воркере', verbose_name='Параллельных вызовов модели'),
+        ),
+        migrations.AddField(
+            model_name='bot',
+            name='schedule_weight',
+            field=models.PositiveIntegerField(default=1, help_text='Бот с весом 2 получает вдвое больше слотов при перегрузке, чем бот с весом 1', verbose_name='Вес в очереди'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0005_bot_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bot',
+            name='rate_limit_bot',
+            field=models.PositiveIntegerField(default=0, help_text='Суммарно по всем пользователям; 0 — без ограничения', verbose_name='Лимит сообщений бота в минуту'),
+        ),
+        migrations.AddField(
+            model_name='bot',
+            name='rate_limit_session',
+            field=models.PositiveIntegerField(default=20, help_text='0 — без ограничения', verbose_name='Лимит сообщений сессии в минуту'),
+        ),
+    ]
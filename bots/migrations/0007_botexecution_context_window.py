@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0006_bot_rate_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botexecution',
+            name='context_start',
+            field=models.PositiveIntegerField(default=0, help_text='Индекс первого сообщения истории, которое отправляется модели', verbose_name='Начало окна контекста'),
+        ),
+        migrations.AddField(
+            model_name='botexecution',
+            name='context_tokens',
+            field=models.PositiveIntegerField(default=0, verbose_name='Токенов в окне контекста'),
+        ),
+    ]
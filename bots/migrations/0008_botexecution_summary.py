@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0007_botexecution_context_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botexecution',
+            name='summarized_until',
+            field=models.PositiveIntegerField(default=0, help_text='Первые сообщения истории, которые заменены кратким содержанием', verbose_name='Сообщений в кратком содержании'),
+        ),
+        migrations.AddField(
+            model_name='botexecution',
+            name='summary',
+            field=models.TextField(blank=True, verbose_name='Краткое содержание разговора'),
+        ),
+    ]
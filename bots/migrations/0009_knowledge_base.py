@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0008_botexecution_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bot',
+            name='knowledge_top_k',
+            field=models.PositiveIntegerField(default=3, help_text='Сколько наиболее подходящих фрагментов документов бота отправляется модели; 0 — не использовать базу знаний', verbose_name='Фрагментов базы знаний в запросе'),
+        ),
+        migrations.CreateModel(
+            name='KnowledgeDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Название документа')),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('indexed_at', models.DateTimeField(blank=True, help_text='Версия документа (дата обновления), вошедшая в поисковый индекс бота', null=True, verbose_name='Проиндексирован')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to='bots.bot', verbose_name='Бот')),
+            ],
+            options={
+                'verbose_name': 'Документ базы знаний',
+                'verbose_name_plural': 'Документы базы знаний',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='KnowledgeChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(verbose_name='Номер фрагмента')),
+                ('text', models.TextField(verbose_name='Текст фрагмента')),
+                ('terms', models.JSONField(default=dict, verbose_name='Частоты терминов')),
+                ('length', models.PositiveIntegerField(default=0, verbose_name='Длина в терминах')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='bots.knowledgedocument', verbose_name='Документ')),
+            ],
+            options={
+                'verbose_name': 'Фрагмент документа',
+                'verbose_name_plural': 'Фрагменты документов',
+                'ordering': ['document', 'position'],
+            },
+        ),
+    ]
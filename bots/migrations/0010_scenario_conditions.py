@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0009_knowledge_base'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botexecution',
+            name='variables',
+            field=models.JSONField(blank=True, default=dict, help_text='Ответы на вопросы сценария; доступны в условиях шагов', verbose_name='Переменные сессии'),
+        ),
+        migrations.AddField(
+            model_name='scenario',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, help_text='Увеличивается при каждом изменении шагов; по ней сбрасывается скомпилированный сценарий', verbose_name='Ревизия шагов'),
+        ),
+    ]
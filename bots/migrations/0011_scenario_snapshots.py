@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('bots', '0010_scenario_conditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botexecution',
+            name='scenario_version',
+            field=models.PositiveIntegerField(blank=True, help_text='Снимок сценария, закрепленный за сессией при создании', null=True, verbose_name='Версия сценария'),
+        ),
+        migrations.AddField(
+            model_name='scenario',
+            name='published_version',
+            field=models.PositiveIntegerField(blank=True, help_text='Новые сессии проходят этот снимок сценария; пусто — текущие шаги', null=True, verbose_name='Опубликованная версия'),
+        ),
+        migrations.AlterField(
+            model_name='botexecution',
+            name='current_step',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='bots.step', verbose_name='Текущий шаг'),
+        ),
+        migrations.CreateModel(
+            name='ScenarioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(verbose_name='Версия')),
+                ('revision', models.PositiveIntegerField(verbose_name='Ревизия шагов')),
+                ('data', models.BinaryField(verbose_name='Шаги (zlib JSON)')),
+                ('step_count', models.PositiveIntegerField(default=0, verbose_name='Шагов')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата публикации')),
+                ('published_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Опубликовал')),
+                ('scenario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='bots.scenario', verbose_name='Сценарий')),
+            ],
+            options={
+                'verbose_name': 'Версия сценария',
+                'verbose_name_plural': 'Версии сценариев',
+                'ordering': ['scenario', '-version'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='scenariosnapshot',
+            constraint=models.UniqueConstraint(fields=('scenario', 'version'), name='unique_scenario_version'),
+        ),
+    ]
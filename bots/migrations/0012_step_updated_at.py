@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0011_scenario_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='step',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата обновления'),
+        ),
+    ]
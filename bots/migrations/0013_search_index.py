@@ -0,0 +1,116 @@
+# Полнотекстовый индекс FTS5 по сообщениям разговоров и тексту шагов.
+# Индекс поддерживают триггеры SQLite, поэтому он обновляется при любой
+# записи — save(), bulk_create, bulk_update, update() и каскадном удалении.
+
+from django.db import migrations
+
+# Сообщение истории в индексе: rowid = id выполнения * TURN_ROWID_SPAN + номер
+# сообщения, чтобы сообщения одного выполнения удалялись диапазоном rowid
+TURN_ROWID_SPAN = 1048576
+
+# remove_diacritics токенизатора unicode61 не трогает кириллицу: "ё" и "е"
+# сводятся вместе при записи в индекс (и в запросе, см. bots/search.py)
+YO = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+TURN_ROWS = f"""
+    SELECT {{execution}}.id * {TURN_ROWID_SPAN} + turn.key,
+           {YO.format("json_extract(turn.value, '$.content')")},
+           json_extract(turn.value, '$.role'),
+           {{execution}}.id, {{execution}}.bot_id, turn.key
+    FROM json_each({{execution}}.conversation_history) AS turn
+    WHERE turn.key < {TURN_ROWID_SPAN}
+"""
+
+STEP_TEXT = """
+    (SELECT group_concat(node.value, ' ') FROM json_tree({step}.content) AS node WHERE node.type = 'text')
+"""
+
+TURN_INSERT = 'INSERT INTO bots_turn_search (rowid, text, role, execution_id, bot_id, position)'
+STEP_INSERT = 'INSERT INTO bots_step_search (rowid, name, text, scenario_id)'
+TURN_RANGE = f'rowid BETWEEN {{execution}}.id * {TURN_ROWID_SPAN} AND {{execution}}.id * {TURN_ROWID_SPAN} + {TURN_ROWID_SPAN - 1}'
+
+# Триггеры индекса сообщений. SQLite удаляет их вместе с таблицей, а
+# Django пересоздает таблицу при многих изменениях полей (например,
+# AddField с default) — такие миграции создают триггеры заново
+TURN_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bots_turn_search_insert AFTER INSERT ON bots_botexecution BEGIN
+        {TURN_INSERT} {TURN_ROWS.format(execution='new')};
+    END
+    """,
+    # История только дописывается: индексируются сообщения после прежней
+    # длины, а при укорачивании истории лишние сообщения удаляются
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bots_turn_search_update AFTER UPDATE OF conversation_history ON bots_botexecution BEGIN
+        DELETE FROM bots_turn_search
+        WHERE rowid BETWEEN new.id * {TURN_ROWID_SPAN} + json_array_length(new.conversation_history)
+                        AND new.id * {TURN_ROWID_SPAN} + {TURN_ROWID_SPAN - 1};
+        {TURN_INSERT} {TURN_ROWS.format(execution='new')}
+            AND turn.key >= json_array_length(old.conversation_history);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bots_turn_search_delete AFTER DELETE ON bots_botexecution BEGIN
+        DELETE FROM bots_turn_search WHERE {TURN_RANGE.format(execution='old')};
+    END
+    """,
+]
+
+FORWARD = [
+    """
+    CREATE VIRTUAL TABLE bots_turn_search USING fts5(
+        text, role UNINDEXED, execution_id UNINDEXED, bot_id UNINDEXED, position UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE bots_step_search USING fts5(
+        name, text, scenario_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    *TURN_TRIGGERS,
+    f"""
+    CREATE TRIGGER bots_step_search_insert AFTER INSERT ON bots_step BEGIN
+        {STEP_INSERT} VALUES (new.id, {YO.format('new.name')}, {YO.format(STEP_TEXT.format(step='new'))}, new.scenario_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER bots_step_search_update AFTER UPDATE OF name, content, scenario_id ON bots_step BEGIN
+        DELETE FROM bots_step_search WHERE rowid = old.id;
+        {STEP_INSERT} VALUES (new.id, {YO.format('new.name')}, {YO.format(STEP_TEXT.format(step='new'))}, new.scenario_id);
+    END
+    """,
+    """
+    CREATE TRIGGER bots_step_search_delete AFTER DELETE ON bots_step BEGIN
+        DELETE FROM bots_step_search WHERE rowid = old.id;
+    END
+    """,
+    # Уже накопленные данные
+    f"{TURN_INSERT} {TURN_ROWS.format(execution='bots_botexecution')}".replace(
+        'FROM json_each', 'FROM bots_botexecution, json_each'
+    ),
+    f"{STEP_INSERT} SELECT bots_step.id, {YO.format('bots_step.name')}, {YO.format(STEP_TEXT.format(step='bots_step'))}, bots_step.scenario_id FROM bots_step",
+]
+
+BACKWARD = [
+    'DROP TRIGGER IF EXISTS bots_turn_search_insert',
+    'DROP TRIGGER IF EXISTS bots_turn_search_update',
+    'DROP TRIGGER IF EXISTS bots_turn_search_delete',
+    'DROP TRIGGER IF EXISTS bots_step_search_insert',
+    'DROP TRIGGER IF EXISTS bots_step_search_update',
+    'DROP TRIGGER IF EXISTS bots_step_search_delete',
+    'DROP TABLE IF EXISTS bots_turn_search',
+    'DROP TABLE IF EXISTS bots_step_search',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0012_step_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, BACKWARD),
+    ]
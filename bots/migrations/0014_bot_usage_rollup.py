@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0013_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(verbose_name='Час')),
+                ('turns', models.PositiveIntegerField(default=0, verbose_name='Ходов разговора')),
+                ('sessions', models.PositiveIntegerField(default=0, verbose_name='Новых сессий')),
+                ('active_sessions', models.PositiveIntegerField(default=0, help_text='Сессии, впервые написавшие за этот час', verbose_name='Активных сессий')),
+                ('daily_active_sessions', models.PositiveIntegerField(default=0, help_text='Сессии, впервые написавшие за день (по TIME_ZONE), учтенные в этом часе', verbose_name='Активных сессий за день')),
+                ('completions', models.PositiveIntegerField(default=0, verbose_name='Пройденных сценариев')),
+                ('tokens', models.PositiveBigIntegerField(default=0, verbose_name='Токенов (оценка)')),
+                ('provider_calls', models.PositiveIntegerField(default=0, verbose_name='Вызовов модели')),
+                ('provider_latency_ms', models.PositiveBigIntegerField(default=0, verbose_name='Суммарная задержка модели, мс')),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='bots.bot', verbose_name='Бот')),
+            ],
+            options={
+                'verbose_name': 'Использование бота за час',
+                'verbose_name_plural': 'Использование ботов по часам',
+                'ordering': ['bot', 'hour'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='botusagerollup',
+            constraint=models.UniqueConstraint(fields=('bot', 'hour'), name='unique_bot_usage_hour'),
+        ),
+    ]
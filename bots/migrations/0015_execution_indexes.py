@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0014_bot_usage_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='botexecution',
+            index=models.Index(fields=['created_at'], name='execution_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='botexecution',
+            index=models.Index(fields=['bot', 'created_at'], name='execution_bot_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='botexecution',
+            index=models.Index(fields=['user_session'], name='execution_session_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# AddField с default пересоздает таблицу выполнений, а с ней удаляются
+# триггеры полнотекстового индекса — они создаются заново
+TURN_TRIGGERS = import_module('bots.migrations.0013_search_index').TURN_TRIGGERS
+
+# Формат истории до перехода на список сообщений
+LEGACY_USER_PREFIX = 'Пользователь: '
+LEGACY_BOT_SEPARATOR = '\nБот: '
+
+
+def legacy_turns(text):
+    """
+    "Пользователь: ...\\nБот: ..." -> [{role, content}, ...]
+    """
+    if text.startswith(LEGACY_USER_PREFIX) and LEGACY_BOT_SEPARATOR in text:
+        message, _, response = text[len(LEGACY_USER_PREFIX):].partition(LEGACY_BOT_SEPARATOR)
+        return [
+            {'role': 'user', 'content': message},
+            {'role': 'assistant', 'content': response},
+        ]
+    return [{'role': 'assistant', 'content': text}] if text else []
+
+
+def convert_legacy_histories(apps, schema_editor):
+    """
+    Выполнения старого чата хранили историю строкой, по одному на сообщение:
+    история переводится в список, а выполнения закрываются — их не у кого
+    продолжать, владелец разговора у них не записан
+    """
+    BotExecution = apps.get_model('bots', 'BotExecution')
+    legacy = BotExecution.objects.extra(where=["json_type(conversation_history) <> 'array'"])
+    batch = []
+    for execution in legacy.only('pk', 'conversation_history').iterator(chunk_size=500):
+        history = execution.conversation_history
+        execution.conversation_history = legacy_turns(history) if isinstance(history, str) else []
+        execution.is_completed = True
+        batch.append(execution)
+    for start in range(0, len(batch), 500):
+        BotExecution.objects.bulk_update(batch[start:start + 500], ['conversation_history', 'is_completed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('bots', '0015_execution_indexes'),
+    ]
+
+    operations = [
+        # При откате таблица пересоздается снова: триггеры восстанавливаются последними
+        migrations.RunSQL(migrations.RunSQL.noop, TURN_TRIGGERS),
+        migrations.AddField(
+            model_name='botexecution',
+            name='user',
+            field=models.ForeignKey(blank=True, help_text='Владелец разговора: сессии разных пользователей не пересекаются', null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='botexecution',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Растет с каждым сохраненным ходом: ход, начатый на устаревшей версии, не перезаписывает чужой', verbose_name='Версия'),
+        ),
+        migrations.RunSQL(TURN_TRIGGERS, migrations.RunSQL.noop),
+        migrations.RunPython(convert_legacy_histories, migrations.RunPython.noop),
+    ]
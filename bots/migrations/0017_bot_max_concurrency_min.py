@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:14
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def raise_zero_concurrency(apps, schema_editor):
+    # С лимитом 0 чаты бота стояли в очереди до 429/504
+    apps.get_model('bots', 'Bot').objects.filter(max_concurrency=0).update(max_concurrency=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0016_execution_user_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bot',
+            name='max_concurrency',
+            field=models.PositiveIntegerField(default=4, help_text='Сколько запросов бота к модели выполняется одновременно в одном воркере', validators=[django.core.validators.MinValueValidator(1)], verbose_name='Параллельных вызовов модели'),
+        ),
+        migrations.RunPython(raise_zero_concurrency, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .graph import validate_graph
+from .steps import StepConfigError, compile_step
+
 
 class Bot(models.Model):
     BOT_TYPES = [
@@ -20,6 +24,49 @@ class Bot(models.Model):
     )
     max_tokens = models.IntegerField(default=1000, verbose_name='Максимальное количество токенов')
     system_prompt = models.TextField(blank=True, verbose_name='Системный промпт')
+    coalesce_requests = models.BooleanField(
+        default=False,
+        verbose_name='Объединять одинаковые запросы',
+        help_text='Одновременные одинаковые сообщения получают ответ одного вызова модели. '
+                  'Подходит для детерминированных ботов (температура 0)'
+    )
+    cache_responses = models.BooleanField(
+        default=False,
+        verbose_name='Кешировать ответы',
+        help_text='Одинаковые сообщения получают сохраненный ответ без вызова модели. '
+                  'Подходит для FAQ-ботов с температурой 0'
+    )
+    cache_ttl = models.PositiveIntegerField(
+        default=3600,
+        verbose_name='Время жизни кеша ответов (сек)'
+    )
+    max_concurrency = models.PositiveIntegerField(
+        default=4,
+        validators=[MinValueValidator(1)],
+        verbose_name='Параллельных вызовов модели',
+        help_text='Сколько запросов бота к модели выполняется одновременно в одном воркере'
+    )
+    schedule_weight = models.PositiveIntegerField(
+        default=1,
+        verbose_name='Вес в очереди',
+        help_text='Бот с весом 2 получает вдвое больше слотов при перегрузке, чем бот с весом 1'
+    )
+    rate_limit_session = models.PositiveIntegerField(
+        default=20,
+        verbose_name='Лимит сообщений сессии в минуту',
+        help_text='0 — без ограничения'
+    )
+    rate_limit_bot = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Лимит сообщений бота в минуту',
+        help_text='Суммарно по всем пользователям; 0 — без ограничения'
+    )
+    knowledge_top_k = models.PositiveIntegerField(
+        default=3,
+        verbose_name='Фрагментов базы знаний в запросе',
+        help_text='Сколько наиболее подходящих фрагментов документов бота отправляется модели; '
+                  '0 — не использовать базу знаний'
+    )
     is_active = models.BooleanField(default=True, verbose_name='Активен')
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Создатель')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
@@ -46,6 +93,17 @@ class Scenario(models.Model):
         related_name='initial_scenarios',
         verbose_name='Начальный шаг'
     )
+    revision = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ревизия шагов',
+        help_text='Увеличивается при каждом изменении шагов; по ней сбрасывается скомпилированный сценарий'
+    )
+    published_version = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Опубликованная версия',
+        help_text='Новые сессии проходят этот снимок сценария; пусто — текущие шаги'
+    )
     is_active = models.BooleanField(default=True, verbose_name='Активен')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
@@ -58,6 +116,12 @@ class Scenario(models.Model):
     def __str__(self):
         return f"{self.name} ({self.bot.name})"
 
+    def clean(self):
+        if self.initial_step_id is not None and not Step.objects.filter(
+            pk=self.initial_step_id, scenario_id=self.pk
+        ).exists():
+            raise ValidationError({'initial_step': 'Начальный шаг должен быть шагом этого сценария'})
+
 
 class Step(models.Model):
     STEP_TYPES = [
@@ -81,6 +145,7 @@ class Step(models.Model):
         verbose_name='Следующий шаг'
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
 
     class Meta:
         verbose_name = 'Шаг'
@@ -90,14 +155,136 @@ class Step(models.Model):
     def __str__(self):
         return f"{self.name} (Сценарий: {self.scenario.name})"
 
+    @classmethod
+    def load_graph(cls, scenario_id):
+        """
+        Все шаги сценария одним запросом по scenario_id, без прохода по
+        цепочке next_step: (id, тип, содержание, id следующего шага) по порядку
+        """
+        return list(cls.objects.filter(scenario_id=scenario_id).order_by('order', 'pk').values_list(
+            'pk', 'step_type', 'content', 'next_step_id'
+        ))
+
+    def clean(self):
+        """
+        Содержание шага разбирается при сохранении: ошибки в условиях
+        видны сразу, а не на ходу разговора. Граф сценария с измененным
+        шагом проверяется на переходы в чужие сценарии и циклы без вопросов.
+        """
+        try:
+            compile_step(self.pk, self.step_type, self.content, self.next_step_id)
+        except StepConfigError as e:
+            raise ValidationError({'content': str(e)})
+        if self.scenario_id is None:
+            return
+
+        row = (self.pk, self.step_type, self.content, self.next_step_id)
+        rows = [step for step in Step.load_graph(self.scenario_id) if step[0] != self.pk]
+        rows.append(row)
+        for problem in validate_graph(None, rows):
+            if problem['code'] == 'outside_target' and problem['step'] == self.pk:
+                if self.next_step_id in problem['targets']:
+                    raise ValidationError({'next_step': 'Следующий шаг должен быть из того же сценария'})
+                raise ValidationError({'content': f'Шаги {problem["targets"]} не найдены в сценарии'})
+            if problem['code'] == 'cycle' and self.pk is not None and self.pk in problem['steps']:
+                raise ValidationError({'next_step': problem['message']})
+
+
+class ScenarioSnapshot(models.Model):
+    """
+    Опубликованная версия сценария: все шаги одним неизменяемым блобом
+    (JSON, сжатый zlib), который загружается и компилируется целиком
+    """
+    scenario = models.ForeignKey(
+        Scenario,
+        on_delete=models.CASCADE,
+        related_name='snapshots',
+        verbose_name='Сценарий'
+    )
+    version = models.PositiveIntegerField(verbose_name='Версия')
+    revision = models.PositiveIntegerField(verbose_name='Ревизия шагов')
+    data = models.BinaryField(verbose_name='Шаги (zlib JSON)')
+    step_count = models.PositiveIntegerField(default=0, verbose_name='Шагов')
+    published_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name='Опубликовал'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Версия сценария'
+        verbose_name_plural = 'Версии сценариев'
+        ordering = ['scenario', '-version']
+        constraints = [
+            models.UniqueConstraint(fields=['scenario', 'version'], name='unique_scenario_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.scenario.name} v{self.version}"
+
 
 class BotExecution(models.Model):
     bot = models.ForeignKey(Bot, on_delete=models.CASCADE, verbose_name='Бот')
-    scenario = models.ForeignKey(Scenario, on_delete=models.CASCADE, verbose_name='Сценарий')
+    scenario = models.ForeignKey(
+        Scenario,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name='Сценарий'
+    )
+    scenario_version = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Версия сценария',
+        help_text='Снимок сценария, закрепленный за сессией при создании'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name='Пользователь',
+        help_text='Владелец разговора: сессии разных пользователей не пересекаются'
+    )
     user_session = models.CharField(max_length=100, verbose_name='Сессия пользователя')
-    current_step = models.ForeignKey(Step, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Текущий шаг')
+    # Без ограничения в БД: шаг опубликованной версии остается текущим,
+    # даже если его строку уже удалили из черновика сценария
+    current_step = models.ForeignKey(
+        Step,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        verbose_name='Текущий шаг'
+    )
     conversation_history = models.JSONField(default=list, verbose_name='История разговора')
+    variables = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Переменные сессии',
+        help_text='Ответы на вопросы сценария; доступны в условиях шагов'
+    )
+    context_start = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Начало окна контекста',
+        help_text='Индекс первого сообщения истории, которое отправляется модели'
+    )
+    context_tokens = models.PositiveIntegerField(default=0, verbose_name='Токенов в окне контекста')
+    summary = models.TextField(blank=True, verbose_name='Краткое содержание разговора')
+    summarized_until = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Сообщений в кратком содержании',
+        help_text='Первые сообщения истории, которые заменены кратким содержанием'
+    )
     is_completed = models.BooleanField(default=False, verbose_name='Завершено')
+    version = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Версия',
+        help_text='Растет с каждым сохраненным ходом: ход, начатый на устаревшей версии, не перезаписывает чужой'
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
 
@@ -105,6 +292,92 @@ class BotExecution(models.Model):
         verbose_name = 'Выполнение бота'
         verbose_name_plural = 'Выполнения ботов'
         ordering = ['-created_at']
+        # Списки и выбор дат в админке идут по индексам, а не просмотром таблицы
+        indexes = [
+            models.Index(fields=['created_at'], name='execution_created_idx'),
+            models.Index(fields=['bot', 'created_at'], name='execution_bot_created_idx'),
+            models.Index(fields=['user_session'], name='execution_session_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bot.name} - {self.user_session}"
+
+
+class KnowledgeDocument(models.Model):
+    bot = models.ForeignKey(Bot, on_delete=models.CASCADE, related_name='documents', verbose_name='Бот')
+    title = models.CharField(max_length=200, verbose_name='Название документа')
+    text = models.TextField(verbose_name='Текст')
+    indexed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Проиндексирован',
+        help_text='Версия документа (дата обновления), вошедшая в поисковый индекс бота'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Документ базы знаний'
+        verbose_name_plural = 'Документы базы знаний'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.title} ({self.bot.name})"
+
+
+class KnowledgeChunk(models.Model):
+    document = models.ForeignKey(
+        KnowledgeDocument,
+        on_delete=models.CASCADE,
+        related_name='chunks',
+        verbose_name='Документ'
+    )
+    position = models.PositiveIntegerField(verbose_name='Номер фрагмента')
+    text = models.TextField(verbose_name='Текст фрагмента')
+    terms = models.JSONField(default=dict, verbose_name='Частоты терминов')
+    length = models.PositiveIntegerField(default=0, verbose_name='Длина в терминах')
+
+    class Meta:
+        verbose_name = 'Фрагмент документа'
+        verbose_name_plural = 'Фрагменты документов'
+        ordering = ['document', 'position']
+
+    def __str__(self):
+        return f"{self.document.title} #{self.position}"
+
+
+class BotUsageRollup(models.Model):
+    """
+    Использование бота за час: счетчики копятся в процессе и дописываются
+    сюда прибавлением (bots/usage.py), поэтому статистика не требует
+    просмотра выполнений
+    """
+    bot = models.ForeignKey(Bot, on_delete=models.CASCADE, related_name='usage', verbose_name='Бот')
+    hour = models.DateTimeField(verbose_name='Час')
+    turns = models.PositiveIntegerField(default=0, verbose_name='Ходов разговора')
+    sessions = models.PositiveIntegerField(default=0, verbose_name='Новых сессий')
+    active_sessions = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Активных сессий',
+        help_text='Сессии, впервые написавшие за этот час'
+    )
+    daily_active_sessions = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Активных сессий за день',
+        help_text='Сессии, впервые написавшие за день (по TIME_ZONE), учтенные в этом часе'
+    )
+    completions = models.PositiveIntegerField(default=0, verbose_name='Пройденных сценариев')
+    tokens = models.PositiveBigIntegerField(default=0, verbose_name='Токенов (оценка)')
+    provider_calls = models.PositiveIntegerField(default=0, verbose_name='Вызовов модели')
+    provider_latency_ms = models.PositiveBigIntegerField(default=0, verbose_name='Суммарная задержка модели, мс')
+
+    class Meta:
+        verbose_name = 'Использование бота за час'
+        verbose_name_plural = 'Использование ботов по часам'
+        ordering = ['bot', 'hour']
+        constraints = [
+            models.UniqueConstraint(fields=['bot', 'hour'], name='unique_bot_usage_hour'),
+        ]
 
     def __str__(self):
-        return f"{self.bot.name} - {self.user_session}"
\ No newline at end of file
+        return f"{self.bot.name} {self.hour:%Y-%m-%d %H:00}"
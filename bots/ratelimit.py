@@ -0,0 +1,192 @@
+# bots/ratelimit.py
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+from .models import Bot
+
+KEY_PREFIX = 'ratelimit'
+BOT_LIMITS_TTL = 60
+
+# Все корзины проверяются и списываются атомарно: если хотя бы в одной
+# не хватает токена, ни одна не списывается. ARGV: пары (скорость, емкость)
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local states = {}
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local capacity = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then
+        retry_after = math.max(retry_after, (1 - tokens) / rate)
+    end
+    states[i] = tokens
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local capacity = tonumber(ARGV[i * 2])
+    local tokens = states[i]
+    if retry_after == 0 then
+        tokens = tokens - 1
+    end
+    redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return tostring(retry_after)
+"""
+
+
+class Limit:
+    """
+    Корзина токенов: limit запросов в минуту с таким же запасом на всплеск
+    """
+
+    def __init__(self, name, key, per_minute):
+        self.name = name
+        self.key = f'{KEY_PREFIX}:{name}:{key}'
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+
+
+class LocalMemoryStore:
+    """
+    Корзины в памяти процесса — для тестов и запуска без Redis.
+    Как EXPIRE в Redis: корзина, которая успела снова наполниться,
+    ничем не отличается от новой, поэтому такие корзины удаляются
+    проходом раз в SWEEP_INTERVAL секунд
+    """
+    SWEEP_INTERVAL = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._next_sweep = time.monotonic() + self.SWEEP_INTERVAL
+
+    def consume(self, limits):
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._next_sweep:
+                self._sweep(now)
+            states = []
+            retry_after = 0.0
+            for limit in limits:
+                tokens, ts, _ = self._buckets.get(limit.key, (limit.capacity, now, now))
+                tokens = min(limit.capacity, tokens + (now - ts) * limit.rate)
+                if tokens < 1:
+                    retry_after = max(retry_after, (1 - tokens) / limit.rate)
+                states.append(tokens)
+            for limit, tokens in zip(limits, states):
+                if not retry_after:
+                    tokens -= 1
+                # Когда корзина снова будет полной
+                full_at = now + (limit.capacity - tokens) / limit.rate
+                self._buckets[limit.key] = (tokens, now, full_at)
+            return retry_after
+
+    def _sweep(self, now):
+        self._buckets = {key: state for key, state in self._buckets.items() if state[2] > now}
+        self._next_sweep = now + self.SWEEP_INTERVAL
+
+
+class RedisStore:
+    """
+    Корзины в Redis, общие для всех воркеров; проверка — один вызов Lua-скрипта
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.script = redis.Redis.from_url(url).register_script(TOKEN_BUCKET_SCRIPT)
+
+    def consume(self, limits):
+        args = []
+        for limit in limits:
+            args.extend([limit.rate, limit.capacity])
+        return float(self.script(keys=[limit.key for limit in limits], args=args))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.CHAT_RATE_LIMIT_BACKEND == 'redis':
+                    _store = RedisStore(settings.REDIS_URL)
+                else:
+                    _store = LocalMemoryStore()
+    return _store
+
+
+def get_bot_limits(bot_id):
+    """
+    Лимиты бота (на сессию и суммарный) из кеша, без обращения к БД на каждый запрос
+    """
+    key = f'{KEY_PREFIX}:bot-limits:{bot_id}'
+    limits = cache.get(key)
+    if limits is None:
+        limits = Bot.objects.filter(pk=bot_id).values_list(
+            'rate_limit_session', 'rate_limit_bot'
+        ).first() or (0, 0)
+        cache.set(key, limits, BOT_LIMITS_TTL)
+    return limits
+
+
+def forget_bot_limits(bot_id):
+    cache.delete(f'{KEY_PREFIX}:bot-limits:{bot_id}')
+
+
+def check_chat_limits(bot_id, user_id, user_session):
+    """
+    Списывает токен из корзин сессии, пользователя и бота;
+    возвращает 0 или через сколько секунд можно повторить
+    """
+    session_limit, bot_limit = get_bot_limits(bot_id)
+    limits = []
+    if session_limit:
+        limits.append(Limit('session', f'{bot_id}:{user_id}:{user_session}', session_limit))
+    if settings.CHAT_RATE_LIMIT_USER:
+        limits.append(Limit('user', user_id, settings.CHAT_RATE_LIMIT_USER))
+    if bot_limit:
+        limits.append(Limit('bot', bot_id, bot_limit))
+    if not limits:
+        return 0
+
+    retry_after = get_store().consume(limits)
+    if retry_after:
+        metrics.increment('ratelimit.rejected')
+        return math.ceil(retry_after)
+    return 0
+
+
+class ChatRateThrottle(BaseThrottle):
+    """
+    Ограничение частоты сообщений в чат; DRF проверяет его до вызова
+    действия, поэтому лишние запросы не доходят ни до БД, ни до модели
+    """
+
+    def allow_request(self, request, view):
+        bot_id = str(view.kwargs.get(view.lookup_url_kwarg or view.lookup_field))
+        if not bot_id.isdigit():
+            # Некорректный id обработает само действие (404)
+            return True
+        data = request.data if hasattr(request.data, 'get') else {}
+        user_session = str(data.get('user_session') or 'default_session')[:100]
+        self.retry_after = check_chat_limits(bot_id, request.user.pk, user_session)
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
@@ -0,0 +1,139 @@
+# bots/response_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import metrics
+
+KEY_PREFIX = 'chat-response'
+
+
+class LocalMemoryBackend:
+    """
+    LRU-кеш в памяти процесса с ограничением по числу записей и TTL
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment('response_cache.evictions')
+
+    def get_generation(self, name):
+        with self._lock:
+            return self._generations.get(name, 0)
+
+    def bump_generation(self, name, prefix):
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+            # Старые записи и так недостижимы, но место освобождаем сразу
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+
+class RedisBackend:
+    """
+    Общий для всех воркеров кеш в Redis
+
+    Размер ограничивается самим Redis: maxmemory и политика allkeys-lru.
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return None if value is None else value.decode('utf-8')
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value.encode('utf-8'), ex=ttl)
+
+    def get_generation(self, name):
+        value = self.client.get(name)
+        return int(value) if value is not None else 0
+
+    def bump_generation(self, name, prefix):
+        self.client.incr(name)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if settings.CHAT_RESPONSE_CACHE_BACKEND == 'redis':
+                    _backend = RedisBackend(settings.REDIS_URL)
+                else:
+                    _backend = LocalMemoryBackend(settings.CHAT_RESPONSE_CACHE_MAX_ENTRIES)
+    return _backend
+
+
+def _generation_key(bot_id):
+    return f'{KEY_PREFIX}:{bot_id}:generation'
+
+
+def _entry_prefix(bot_id):
+    return f'{KEY_PREFIX}:{bot_id}:entry:'
+
+
+def entry_key(bot_id, request_key):
+    """
+    Ключ записи в текущем поколении кеша бота
+    """
+    generation = get_backend().get_generation(_generation_key(bot_id))
+    return f'{_entry_prefix(bot_id)}{generation}:{request_key}'
+
+
+def get_response(key):
+    value = get_backend().get(key)
+    metrics.increment('response_cache.hits' if value is not None else 'response_cache.misses')
+    return value
+
+
+def store_response(key, response, ttl):
+    get_backend().set(key, response, ttl)
+
+
+def invalidate_bot(bot_id):
+    """
+    Сбрасывает все закешированные ответы бота (вызывается при его изменении)
+    """
+    get_backend().bump_generation(_generation_key(bot_id), _entry_prefix(bot_id))
+    metrics.increment('response_cache.invalidations')
+
+
+def hit_rate():
+    hits = metrics.get('response_cache.hits')
+    total = hits + metrics.get('response_cache.misses')
+    return round(hits / total, 4) if total else None
+
+
+metrics.register_gauge('response_cache.hit_rate', hit_rate)
@@ -0,0 +1,224 @@
+# bots/runtime.py
+import json
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import api_calls, usage
+from .graph import validate_graph
+from .models import Scenario, ScenarioSnapshot, Step
+from .steps import StepConfigError, compile_step
+
+logger = logging.getLogger(__name__)
+
+# Защита от зацикленных сценариев: больше шагов за один ход не проходим
+MAX_STEPS_PER_TURN = 50
+
+# Сколько опубликованных версий сценариев держится скомпилированными в процессе
+MAX_CACHED_SNAPSHOTS = 256
+
+
+class CompiledScenario:
+    """
+    Все шаги сценария одной ревизии, скомпилированные при загрузке
+    """
+
+    def __init__(self, scenario_id, version, initial_step_id, steps):
+        self.scenario_id = scenario_id
+        # Ревизия и начальный шаг из БД: по ним проверяется актуальность
+        self.version = version
+        self.initial_step_id = initial_step_id
+        self.steps = steps
+
+
+_scenarios = {}
+_scenarios_lock = threading.Lock()
+
+
+def load_scenario(scenario_id):
+    """
+    Скомпилированный сценарий из кеша процесса. На ход — один запрос за
+    ревизией; шаги загружаются и компилируются заново, только когда
+    ревизия изменилась.
+    """
+    version = Scenario.objects.filter(pk=scenario_id).values_list('revision', 'initial_step_id').first()
+    if version is None:
+        return None
+
+    cached = _scenarios.get(scenario_id)
+    if cached is not None and cached.version == version:
+        return cached
+
+    compiled = _compile(scenario_id, version, version[1], Step.load_graph(scenario_id))
+    with _scenarios_lock:
+        _scenarios[scenario_id] = compiled
+    return compiled
+
+
+def _compile(scenario_id, version, initial_step_id, rows):
+    steps = {}
+    for step_id, step_type, content, next_step_id in rows:
+        steps[step_id] = compile_step(step_id, step_type, content, next_step_id)
+    if initial_step_id is None and steps:
+        # Начальный шаг не задан — начинаем с первого по порядку
+        initial_step_id = next(iter(steps))
+    return CompiledScenario(scenario_id, version, initial_step_id, steps)
+
+
+_snapshots = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+def publish_scenario(scenario, user=None):
+    """
+    Замораживает текущие шаги сценария в новую версию и делает ее
+    опубликованной. (снимок, создан ли он): если шаги не менялись
+    с прошлой публикации, возвращается существующая версия.
+    StepConfigError, если в графе шагов есть ошибки (validate_graph).
+    """
+    with transaction.atomic():
+        scenario = Scenario.objects.select_for_update().get(pk=scenario.pk)
+        rows = Step.load_graph(scenario.pk)
+        errors = [problem['message'] for problem in validate_graph(scenario.initial_step_id, rows)
+                  if problem['level'] == 'error']
+        if errors:
+            raise StepConfigError('; '.join(errors))
+        data = zlib.compress(json.dumps(
+            {'initial_step': scenario.initial_step_id, 'steps': rows},
+            ensure_ascii=False, separators=(',', ':'),
+        ).encode(), 9)
+
+        latest = scenario.snapshots.order_by('-version').first()
+        if latest is not None and bytes(latest.data) == data:
+            if scenario.published_version != latest.version:
+                Scenario.objects.filter(pk=scenario.pk).update(
+                    published_version=latest.version, updated_at=timezone.now()
+                )
+            return latest, False
+
+        snapshot = ScenarioSnapshot.objects.create(
+            scenario=scenario,
+            version=latest.version + 1 if latest is not None else 1,
+            revision=scenario.revision,
+            data=data,
+            step_count=len(rows),
+            published_by=user,
+        )
+        Scenario.objects.filter(pk=scenario.pk).update(
+            published_version=snapshot.version, updated_at=timezone.now()
+        )
+    return snapshot, True
+
+
+def load_snapshot(scenario_id, version):
+    """
+    Скомпилированная опубликованная версия сценария. Версии неизменяемы,
+    поэтому блоб читается одним запросом один раз на процесс.
+    """
+    key = (scenario_id, version)
+    cached = _snapshots.get(key)
+    if cached is not None:
+        return cached
+
+    data = ScenarioSnapshot.objects.filter(scenario_id=scenario_id, version=version).values_list(
+        'data', flat=True
+    ).first()
+    if data is None:
+        return None
+    frozen = json.loads(zlib.decompress(data))
+    compiled = _compile(scenario_id, key, frozen['initial_step'], frozen['steps'])
+    with _snapshots_lock:
+        _snapshots[key] = compiled
+        while len(_snapshots) > MAX_CACHED_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return compiled
+
+
+def advance_scenario(execution, message, deadline=None):
+    """
+    Проводит выполнение по шагам сценария на одно сообщение пользователя.
+
+    Возвращает текст ответа или None, если сценария нет или он уже пройден —
+    тогда отвечает модель. Сессия проходит закрепленную за ней
+    опубликованную версию, а без нее — текущие шаги сценария.
+    Текущий шаг и переменные меняются в execution, сохраняет их record_turn.
+    deadline хода ограничивает ожидание внешних вызовов шагов api_call.
+    """
+    if execution.scenario_id is None:
+        return None
+    current_step_id = execution.current_step_id
+    if current_step_id is None and execution.conversation_history:
+        return None
+
+    try:
+        if execution.scenario_version is not None:
+            scenario = load_snapshot(execution.scenario_id, execution.scenario_version)
+        else:
+            scenario = load_scenario(execution.scenario_id)
+    except StepConfigError as e:
+        logger.warning('Сценарий %s не скомпилирован: %s', execution.scenario_id, e)
+        return None
+    if scenario is None:
+        return None
+
+    replies = []
+    if current_step_id is None:
+        step_id = scenario.initial_step_id
+    else:
+        step = scenario.steps.get(current_step_id)
+        if step is None:
+            # Шаг, на котором ждали ответа, удален
+            execution.current_step_id = None
+            return None
+        if step.step_type == 'question':
+            reply, error = step.accept(message, execution.variables)
+            if error is not None:
+                # Ответ не принят — остаемся на вопросе
+                return error
+            if reply:
+                replies.append(reply)
+        step_id = step.next_step_id
+
+    for _ in range(MAX_STEPS_PER_TURN):
+        step = scenario.steps.get(step_id) if step_id is not None else None
+        if step is None:
+            break
+        if step.step_type == 'message':
+            replies.append(step.text)
+            step_id = step.next_step_id
+        elif step.step_type == 'question':
+            replies.append(step.text)
+            execution.current_step_id = step.id
+            return '\n\n'.join(replies)
+        elif step.step_type == 'condition':
+            step_id = step.choose(message, execution.variables)
+        elif step.step_type == 'api_call':
+            try:
+                result = api_calls.executor.request(
+                    **step.build_request(message, execution.variables), deadline=deadline
+                )
+            except api_calls.ApiCallError as e:
+                logger.warning('Шаг %s: %s', step.id, e)
+                if step.error_message:
+                    replies.append(step.error_message)
+                step_id = step.on_error_id if step.on_error_id is not None else step.next_step_id
+                continue
+            reply = step.accept(result, message, execution.variables)
+            if reply:
+                replies.append(reply)
+            step_id = step.next_step_id
+        else:
+            step_id = step.next_step_id
+    else:
+        logger.warning('Сценарий %s: больше %s шагов за ход', scenario.scenario_id, MAX_STEPS_PER_TURN)
+        execution.current_step_id = None
+        return '\n\n'.join(replies) if replies else None
+
+    # Сценарий пройден до конца
+    usage.record_completion(execution.bot_id)
+    execution.current_step_id = None
+    return '\n\n'.join(replies) if replies else None
@@ -0,0 +1,178 @@
+# bots/scheduler.py
+import bisect
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import metrics
+
+
+class SchedulerBusy(Exception):
+    """Очередь бота переполнена или ожидание слота слишком долгое"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Бот перегружен, повторите через {retry_after} с')
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ('finish', 'seq', 'bot_id', 'model', 'bot_limit', 'granted', 'enqueued_at')
+
+    def __init__(self, finish, seq, bot_id, model, bot_limit):
+        self.finish = finish
+        self.seq = seq
+        self.bot_id = bot_id
+        self.model = model
+        self.bot_limit = bot_limit
+        self.granted = threading.Event()
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.finish, self.seq) < (other.finish, other.seq)
+
+
+class FairScheduler:
+    """
+    Ограничение параллельных вызовов модели с честной очередью между ботами
+
+    Одновременно выполняется не больше bot_limit вызовов одного бота и
+    model_limit вызовов одной модели. Ожидающие вызовы упорядочены по
+    виртуальному времени завершения (weighted fair queuing): бот с весом 2
+    получает вдвое больше слотов, чем бот с весом 1, а шумный бот не может
+    занять очередь перед остальными. Работает в пределах процесса.
+    """
+
+    def __init__(self, model_limit, queue_size, max_wait):
+        self.model_limit = model_limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._waiting = []
+        self._queued_by_bot = {}
+        self._running_by_bot = {}
+        self._running_by_model = {}
+        self._last_finish = {}
+        self._virtual_time = 0.0
+        self._service_time = 1.0
+
+    @contextmanager
+    def slot(self, bot_id, model, weight=1, bot_limit=1, timeout=None):
+        self.acquire(bot_id, model, weight, bot_limit, timeout)
+        with self._holding(bot_id, model):
+            yield
+
+    def try_slot(self, bot_id, model, bot_limit=1):
+        """
+        Слот без ожидания (для дублирующего запроса): None, если бот или
+        модель на пределе или кто-то уже ждет в очереди
+        """
+        with self._lock:
+            if (self._waiting
+                    or self._running_by_bot.get(bot_id, 0) >= max(bot_limit, 1)
+                    or self._running_by_model.get(model, 0) >= self.model_limit):
+                return None
+            self._running_by_bot[bot_id] = self._running_by_bot.get(bot_id, 0) + 1
+            self._running_by_model[model] = self._running_by_model.get(model, 0) + 1
+        return self._holding(bot_id, model)
+
+    @contextmanager
+    def _holding(self, bot_id, model):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(bot_id, model, time.monotonic() - started)
+
+    def acquire(self, bot_id, model, weight=1, bot_limit=1, timeout=None):
+        """
+        Ждет слот не дольше max_wait (и timeout, если он меньше)
+        """
+        max_wait = self.max_wait if timeout is None else min(self.max_wait, timeout)
+        # С лимитом 0 вызов никогда не получил бы слот
+        bot_limit = max(bot_limit, 1)
+        with self._lock:
+            if self._queued_by_bot.get(bot_id, 0) >= self.queue_size:
+                metrics.increment('scheduler.rejected')
+                raise SchedulerBusy(self._retry_after(bot_id, bot_limit))
+
+            start = max(self._virtual_time, self._last_finish.get(bot_id, 0.0))
+            finish = start + 1.0 / max(weight, 1)
+            self._last_finish[bot_id] = finish
+            ticket = _Ticket(finish, next(self._seq), bot_id, model, bot_limit)
+            bisect.insort(self._waiting, ticket)
+            self._queued_by_bot[bot_id] = self._queued_by_bot.get(bot_id, 0) + 1
+            self._dispatch()
+
+        if not ticket.granted.wait(max_wait):
+            with self._lock:
+                if not ticket.granted.is_set():
+                    self._waiting.remove(ticket)
+                    self._queued_by_bot[bot_id] -= 1
+                    metrics.increment('scheduler.rejected')
+                    raise SchedulerBusy(self._retry_after(bot_id, bot_limit))
+
+        metrics.increment('scheduler.dispatched')
+        metrics.increment('scheduler.wait_ms_total', int((time.monotonic() - ticket.enqueued_at) * 1000))
+
+    def release(self, bot_id, model, service_time):
+        with self._lock:
+            self._running_by_bot[bot_id] -= 1
+            self._running_by_model[model] -= 1
+            self._service_time = 0.8 * self._service_time + 0.2 * service_time
+            self._dispatch()
+
+    def _dispatch(self):
+        """
+        Выдает слоты ожидающим в порядке виртуального времени, пропуская
+        тех, чей бот или модель уже на пределе
+        """
+        index = 0
+        while index < len(self._waiting):
+            ticket = self._waiting[index]
+            if (self._running_by_bot.get(ticket.bot_id, 0) >= ticket.bot_limit
+                    or self._running_by_model.get(ticket.model, 0) >= self.model_limit):
+                index += 1
+                continue
+            del self._waiting[index]
+            self._queued_by_bot[ticket.bot_id] -= 1
+            self._running_by_bot[ticket.bot_id] = self._running_by_bot.get(ticket.bot_id, 0) + 1
+            self._running_by_model[ticket.model] = self._running_by_model.get(ticket.model, 0) + 1
+            self._virtual_time = max(self._virtual_time, ticket.finish)
+            ticket.granted.set()
+
+    def _retry_after(self, bot_id, bot_limit):
+        """
+        Оценка в секундах: сколько займет очередь бота при текущем времени вызова
+        """
+        queued = self._queued_by_bot.get(bot_id, 0) + 1
+        return max(1, math.ceil(self._service_time * queued / max(bot_limit, 1)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': {str(k): v for k, v in self._queued_by_bot.items() if v},
+                'running_by_bot': {str(k): v for k, v in self._running_by_bot.items() if v},
+                'running_by_model': {k: v for k, v in self._running_by_model.items() if v},
+                'queue_depth': len(self._waiting),
+            }
+
+
+scheduler = FairScheduler(
+    model_limit=settings.CHAT_SCHEDULER_MODEL_CONCURRENCY,
+    queue_size=settings.CHAT_SCHEDULER_QUEUE_SIZE,
+    max_wait=settings.CHAT_SCHEDULER_MAX_WAIT,
+)
+
+
+def average_wait_ms():
+    dispatched = metrics.get('scheduler.dispatched')
+    return round(metrics.get('scheduler.wait_ms_total') / dispatched, 1) if dispatched else None
+
+
+metrics.register_gauge('scheduler', scheduler.stats)
+metrics.register_gauge('scheduler.average_wait_ms', average_wait_ms)
@@ -0,0 +1,115 @@
+# bots/search.py
+import re
+
+from django.db import connection
+
+# Таблицы FTS5 и триггеры, которые держат их в актуальном состоянии,
+# создаются миграцией 0013_search_index
+
+# Подсветка найденных слов во фрагментах и длина фрагмента в словах
+SNIPPET_MARKS = ('**', '**')
+SNIPPET_WORDS = 12
+
+MAX_QUERY_TERMS = 10
+
+TERM_RE = re.compile(r'\w+')
+
+
+def match_expression(query):
+    """
+    Запрос пользователя -> выражение MATCH FTS5: каждое слово в кавычках
+    (спецсимволы синтаксиса FTS5 не мешают) и с поиском по началу слова,
+    чтобы "оплат" находило "оплата" и "оплаты". "ё" заменяется на "е",
+    как и в индексе. None, если слов нет.
+    """
+    terms = TERM_RE.findall(query.replace('ё', 'е').replace('Ё', 'Е'))[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def search_turns(query, bot_id=None, limit=20):
+    """
+    Сообщения разговоров по релевантности (BM25) с фрагментом текста
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    sql = f"""
+        SELECT bots_turn_search.execution_id, bots_turn_search.bot_id, execution.user_session,
+               bots_turn_search.position, bots_turn_search.role,
+               snippet(bots_turn_search, 0, %s, %s, '…', {SNIPPET_WORDS}) AS snippet,
+               bots_turn_search.rank
+        FROM bots_turn_search
+        JOIN bots_botexecution AS execution ON execution.id = bots_turn_search.execution_id
+        WHERE bots_turn_search MATCH %s {'AND bots_turn_search.bot_id = %s' if bot_id else ''}
+        ORDER BY bots_turn_search.rank
+        LIMIT %s
+    """
+    params = [*SNIPPET_MARKS, expression, *([int(bot_id)] if bot_id else []), limit]
+    return _fetch(sql, params)
+
+
+def search_steps(query, bot_id=None, scenario_id=None, limit=20):
+    """
+    Шаги сценариев, в названии или тексте которых есть слова запроса
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    conditions, params = [], []
+    if bot_id:
+        conditions.append('AND scenario.bot_id = %s')
+        params.append(int(bot_id))
+    if scenario_id:
+        conditions.append('AND bots_step_search.scenario_id = %s')
+        params.append(int(scenario_id))
+    sql = f"""
+        SELECT bots_step_search.rowid AS step_id, bots_step_search.scenario_id, scenario.bot_id,
+               bots_step_search.name,
+               snippet(bots_step_search, -1, %s, %s, '…', {SNIPPET_WORDS}) AS snippet,
+               bots_step_search.rank
+        FROM bots_step_search
+        JOIN bots_scenario AS scenario ON scenario.id = bots_step_search.scenario_id
+        WHERE bots_step_search MATCH %s {' '.join(conditions)}
+        ORDER BY bots_step_search.rank
+        LIMIT %s
+    """
+    return _fetch(sql, [*SNIPPET_MARKS, expression, *params, limit])
+
+
+def matching_execution_ids(query, limit):
+    """
+    id выполнений, в разговорах которых есть слова запроса (для админки)
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT DISTINCT execution_id FROM bots_turn_search WHERE bots_turn_search MATCH %s LIMIT %s',
+            [expression, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def matching_step_ids(query, limit):
+    """
+    id шагов, в названии или тексте которых есть слова запроса (для админки)
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid FROM bots_step_search WHERE bots_step_search MATCH %s LIMIT %s',
+            [expression, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
@@ -1,6 +1,10 @@
 # bots/serializers.py
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from .models import Bot, Scenario, Step, BotExecution
+from .models import Bot, Scenario, ScenarioSnapshot, Step, BotExecution, KnowledgeDocument
+
+CHAT_MESSAGE_MAX_LENGTH = 1000
 
 
 class BotSerializer(serializers.ModelSerializer):
@@ -14,7 +18,34 @@ class ScenarioSerializer(serializers.ModelSerializer):
     class Meta:
         model = Scenario
         fields = '__all__'
-        read_only_fields = ('created_at', 'updated_at')
+        read_only_fields = ('revision', 'published_version', 'created_at', 'updated_at')
+
+    def validate(self, attrs):
+        """
+        Начальный шаг должен принадлежать этому сценарию
+        """
+        if 'initial_step' in attrs:
+            scenario = Scenario(pk=getattr(self.instance, 'pk', None), initial_step=attrs['initial_step'])
+            try:
+                scenario.clean()
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.message_dict)
+        return attrs
+
+
+class ScenarioSnapshotSerializer(serializers.ModelSerializer):
+    size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ScenarioSnapshot
+        fields = ('id', 'scenario', 'version', 'revision', 'step_count', 'size', 'published_by', 'created_at')
+        read_only_fields = fields
+
+    def get_size(self, obj):
+        """
+        Размер сжатого блоба в байтах
+        """
+        return len(obj.data)
 
 
 class StepSerializer(serializers.ModelSerializer):
@@ -23,6 +54,22 @@ class StepSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
 
+    def validate(self, attrs):
+        """
+        Проверка содержания шага (в том числе условий) моделью, как в админке
+        """
+        fields = ('name', 'step_type', 'scenario', 'content', 'order', 'next_step')
+        values = {
+            field: attrs[field] if field in attrs else getattr(self.instance, field, None)
+            for field in fields
+        }
+        step = Step(pk=getattr(self.instance, 'pk', None), **values)
+        try:
+            step.clean()
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
+        return attrs
+
 
 class BotExecutionSerializer(serializers.ModelSerializer):
     bot_name = serializers.CharField(source='bot.name', read_only=True)
@@ -33,8 +80,47 @@ class BotExecutionSerializer(serializers.ModelSerializer):
         read_only_fields = ('started_at', 'updated_at')
 
 
+class KnowledgeDocumentSerializer(serializers.ModelSerializer):
+    file = serializers.FileField(write_only=True, required=False, help_text='Текстовый файл в UTF-8')
+
+    class Meta:
+        model = KnowledgeDocument
+        fields = '__all__'
+        read_only_fields = ('indexed_at', 'created_at', 'updated_at')
+        extra_kwargs = {'text': {'required': False}, 'title': {'required': False}}
+
+    def validate(self, attrs):
+        upload = attrs.pop('file', None)
+        if upload is not None:
+            try:
+                attrs['text'] = upload.read().decode('utf-8')
+            except UnicodeDecodeError:
+                raise serializers.ValidationError({'file': 'Файл должен быть текстом в кодировке UTF-8'})
+            attrs.setdefault('title', upload.name)
+        if not self.partial:
+            if not attrs.get('text'):
+                raise serializers.ValidationError({'text': 'Передайте текст документа или файл'})
+            if not attrs.get('title'):
+                raise serializers.ValidationError({'title': 'Обязательное поле.'})
+        return attrs
+
+
 class ChatSerializer(serializers.Serializer):
-    message = serializers.CharField(max_length=1000)
+    message = serializers.CharField(max_length=CHAT_MESSAGE_MAX_LENGTH)
     user_session = serializers.CharField(max_length=100, required=False)
     scenario_id = serializers.IntegerField(required=False)
-    
\ No newline at end of file
+
+
+class ChatBatchItemSerializer(ChatSerializer):
+    bot = serializers.IntegerField()
+    user_session = serializers.CharField(max_length=100, required=False, default='default_session')
+
+
+class ChatBatchSerializer(serializers.Serializer):
+    # Элементы проверяются по одному в ChatBatchItemSerializer: ошибка
+    # в одном элементе — его результат, а не отказ всему пакету
+    items = serializers.ListField(
+        child=serializers.DictField(),
+        min_length=1,
+        max_length=settings.CHAT_BATCH_MAX_ITEMS
+    )
@@ -0,0 +1,36 @@
+# bots/signals.py
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Bot, KnowledgeDocument, Scenario, Step
+from . import knowledge, ratelimit, response_cache
+
+
+@receiver([post_save, post_delete], sender=Bot)
+def invalidate_bot_cache(sender, instance, **kwargs):
+    """
+    Любая правка бота сбрасывает его закешированные ответы и лимиты
+    """
+    response_cache.invalidate_bot(instance.pk)
+    ratelimit.forget_bot_limits(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=KnowledgeDocument)
+def refresh_knowledge_index(sender, instance, **kwargs):
+    """
+    Документ добавлен, изменен или удален — индекс бота обновляется в фоне
+    """
+    knowledge.schedule_refresh(instance.bot_id)
+
+
+@receiver([post_save, post_delete], sender=Step)
+def bump_scenario_revision(sender, instance, **kwargs):
+    """
+    Изменение шага — новая ревизия сценария: скомпилированные шаги
+    прежней ревизии больше не используются
+    """
+    Scenario.objects.filter(pk=instance.scenario_id).update(
+        revision=F('revision') + 1, updated_at=timezone.now()
+    )
@@ -0,0 +1,356 @@
+# bots/steps.py
+import re
+import string
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.http.request import validate_host
+
+from .api_calls import is_allowed_address, is_ip_literal
+from .conditions import ConditionError, compile_condition
+
+TEMPLATE_FIELD_RE = re.compile(r'^\w+$')
+
+API_CALL_METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+class StepConfigError(ValueError):
+    """Некорректное содержание шага сценария"""
+
+
+class CompiledStep:
+    """
+    Шаг сценария, подготовленный для выполнения: content разобран один раз
+    при загрузке сценария, на ходу разговора JSON уже не читается
+    """
+
+    def __init__(self, step_id, step_type, next_step_id):
+        self.id = step_id
+        self.step_type = step_type
+        self.next_step_id = next_step_id
+
+    def targets(self):
+        """
+        Все шаги, на которые может перейти этот шаг
+        """
+        return [self.next_step_id] if self.next_step_id is not None else []
+
+
+class MessageStep(CompiledStep):
+    def __init__(self, step_id, next_step_id, content):
+        super().__init__(step_id, 'message', next_step_id)
+        self.text = str(content.get('message', ''))
+
+
+class AnswerValidator:
+    """
+    Правила validation_rules вопроса, подготовленные один раз:
+    min_length, max_length, regex (ответ должен совпасть целиком),
+    choices (без учета регистра или по номеру варианта) и error_message
+    """
+
+    RULES = {'min_length', 'max_length', 'regex', 'choices', 'error_message'}
+
+    def __init__(self, rules):
+        if not isinstance(rules, dict):
+            raise StepConfigError('validation_rules должно быть JSON-объектом')
+        unknown = set(rules) - self.RULES
+        if unknown:
+            raise StepConfigError(f'Неизвестные правила проверки: {", ".join(sorted(unknown))}')
+
+        self.min_length = self._length(rules, 'min_length')
+        self.max_length = self._length(rules, 'max_length')
+        if self.min_length is not None and self.max_length is not None and self.min_length > self.max_length:
+            raise StepConfigError('min_length больше max_length')
+
+        self.pattern = None
+        if rules.get('regex') is not None:
+            try:
+                self.pattern = re.compile(rules['regex'])
+            except (re.error, TypeError) as e:
+                raise StepConfigError(f'Некорректное регулярное выражение regex: {e}')
+
+        self.choices = None
+        choices = rules.get('choices')
+        if choices is not None:
+            if not isinstance(choices, list) or not choices or not all(isinstance(c, str) for c in choices):
+                raise StepConfigError('choices должно быть непустым списком строк')
+            self.choices = {choice.strip().lower(): choice for choice in choices}
+            self.choices.update({str(number): choice for number, choice in enumerate(choices, 1)})
+            self.choices_hint = ', '.join(choices)
+
+        self.error_message = rules.get('error_message')
+        if self.error_message is not None and not isinstance(self.error_message, str):
+            raise StepConfigError('error_message должно быть строкой')
+
+    @staticmethod
+    def _length(rules, name):
+        value = rules.get(name)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+            raise StepConfigError(f'{name} должно быть неотрицательным целым числом')
+        return value
+
+    def clean(self, answer):
+        """
+        (значение, ошибка): значение — ответ или выбранный вариант из choices
+        """
+        answer = answer.strip()
+        error = None
+        if self.min_length is not None and len(answer) < self.min_length:
+            error = f'Ответ слишком короткий: нужно не меньше {self.min_length} символов.'
+        elif self.max_length is not None and len(answer) > self.max_length:
+            error = f'Ответ слишком длинный: нужно не больше {self.max_length} символов.'
+        elif self.pattern is not None and self.pattern.fullmatch(answer) is None:
+            error = 'Ответ не подходит под ожидаемый формат.'
+        elif self.choices is not None:
+            choice = self.choices.get(answer.lower())
+            if choice is None:
+                error = f'Выберите один из вариантов: {self.choices_hint}.'
+            answer = choice
+        if error is not None:
+            return None, self.error_message or error
+        return answer, None
+
+
+class TemplateRenderer:
+    """
+    response_template с полями {user_input} и {<переменная сессии>},
+    разобранный на части один раз; форматирование без str.format,
+    поэтому в шаблоне недоступны атрибуты и индексы
+    """
+
+    def __init__(self, template, name='response_template'):
+        if not isinstance(template, str):
+            raise StepConfigError(f'{name} должно быть строкой')
+        self.parts = []
+        try:
+            parsed = list(string.Formatter().parse(template))
+        except ValueError as e:
+            raise StepConfigError(f'Некорректный {name}: {e}')
+        for literal, field, spec, conversion in parsed:
+            if literal:
+                self.parts.append((True, literal))
+            if field is None:
+                continue
+            if not TEMPLATE_FIELD_RE.match(field) or spec or conversion:
+                raise StepConfigError(
+                    f'{name}: поле {{{field}}} должно быть именем переменной без форматирования'
+                )
+            self.parts.append((False, field))
+
+    def render(self, user_input, variables, escape=str):
+        """
+        escape применяется к подставленным значениям, например quote для URL
+        """
+        return ''.join(
+            value if literal else escape(str(user_input if value == 'user_input' else variables.get(value, '')))
+            for literal, value in self.parts
+        )
+
+
+class QuestionStep(CompiledStep):
+    def __init__(self, step_id, next_step_id, content):
+        super().__init__(step_id, 'question', next_step_id)
+        self.text = str(content.get('question', ''))
+        # Ответ сохраняется в переменную сессии и доступен в условиях
+        self.variable = content.get('variable') or f'step_{step_id}'
+        if not isinstance(self.variable, str):
+            raise StepConfigError('variable должно быть строкой')
+        rules = content.get('validation_rules')
+        self.validator = AnswerValidator(rules) if rules else None
+        template = content.get('response_template')
+        self.renderer = TemplateRenderer(template) if template else None
+
+    def accept(self, answer, variables):
+        """
+        Проверяет ответ; (ответ бота или None, ошибка или None).
+        Принятый ответ записывается в variables.
+        """
+        if self.validator is not None:
+            answer, error = self.validator.clean(answer)
+            if error is not None:
+                return None, error
+        variables[self.variable] = answer
+        reply = self.renderer.render(answer, variables) if self.renderer is not None else None
+        return reply, None
+
+
+class ConditionStep(CompiledStep):
+    """
+    content: {"branches": [{"condition": "<выражение>", "next_step": <id шага>}, ...]}
+    Выбирается первая ветка с истинным условием, иначе — Step.next_step
+    """
+
+    def __init__(self, step_id, next_step_id, content):
+        super().__init__(step_id, 'condition', next_step_id)
+        branches = content.get('branches')
+        if not isinstance(branches, list) or not branches:
+            raise StepConfigError('Условие должно содержать непустой список branches')
+        self.branches = []
+        for number, branch in enumerate(branches, 1):
+            if not isinstance(branch, dict):
+                raise StepConfigError(f'Ветка {number}: ожидается объект с condition и next_step')
+            expression = branch.get('condition')
+            if not isinstance(expression, str):
+                raise StepConfigError(f'Ветка {number}: condition должно быть строкой')
+            target = branch.get('next_step')
+            if target is not None and (isinstance(target, bool) or not isinstance(target, int)):
+                raise StepConfigError(f'Ветка {number}: next_step должно быть id шага или null')
+            try:
+                predicate = compile_condition(expression)
+            except ConditionError as e:
+                raise StepConfigError(f'Ветка {number}: {e}')
+            self.branches.append((predicate, target))
+
+    def choose(self, user_input, variables):
+        for predicate, target in self.branches:
+            if predicate(user_input, variables):
+                return target
+        return self.next_step_id
+
+    def targets(self):
+        targets = [target for _, target in self.branches if target is not None]
+        return targets + super().targets()
+
+
+class ApiCallStep(CompiledStep):
+    """
+    content: {"url": "https://api.example.com/orders/{order_id}", "method": "GET",
+              "params": {...}, "headers": {...}, "json": {...}, "timeout": 5,
+              "cache_ttl": 60, "variable": "order", "result_path": "data.status",
+              "response_template": "Статус заказа: {order}",
+              "on_error": <id шага>, "error_message": "..."}
+
+    В url, строковых значениях params, headers и json подставляются
+    {user_input} и переменные сессии; хост в url задается только буквально
+    и должен входить в API_CALL_ALLOWED_HOSTS; адреса внутренней сети —
+    только из API_CALL_ALLOWED_PRIVATE_NETWORKS.
+    Результат (или его часть по result_path) сохраняется в variable.
+    При ошибке вызова — переход на on_error, если он задан, иначе на next_step.
+    """
+
+    def __init__(self, step_id, next_step_id, content):
+        super().__init__(step_id, 'api_call', next_step_id)
+        url = content.get('url')
+        if not isinstance(url, str) or not url:
+            raise StepConfigError('url обязателен')
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc or '{' in parts.netloc:
+            raise StepConfigError('url должен начинаться с http:// или https:// и хоста без переменных')
+        host = parts.hostname or ''
+        if not validate_host(host, settings.API_CALL_ALLOWED_HOSTS):
+            raise StepConfigError(f'Хост {host} не входит в API_CALL_ALLOWED_HOSTS')
+        if is_ip_literal(host) and not is_allowed_address(host):
+            raise StepConfigError(f'Запросы к {host} запрещены: адрес во внутренней сети')
+        self.url = TemplateRenderer(url, 'url')
+
+        self.method = str(content.get('method', 'GET')).upper()
+        if self.method not in API_CALL_METHODS:
+            raise StepConfigError(f'Метод должен быть одним из: {", ".join(sorted(API_CALL_METHODS))}')
+
+        self.params = self._templates(content, 'params')
+        self.headers = self._templates(content, 'headers')
+        self.body = self._templates(content, 'json')
+        if self.body is not None and self.method == 'GET':
+            raise StepConfigError('GET-запрос не может содержать json')
+
+        self.timeout = content.get('timeout', settings.API_CALL_TIMEOUT)
+        if isinstance(self.timeout, bool) or not isinstance(self.timeout, (int, float)) \
+                or not 0 < self.timeout <= settings.API_CALL_MAX_TIMEOUT:
+            raise StepConfigError(f'timeout должен быть от 0 до {settings.API_CALL_MAX_TIMEOUT:g} с')
+        self.cache_ttl = content.get('cache_ttl', 0)
+        if isinstance(self.cache_ttl, bool) or not isinstance(self.cache_ttl, (int, float)) or self.cache_ttl < 0:
+            raise StepConfigError('cache_ttl должен быть неотрицательным числом секунд')
+        if self.cache_ttl and self.method != 'GET':
+            raise StepConfigError('Кешируются только GET-запросы')
+
+        self.variable = content.get('variable') or f'step_{step_id}'
+        if not isinstance(self.variable, str):
+            raise StepConfigError('variable должно быть строкой')
+        result_path = content.get('result_path') or ''
+        if not isinstance(result_path, str):
+            raise StepConfigError('result_path должно быть строкой')
+        self.result_path = [
+            int(key) if key.isdigit() else key for key in result_path.split('.') if key
+        ]
+        template = content.get('response_template')
+        self.renderer = TemplateRenderer(template) if template else None
+
+        self.on_error_id = content.get('on_error')
+        if self.on_error_id is not None and (isinstance(self.on_error_id, bool) or not isinstance(self.on_error_id, int)):
+            raise StepConfigError('on_error должно быть id шага или null')
+        self.error_message = content.get('error_message')
+        if self.error_message is not None and not isinstance(self.error_message, str):
+            raise StepConfigError('error_message должно быть строкой')
+
+    @staticmethod
+    def _templates(content, name):
+        value = content.get(name)
+        if value is None:
+            return None
+        if not isinstance(value, dict):
+            raise StepConfigError(f'{name} должно быть JSON-объектом')
+        return {
+            key: TemplateRenderer(item, f'{name}.{key}') if isinstance(item, str) else item
+            for key, item in value.items()
+        }
+
+    @staticmethod
+    def _render(templates, user_input, variables):
+        if templates is None:
+            return None
+        return {
+            key: item.render(user_input, variables) if isinstance(item, TemplateRenderer) else item
+            for key, item in templates.items()
+        }
+
+    def build_request(self, user_input, variables):
+        """
+        Аргументы для ApiCallExecutor.request с подставленными значениями
+        """
+        return {
+            'method': self.method,
+            'url': self.url.render(user_input, variables, escape=lambda value: quote(value, safe='')),
+            'timeout': self.timeout,
+            'params': self._render(self.params, user_input, variables),
+            'headers': self._render(self.headers, user_input, variables),
+            'body': self._render(self.body, user_input, variables),
+            'cache_ttl': self.cache_ttl,
+        }
+
+    def accept(self, result, user_input, variables):
+        """
+        Сохраняет результат вызова в variables; ответ бота или None
+        """
+        for key in self.result_path:
+            try:
+                result = result[key]
+            except (KeyError, IndexError, TypeError):
+                result = None
+                break
+        variables[self.variable] = result
+        return self.renderer.render(user_input, variables) if self.renderer is not None else None
+
+    def targets(self):
+        targets = [self.on_error_id] if self.on_error_id is not None else []
+        return targets + super().targets()
+
+
+STEP_CLASSES = {
+    'message': MessageStep,
+    'question': QuestionStep,
+    'condition': ConditionStep,
+    'api_call': ApiCallStep,
+}
+
+
+def compile_step(step_id, step_type, content, next_step_id):
+    """
+    Компилирует шаг; StepConfigError, если его содержание некорректно
+    """
+    step_class = STEP_CLASSES.get(step_type)
+    if step_class is None:
+        raise StepConfigError(f'Неизвестный тип шага {step_type}')
+    if not isinstance(content, dict):
+        raise StepConfigError('Содержание шага должно быть JSON-объектом')
+    return step_class(step_id, next_step_id, content)
@@ -0,0 +1,89 @@
+# bots/tasks.py
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import metrics
+from .models import BotExecution
+from .services import generate_summary
+
+logger = logging.getLogger(__name__)
+
+# Фоновые задачи выполняются в пуле потоков процесса, вне обработки запроса
+_executor = ThreadPoolExecutor(
+    max_workers=settings.BACKGROUND_WORKERS, thread_name_prefix='background'
+)
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def submit_once(key, func, *args):
+    """
+    Ставит задачу в очередь после коммита транзакции; задача с тем же
+    ключом, пока она ждет в очереди, повторно не ставится
+    """
+    with _pending_lock:
+        if key in _pending:
+            return False
+        _pending.add(key)
+
+    def run():
+        # Изменения, пришедшие во время выполнения, поставят задачу заново
+        with _pending_lock:
+            _pending.discard(key)
+        try:
+            func(*args)
+        finally:
+            connection.close()
+
+    transaction.on_commit(lambda: _executor.submit(run))
+    return True
+
+
+def needs_summary(execution):
+    """
+    Порог: несжатых сообщений больше, чем CHAT_SUMMARY_THRESHOLD
+    """
+    unsummarized = len(execution.conversation_history) - execution.summarized_until
+    return unsummarized > settings.CHAT_SUMMARY_THRESHOLD
+
+
+def schedule_summary(execution):
+    """
+    Ставит сжатие истории выполнения в фоновую очередь, если пора
+    """
+    if not needs_summary(execution):
+        return False
+    return submit_once(('summary', execution.pk), summarize_execution, execution.pk)
+
+
+def summarize_execution(execution_id):
+    """
+    Сворачивает ранние ходы разговора в краткое содержание, оставляя
+    последние CHAT_SUMMARY_KEEP сообщений как есть
+    """
+    try:
+        execution = BotExecution.objects.select_related('bot').get(pk=execution_id)
+        history = execution.conversation_history
+        start = execution.summarized_until
+        end = len(history) - settings.CHAT_SUMMARY_KEEP
+        # Оставшаяся часть должна начинаться с реплики пользователя
+        while 0 < end < len(history) and history[end].get("role") != "user":
+            end += 1
+        if end <= start:
+            return
+
+        from .chat import get_bot_config
+
+        summary = generate_summary(execution.summary, history[start:end], get_bot_config(execution.bot))
+        # Условие на summarized_until защищает от параллельной записи
+        BotExecution.objects.filter(pk=execution_id, summarized_until=start).update(
+            summary=summary, summarized_until=end
+        )
+        metrics.increment('summaries.completed')
+    except Exception:
+        metrics.increment('summaries.failed')
+        logger.exception('Не удалось сжать историю выполнения %s', execution_id)
@@ -7,8 +7,12 @@ router.register(r'bots', views.BotViewSet)
 router.register(r'scenarios', views.ScenarioViewSet)
 router.register(r'steps', views.StepViewSet)
 router.register(r'executions', views.BotExecutionViewSet)
+router.register(r'knowledge', views.KnowledgeDocumentViewSet)
 
 urlpatterns = [
+    path('health/', views.health, name='health'),
+    path('api/metrics/', views.metrics, name='metrics'),
+    path('api/search/', views.search, name='search'),
     path('api/', include(router.urls)),
     #path('api/root/', views.api_root, name='api-root'),
     path('', views.home, name='home'),
@@ -0,0 +1,178 @@
+# bots/usage.py
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from . import metrics, tasks
+from .models import Bot, BotUsageRollup
+
+logger = logging.getLogger(__name__)
+
+FIELDS = (
+    'turns', 'sessions', 'active_sessions', 'daily_active_sessions', 'completions',
+    'tokens', 'provider_calls', 'provider_latency_ms',
+)
+PERIODS = {'hour': TruncHour, 'day': TruncDay}
+
+# Прибавки по (бот, час), еще не записанные в BotUsageRollup
+_pending = defaultdict(Counter)
+_lock = threading.Lock()
+_timer = None
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def add(bot_id, **counts):
+    """
+    Прибавляет счетчики к текущему часу бота. В базу они попадают одной
+    записью на (бот, час) не позже чем через USAGE_FLUSH_INTERVAL секунд
+    """
+    global _timer
+    key = (bot_id, _hour(timezone.now()))
+    with _lock:
+        _pending[key].update(counts)
+        if _timer is None:
+            _timer = threading.Timer(settings.USAGE_FLUSH_INTERVAL, _schedule_flush)
+            _timer.daemon = True
+            _timer.start()
+
+
+def _schedule_flush():
+    global _timer
+    with _lock:
+        _timer = None
+    tasks.submit_once(('usage',), flush)
+
+
+def record_turn(bot_id, tokens, last_activity):
+    """
+    Сохраненный ход разговора; last_activity — время предыдущего хода
+    сессии или None, если сессия новая
+    """
+    now = timezone.now()
+    counts = {'turns': 1, 'tokens': tokens}
+    if last_activity is None:
+        counts.update(sessions=1, active_sessions=1, daily_active_sessions=1)
+    else:
+        if last_activity < _hour(now):
+            counts['active_sessions'] = 1
+        if timezone.localdate(last_activity) != timezone.localdate(now):
+            counts['daily_active_sessions'] = 1
+    add(bot_id, **counts)
+
+
+def record_provider_call(bot_id, seconds):
+    add(bot_id, provider_calls=1, provider_latency_ms=int(seconds * 1000))
+
+
+def record_completion(bot_id):
+    add(bot_id, completions=1)
+
+
+def flush():
+    """
+    Записывает накопленные прибавки: UPDATE ... SET turns = turns + N,
+    а для нового часа — INSERT. При ошибке прибавки возвращаются в очередь
+    """
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return 0
+    try:
+        with transaction.atomic():
+            for (bot_id, hour), counts in pending.items():
+                _apply(bot_id, hour, counts)
+    except Exception:
+        logger.exception('Не удалось записать статистику использования ботов')
+        metrics.increment('usage.flush_failed')
+        with _lock:
+            for key, counts in pending.items():
+                _pending[key].update(counts)
+        return 0
+    metrics.increment('usage.flushed_rows', len(pending))
+    return len(pending)
+
+
+def _apply(bot_id, hour, counts):
+    changes = {field: F(field) + value for field, value in counts.items() if value}
+    if not changes:
+        return
+    rows = BotUsageRollup.objects.filter(bot_id=bot_id, hour=hour)
+    if rows.update(**changes):
+        return
+    # Внешние ключи SQLite проверяются при коммите: прибавки удаленного
+    # бота отбрасываются заранее, чтобы не откатить всю запись
+    if not Bot.objects.filter(pk=bot_id).exists():
+        return
+    try:
+        with transaction.atomic():
+            BotUsageRollup.objects.create(bot_id=bot_id, hour=hour, **counts)
+    except IntegrityError:
+        # Строку этого часа успел создать другой процесс
+        rows.update(**changes)
+
+
+# Остаток счетчиков не теряется при штатной остановке воркера
+atexit.register(flush)
+
+
+def stats(bot_id, period='day', days=30):
+    """
+    Статистика бота за последние days дней по часам или дням (по TIME_ZONE)
+    из BotUsageRollup: время не зависит от объема истории выполнений.
+    Последние USAGE_FLUSH_INTERVAL секунд могут быть еще не учтены.
+    """
+    now = timezone.localtime()
+    since = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    rows = (
+        BotUsageRollup.objects
+        .filter(bot_id=bot_id, hour__gte=since)
+        .annotate(period_start=PERIODS[period]('hour'))
+        .values('period_start')
+        .annotate(**{field: Sum(field) for field in FIELDS})
+        .order_by('period_start')
+    )
+    active_field = 'daily_active_sessions' if period == 'day' else 'active_sessions'
+    series = []
+    totals = Counter()
+    for row in rows:
+        totals.update({field: row[field] for field in FIELDS})
+        series.append({
+            'period_start': row['period_start'],
+            'turns': row['turns'],
+            'sessions': row['sessions'],
+            'active_sessions': row[active_field],
+            'completions': row['completions'],
+            'tokens': row['tokens'],
+            'provider_calls': row['provider_calls'],
+            'avg_provider_latency_ms': _ratio(row['provider_latency_ms'], row['provider_calls']),
+        })
+    return {
+        'period': period,
+        'since': since,
+        'totals': {
+            'turns': totals['turns'],
+            'sessions': totals['sessions'],
+            'completions': totals['completions'],
+            'completion_rate': _ratio(totals['completions'], totals['sessions'], 3),
+            'tokens': totals['tokens'],
+            'provider_calls': totals['provider_calls'],
+            'avg_provider_latency_ms': _ratio(totals['provider_latency_ms'], totals['provider_calls']),
+        },
+        'series': series,
+    }
+
+
+def _ratio(value, total, digits=1):
+    return round(value / total, digits) if total else None
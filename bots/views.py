@@ -1,18 +1,43 @@
 # bots/views.py
+import os
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
-from .models import Bot, Scenario, Step, BotExecution
+from .models import Bot, Scenario, Step, BotExecution, KnowledgeDocument
 from .serializers import (
-    BotSerializer, ScenarioSerializer, StepSerializer,
-    BotExecutionSerializer, ChatSerializer
+    BotSerializer, ScenarioSerializer, ScenarioSnapshotSerializer, StepSerializer,
+    BotExecutionSerializer, ChatSerializer, ChatBatchSerializer, ChatBatchItemSerializer,
+    KnowledgeDocumentSerializer
+)
+from .services import validate_gpt_config, test_gpt_connection
+from .chat import get_bot_config, get_scenario, resume_execution, take_turn, generate_reply, TurnConflict
+from .context import build_context
+from .knowledge import get_index, retrieve
+from .batch import run_batch
+from .export import (
+    ExportError, IgnoreAcceptNegotiation, content_type, export_chunks, filter_executions, for_asgi
+)
+from .conditional import ConditionalGetMixin, conditional_response
+from .graph import validate_graph
+from . import search as full_text, usage, warmup
+from .lean import LeanListMixin
+from .runtime import advance_scenario, publish_scenario
+from .steps import StepConfigError
+from . import metrics as bot_metrics
+from .scheduler import SchedulerBusy
+from .ratelimit import ChatRateThrottle
+from .deadlines import Deadline, DeadlineExceeded, RequestCancelled
+from .idempotency import (
+    IDEMPOTENCY_HEADER, IdempotentRequest, IdempotencyKeyMismatch, IdempotencyInProgress
 )
-from .services import generate_gpt_response, validate_gpt_config, test_gpt_connection
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 
-class BotViewSet(viewsets.ModelViewSet):
+class BotViewSet(ConditionalGetMixin, LeanListMixin, viewsets.ModelViewSet):
     """
     API endpoint для управления ботами
     """
@@ -37,19 +62,48 @@ class BotViewSet(viewsets.ModelViewSet):
         Валидация конфигурации бота (заглушка)
         """
         bot = self.get_object()
-
-        bot_config = {
-            "gpt_model": bot.gpt_model,
-            "temperature": bot.temperature,
-            "max_tokens": bot.max_tokens,
-            "system_prompt": bot.system_prompt,
-            "bot_type": bot.bot_type
-        }
+        bot_config = get_bot_config(bot)
 
         result = validate_gpt_config(bot_config)
         return Response(result)
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['get'], url_path='knowledge/search')
+    def knowledge_search(self, request, pk=None):
+        """
+        Поиск по базе знаний бота: те же фрагменты, что попадают в запрос к модели
+        """
+        bot = self.get_object()
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            return Response({'error': 'Параметр q обязателен'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = min(max(int(request.query_params.get('k', bot.knowledge_top_k or 3)), 1), 50)
+        except ValueError:
+            return Response({'error': 'Параметр k должен быть числом'}, status=status.HTTP_400_BAD_REQUEST)
+
+        index = get_index(bot.pk)
+        return Response({
+            'query': query,
+            'results': index.search(query, k) if index is not None else []
+        })
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Статистика бота по часам или дням (?period=hour|day, ?days=N) из
+        накопительной таблицы BotUsageRollup
+        """
+        bot = self.get_object()
+        period = request.query_params.get('period', 'day')
+        if period not in usage.PERIODS:
+            return Response({'error': 'period должен быть hour или day'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            days = min(max(int(request.query_params.get('days', 30 if period == 'day' else 2)), 1), 366)
+        except ValueError:
+            return Response({'error': 'Параметр days должен быть числом'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'bot': bot.pk, **usage.stats(bot.pk, period, days)})
+
+    @action(detail=True, methods=['post'], throttle_classes=[ChatRateThrottle])
     def chat(self, request, pk=None):
         """
         Чат с ботом (использует заглушку вместо реального GPT)
@@ -65,49 +119,94 @@ class BotViewSet(viewsets.ModelViewSet):
         user_session = serializer.validated_data.get('user_session', 'default_session')
         scenario_id = serializer.validated_data.get('scenario_id')
 
+        # Повтор с тем же Idempotency-Key получает сохраненный ответ
+        try:
+            idempotency = IdempotentRequest.from_request(
+                request, f'chat:{bot.pk}', serializer.validated_data
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if idempotency is not None:
+            try:
+                replay = idempotency.begin()
+            except IdempotencyKeyMismatch:
+                return Response({
+                    'error': f'{IDEMPOTENCY_HEADER} уже использован с другими параметрами запроса'
+                }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            except IdempotencyInProgress:
+                return Response({
+                    'error': f'Запрос с этим {IDEMPOTENCY_HEADER} еще выполняется'
+                }, status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+            if replay is not None:
+                return Response(replay['data'], status=replay['status'],
+                                headers={'Idempotent-Replayed': 'true'})
+
         # Подготавливаем конфигурацию бота
-        bot_config = {
-            "gpt_model": bot.gpt_model,
-            "temperature": bot.temperature,
-            "max_tokens": bot.max_tokens,
-            "system_prompt": bot.system_prompt,
-            "bot_type": bot.bot_type
-        }
+        bot_config = get_bot_config(bot)
 
-        # Подготавливаем историю сообщений
-        messages = [{"role": "user", "content": message}]
+        # Сессии разных пользователей с одинаковым user_session не пересекаются
+        execution = resume_execution(bot, request.user, user_session, get_scenario(bot, scenario_id))
 
-        # Получаем ответ от ЗАГЛУШКИ
-        try:
-            bot_response = generate_gpt_response(messages, bot_config)
-
-            # Сохраняем выполнение
-            execution = BotExecution.objects.create(
-                bot=bot,
-                user_session=user_session,
-                current_step=None,
-                conversation_history=f"Пользователь: {message}\nБот: {bot_response}",
-                is_completed=False
-            )
+        # Дедлайн ответа; на ASGI запрос отменяется при отключении клиента
+        deadline = Deadline.from_request(request)
 
-            # Если указан сценарий, связываем с выполнением
-            if scenario_id:
-                try:
-                    scenario = Scenario.objects.get(id=scenario_id, bot=bot)
-                    execution.scenario = scenario
-                    execution.save()
-                except Scenario.DoesNotExist:
-                    pass
+        def respond(execution):
+            # Сначала шаги сценария; когда сценария нет или он пройден,
+            # отвечает ЗАГЛУШКА: ей уходит системный промпт и последние
+            # ходы, которые помещаются в контекст
+            bot_response = advance_scenario(execution, message, deadline)
+            if bot_response is None:
+                messages = build_context(execution, bot_config, message, retrieve(bot, message))
+                bot_response = generate_reply(bot, messages, bot_config, deadline)
+            return bot_response
 
-            return Response({
+        try:
+            # Ход сохраняется в историю выполнения только после ответа
+            bot_response = take_turn(execution, message, respond)
+
+            data = {
                 'success': True,
                 'response': bot_response,
                 'execution_id': execution.id,
                 'bot_name': bot.name,
                 'demo_mode': True  # Указываем, что работает в демо-режиме
-            })
+            }
+            if idempotency is not None:
+                idempotency.complete(status.HTTP_200_OK, data)
+            return Response(data)
+
+        except (DeadlineExceeded, RequestCancelled) as e:
+            if idempotency is not None:
+                idempotency.release()
+            # 499 — принятый в nginx код для запроса, закрытого клиентом
+            return Response({
+                'success': False,
+                'error': str(e),
+                'demo_mode': True
+            }, status=499 if isinstance(e, RequestCancelled) else status.HTTP_504_GATEWAY_TIMEOUT)
+
+        except SchedulerBusy as e:
+            if idempotency is not None:
+                idempotency.release()
+            return Response({
+                'success': False,
+                'error': str(e),
+                'demo_mode': True
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(e.retry_after)})
+
+        except TurnConflict as e:
+            if idempotency is not None:
+                idempotency.release()
+            return Response({
+                'success': False,
+                'error': str(e),
+                'demo_mode': True
+            }, status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
 
         except Exception as e:
+            if idempotency is not None:
+                idempotency.release()
             return Response({
                 'success': False,
                 'error': f'Ошибка при генерации ответа: {str(e)}',
@@ -115,7 +214,39 @@ class BotViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class ScenarioViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], url_path='chat/batch')
+    def chat_batch(self, request):
+        """
+        Сообщения многих сессий (и ботов) одним запросом: ответы
+        генерируются параллельно, у каждого элемента свой результат
+        """
+        serializer = ChatBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        raw_items = serializer.validated_data['items']
+        items, positions, results = [], [], [None] * len(raw_items)
+        for index, raw in enumerate(raw_items):
+            item = ChatBatchItemSerializer(data=raw)
+            if item.is_valid():
+                items.append(item.validated_data)
+                positions.append(index)
+            else:
+                results[index] = {'success': False, 'status': 400, 'error': item.errors}
+
+        if items:
+            for index, result in zip(positions, run_batch(items, request.user, Deadline.from_request(request))):
+                results[index] = result
+
+        return Response({
+            'results': results,
+            'succeeded': sum(1 for result in results if result['success']),
+            'failed': sum(1 for result in results if not result['success']),
+            'demo_mode': True
+        })
+
+
+class ScenarioViewSet(ConditionalGetMixin, LeanListMixin, viewsets.ModelViewSet):
     """
     API endpoint для управления сценариями
     """
@@ -135,15 +266,63 @@ class ScenarioViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def steps(self, request, pk=None):
         """
-        Получение шагов сценария
+        Получение шагов сценария; версия ответа — ревизия шагов сценария
+        """
+        def render():
+            scenario = self.get_object()
+            steps = scenario.steps.all().order_by('order')
+            return self.lean_response(steps, StepSerializer, paginate=False)
+
+        try:
+            version = self.get_queryset().filter(pk=pk).values_list('revision', 'updated_at').first()
+        except (TypeError, ValueError):
+            version = None
+        if version is None:
+            return render()
+        return conditional_response(request, version, version[1], render)
+
+    @action(detail=True, methods=['get'])
+    def validate(self, request, pk=None):
+        """
+        Проверка графа шагов: циклы без вопросов, переходы в другие
+        сценарии, недостижимые шаги. Ошибки не дают опубликовать сценарий.
+        """
+        scenario = self.get_object()
+        problems = validate_graph(scenario.initial_step_id, Step.load_graph(scenario.pk))
+        errors = [problem for problem in problems if problem['level'] == 'error']
+        return Response({
+            'valid': not errors,
+            'errors': errors,
+            'warnings': [problem for problem in problems if problem['level'] == 'warning'],
+        })
+
+    @action(detail=True, methods=['post'])
+    def publish(self, request, pk=None):
+        """
+        Публикация сценария: шаги замораживаются в новую версию, которую
+        проходят новые сессии; уже начатые остаются на своей версии
+        """
+        scenario = self.get_object()
+        try:
+            snapshot, created = publish_scenario(scenario, request.user)
+        except StepConfigError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            ScenarioSnapshotSerializer(snapshot).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    @action(detail=True, methods=['get'])
+    def versions(self, request, pk=None):
+        """
+        Опубликованные версии сценария, новые первыми
         """
         scenario = self.get_object()
-        steps = scenario.steps.all().order_by('order')
-        serializer = StepSerializer(steps, many=True)
-        return Response(serializer.data)
+        snapshots = scenario.snapshots.order_by('-version')
+        return Response(ScenarioSnapshotSerializer(snapshots, many=True).data)
 
 
-class StepViewSet(viewsets.ModelViewSet):
+class StepViewSet(ConditionalGetMixin, LeanListMixin, viewsets.ModelViewSet):
     """
     API endpoint для управления шагами сценариев
     """
@@ -161,7 +340,25 @@ class StepViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class BotExecutionViewSet(viewsets.ModelViewSet):
+class KnowledgeDocumentViewSet(LeanListMixin, viewsets.ModelViewSet):
+    """
+    API endpoint для документов базы знаний ботов
+    """
+    queryset = KnowledgeDocument.objects.all().order_by('-created_at')
+    serializer_class = KnowledgeDocumentSerializer
+
+    def get_queryset(self):
+        """
+        Опционально фильтруем документы по bot_id
+        """
+        queryset = KnowledgeDocument.objects.all()
+        bot_id = self.request.query_params.get('bot_id')
+        if bot_id is not None:
+            queryset = queryset.filter(bot_id=bot_id)
+        return queryset
+
+
+class BotExecutionViewSet(LeanListMixin, viewsets.ModelViewSet):
     """
     API endpoint для просмотра истории выполнений
     """
@@ -183,6 +380,94 @@ class BotExecutionViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    @action(detail=False, methods=['get'], content_negotiation_class=IgnoreAcceptNegotiation)
+    def export(self, request):
+        """
+        Потоковая выгрузка выполнений для аналитики:
+        ?output=ndjson|csv, ?gzip=1, ?fields=, фильтры bot_id, user_session,
+        created_after, created_before
+        """
+        params = request.query_params
+        output = params.get('output', 'ndjson')
+        compress = params.get('gzip') in ('1', 'true')
+        try:
+            queryset = filter_executions(
+                bot_id=params.get('bot_id'),
+                user_session=params.get('user_session'),
+                created_after=params.get('created_after'),
+                created_before=params.get('created_before'),
+            )
+            chunks = export_chunks(queryset, output, params.get('fields'), compress)
+        except ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        media_type, filename = content_type(output, compress)
+        response = StreamingHttpResponse(
+            for_asgi(chunks) if isinstance(request._request, ASGIRequest) else chunks,
+            content_type=media_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Cache-Control'] = 'no-store'
+        # nginx отдает части сразу, не собирая выгрузку в буфере
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+@api_view(['GET'])
+def search(request):
+    """
+    Полнотекстовый поиск по сообщениям разговоров и шагам сценариев:
+    ?q=, ?scope=turns|steps (по умолчанию оба), ?bot_id=, ?scenario_id=, ?limit=
+    """
+    query = request.query_params.get('q', '').strip()
+    scope = request.query_params.get('scope')
+    if not query:
+        return Response({'error': 'Укажите строку поиска в параметре q'}, status=status.HTTP_400_BAD_REQUEST)
+    if scope not in (None, 'turns', 'steps'):
+        return Response({'error': 'scope должен быть turns или steps'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        bot_id = int(request.query_params.get('bot_id') or 0) or None
+        scenario_id = int(request.query_params.get('scenario_id') or 0) or None
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+    except ValueError:
+        return Response({'error': 'bot_id, scenario_id и limit должны быть числами'}, status=status.HTTP_400_BAD_REQUEST)
+
+    result = {'query': query}
+    if scope in (None, 'turns'):
+        result['turns'] = full_text.search_turns(query, bot_id=bot_id, limit=limit)
+    if scope in (None, 'steps'):
+        result['steps'] = full_text.search_steps(query, bot_id=bot_id, scenario_id=scenario_id, limit=limit)
+    return Response(result)
+
+
+def health(request):
+    """
+    Готовность воркера для nginx и docker: 503, пока идет прогрев или
+    недоступна база, затем 200. Без авторизации и без DRF.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        database = True
+    except Exception:
+        database = False
+    ready = warmup.is_ready() and database
+    return JsonResponse({
+        'status': 'ready' if ready else warmup.state['status'] if database else 'database_unavailable',
+        'pid': os.getpid(),
+        'database': database,
+        'warmup': warmup.state,
+        'startup': warmup.startup_timings(),
+    }, status=200 if ready else 503)
+
+
+@api_view(['GET'])
+def metrics(request):
+    """
+    Счетчики текущего процесса: кеш, объединенные вызовы, очереди планировщика
+    """
+    return Response(bot_metrics.snapshot())
+
 
 @api_view(['GET'])
 def api_root(request):
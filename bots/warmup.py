@@ -0,0 +1,146 @@
+# bots/warmup.py
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .intents import get_classifier
+from .knowledge import get_index
+from .models import Bot, Scenario
+from .runtime import load_scenario, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Отметки времени запуска процесса (time.perf_counter())
+_marks = {}
+_lock = threading.Lock()
+state = {
+    'status': 'starting',
+    'bots': 0,
+    'scenarios': 0,
+    'knowledge_indexes': 0,
+    'skipped_bots': 0,
+    'budget_exhausted': False,
+    'errors': 0,
+}
+
+
+def mark(name):
+    """
+    Отметка этапа запуска: boot — начало импорта приложения,
+    apps_ready — конец AppConfig.ready()
+    """
+    _marks.setdefault(name, time.perf_counter())
+
+
+def is_ready():
+    return state['status'] == 'ready'
+
+
+def startup_timings():
+    """
+    Длительность этапов запуска воркера в миллисекундах
+    """
+    boot = _marks.get('boot')
+    if boot is None:
+        return {}
+    return {
+        f'{name}_ms': round((moment - boot) * 1000)
+        for name, moment in sorted(_marks.items(), key=lambda item: item[1])
+        if name != 'boot'
+    }
+
+
+def start(boot_started=None):
+    """
+    Прогрев после загрузки приложения, до первых запросов: воркер
+    gunicorn начинает принимать соединения, только когда он закончен.
+    Если модуль приложения загружается внутри работающего цикла событий
+    (uvicorn без gunicorn), прогрев идет в отдельном потоке, а /health/
+    до его окончания отвечает 503. boot_started — time.perf_counter()
+    в начале загрузки модуля приложения.
+    """
+    if boot_started is not None:
+        _marks.setdefault('boot', boot_started)
+    mark('application')
+    if not settings.WARMUP_ON_START:
+        _finish()
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        warm_up()
+    else:
+        threading.Thread(target=warm_up, name='warmup', daemon=True).start()
+
+
+def warm_up(budget=None):
+    """
+    Загружает в кеши процесса то, что иначе строится на первых чатах:
+    скомпилированные сценарии (опубликованные версии и черновики) и
+    индексы базы знаний активных ботов. Боты идут от самых нагруженных
+    за последние сутки; по истечении WARMUP_BUDGET секунд прогрев
+    останавливается, остальное загрузится при первом обращении.
+    """
+    with _lock:
+        if state['status'] in ('warming', 'ready'):
+            return
+        state['status'] = 'warming'
+    budget = settings.WARMUP_BUDGET if budget is None else budget
+    started = time.perf_counter()
+    try:
+        get_classifier()
+        since = timezone.now() - timedelta(days=1)
+        bots = list(
+            Bot.objects.filter(is_active=True)
+            .annotate(recent_turns=Sum('usage__turns', filter=Q(usage__hour__gte=since)))
+            .order_by(F('recent_turns').desc(nulls_last=True), '-updated_at')
+            .values_list('pk', flat=True)
+        )
+        scenarios = {}
+        for scenario_id, bot_id, version in (
+            Scenario.objects.filter(bot_id__in=bots, is_active=True)
+            .values_list('pk', 'bot_id', 'published_version')
+        ):
+            scenarios.setdefault(bot_id, []).append((scenario_id, version))
+
+        for position, bot_id in enumerate(bots):
+            if time.perf_counter() - started > budget:
+                state['budget_exhausted'] = True
+                state['skipped_bots'] = len(bots) - position
+                break
+            for scenario_id, version in scenarios.get(bot_id, ()):
+                try:
+                    if version is not None:
+                        load_snapshot(scenario_id, version)
+                    else:
+                        load_scenario(scenario_id)
+                    state['scenarios'] += 1
+                except Exception:
+                    state['errors'] += 1
+                    logger.exception('Прогрев: сценарий %s не загружен', scenario_id)
+            if get_index(bot_id) is not None:
+                state['knowledge_indexes'] += 1
+            state['bots'] += 1
+    except Exception:
+        state['errors'] += 1
+        logger.exception('Прогрев воркера прерван')
+    finally:
+        connection.close()
+        _finish()
+
+
+def _finish():
+    mark('ready')
+    state['status'] = 'ready'
+    logger.info(
+        'Воркер %s готов: %s, прогрето ботов %s, сценариев %s',
+        os.getpid(), startup_timings(), state['bots'], state['scenarios']
+    )